@@ -1,16 +1,40 @@
-from flask import Flask, request, jsonify, session, render_template
+from flask import Flask, request, jsonify, session, render_template, g, has_request_context
 from flask_cors import CORS
 import sqlite3
 import hashlib
 import secrets
 from datetime import datetime, timedelta
-import cv2
-import numpy as np
-from ultralytics import YOLO
-import base64
 import json
+import math
 import os
+import atexit
+import logging
+import threading
+from contextlib import nullcontext
 from functools import wraps
+from inference import BatchInferenceScheduler, QueueFull, FrameDropped, FrameTooLarge
+from journal import WriteBehindJournal
+from db import ConnectionPool
+from cache import DashboardCache
+from suggestions import SuggestionEngine
+from migrations import migrate
+from startup import StartupTracker
+from metrics import MetricsRegistry, RequestTimer, query_label
+from serving import BoundedExecutor, ExecutorSaturated, AdmissionController, AdmissionRejected
+from tracking import MultiObjectTracker
+from rollups import parse_range, bucket_starts
+from export import EXPORT_COLUMNS, FORMATS, export_chunks, parquet_available, parse_bounds
+from retention import RetentionWorker
+from taxonomy import FoodTaxonomy
+from frame_store import FrameStore
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+# Startup phases are timed from here; heavy imports happen later in warm_up()
+startup = StartupTracker()
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
@@ -27,114 +51,528 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 
-# Initialize YOLO model
-try:
-    model = YOLO('yolov8n.pt')
-    print("YOLO model loaded successfully!")
-except Exception as e:
-    print(f"Warning: YOLO model not loaded - {e}")
-    model = None
+# Frame upload configuration
+app.config['MAX_FRAME_BYTES'] = int(os.environ.get('AIBSFMS_MAX_FRAME_BYTES', 8 * 1024 * 1024))
 
-# Database initialization
-def init_db():
-    conn = sqlite3.connect('aibsfms.db')
-    cursor = conn.cursor()
+# Scene-change gate configuration
+app.config['SCENE_GATE_ENABLED'] = os.environ.get('AIBSFMS_SCENE_GATE_ENABLED', '1') == '1'
+app.config['SCENE_GATE_THRESHOLD'] = float(os.environ.get('AIBSFMS_SCENE_GATE_THRESHOLD', 4.0))
+app.config['SCENE_GATE_MAX_SKIPS'] = int(os.environ.get('AIBSFMS_SCENE_GATE_MAX_SKIPS', 30))
+
+# Write-behind journal configuration
+app.config['JOURNAL_FLUSH_INTERVAL_MS'] = float(os.environ.get('AIBSFMS_JOURNAL_FLUSH_INTERVAL_MS', 200))
+app.config['JOURNAL_BATCH_SIZE'] = int(os.environ.get('AIBSFMS_JOURNAL_BATCH_SIZE', 500))
+app.config['JOURNAL_MAX_QUEUE'] = int(os.environ.get('AIBSFMS_JOURNAL_MAX_QUEUE', 10000))
+app.config['JOURNAL_DURABILITY'] = os.environ.get('AIBSFMS_JOURNAL_DURABILITY', 'normal')
+app.config['JOURNAL_MAX_RETRIES'] = int(os.environ.get('AIBSFMS_JOURNAL_MAX_RETRIES', 5))
+app.config['JOURNAL_RETRY_BACKOFF_MS'] = float(os.environ.get('AIBSFMS_JOURNAL_RETRY_BACKOFF_MS', 100))
+
+# Dashboard cache configuration
+app.config['DASHBOARD_CACHE_MAX_ENTRIES'] = int(os.environ.get('AIBSFMS_DASHBOARD_CACHE_MAX_ENTRIES', 1024))
+app.config['DASHBOARD_CACHE_TTL_S'] = float(os.environ.get('AIBSFMS_DASHBOARD_CACHE_TTL_S', 30))
+
+# Per-request timing log (one JSON line per request on the 'aibsfms.timing' logger)
+app.config['TIMING_LOG'] = os.environ.get('AIBSFMS_TIMING_LOG', '0') == '1'
+
+# Serving mode: 'async' runs frame inference and dashboard/session queries on bounded executors,
+# so saturated heavy routes are rejected quickly instead of holding every server thread
+app.config['SERVING_MODE'] = os.environ.get('AIBSFMS_SERVING_MODE', 'sync')
+app.config['FRAME_EXECUTOR_WORKERS'] = int(os.environ.get('AIBSFMS_FRAME_EXECUTOR_WORKERS', 8))
+app.config['FRAME_EXECUTOR_QUEUE'] = int(os.environ.get('AIBSFMS_FRAME_EXECUTOR_QUEUE', 16))
+app.config['DB_EXECUTOR_WORKERS'] = int(os.environ.get('AIBSFMS_DB_EXECUTOR_WORKERS', 4))
+app.config['DB_EXECUTOR_QUEUE'] = int(os.environ.get('AIBSFMS_DB_EXECUTOR_QUEUE', 32))
+app.config['EXECUTOR_RETRY_AFTER_S'] = int(os.environ.get('AIBSFMS_EXECUTOR_RETRY_AFTER_S', 1))
+
+# Video ingestion configuration: clips are read from VIDEO_DIR on the server
+app.config['VIDEO_DIR'] = os.environ.get('AIBSFMS_VIDEO_DIR', 'videos')
+app.config['VIDEO_MAX_JOBS'] = int(os.environ.get('AIBSFMS_VIDEO_MAX_JOBS', 2))
+app.config['VIDEO_SAMPLE_FPS'] = float(os.environ.get('AIBSFMS_VIDEO_SAMPLE_FPS', 2))
+app.config['VIDEO_MAX_GAP_S'] = float(os.environ.get('AIBSFMS_VIDEO_MAX_GAP_S', 10))
+
+# Bulk exports stream from the database page by page; at most EXPORT_MAX_JOBS run at once
+app.config['EXPORT_MAX_JOBS'] = int(os.environ.get('AIBSFMS_EXPORT_MAX_JOBS', 2))
+app.config['EXPORT_PAGE_SIZE'] = int(os.environ.get('AIBSFMS_EXPORT_PAGE_SIZE', 5000))
+
+# Retention: rows older than these ages move to Parquet files under ARCHIVE_DIR (0 keeps them forever).
+# Opt-in: session details and the dashboard only read SQLite, so archived rows leave the UI
+app.config['RETENTION_ENABLED'] = os.environ.get('AIBSFMS_RETENTION_ENABLED', '0') == '1'
+app.config['ARCHIVE_DIR'] = os.environ.get('AIBSFMS_ARCHIVE_DIR', 'archive')
+app.config['RETENTION_DETECTIONS_DAYS'] = int(os.environ.get('AIBSFMS_RETENTION_DETECTIONS_DAYS', 180))
+app.config['RETENTION_SUGGESTIONS_DAYS'] = int(os.environ.get('AIBSFMS_RETENTION_SUGGESTIONS_DAYS', 90))
+app.config['RETENTION_INTERVAL_S'] = float(os.environ.get('AIBSFMS_RETENTION_INTERVAL_S', 3600))
+app.config['RETENTION_BATCH_SIZE'] = int(os.environ.get('AIBSFMS_RETENTION_BATCH_SIZE', 20000))
+app.config['VACUUM_STEP_PAGES'] = int(os.environ.get('AIBSFMS_VACUUM_STEP_PAGES', 256))
+
+# Frames with food in them are kept under FRAME_DIR for auditing (thumbnail side and quality 0: store as sent)
+app.config['FRAME_STORE_ENABLED'] = os.environ.get('AIBSFMS_FRAME_STORE_ENABLED', '1') == '1'
+app.config['FRAME_DIR'] = os.environ.get('AIBSFMS_FRAME_DIR', 'frames')
+app.config['FRAME_STORE_MAX_MB'] = int(os.environ.get('AIBSFMS_FRAME_STORE_MAX_MB', 2048))
+app.config['FRAME_STORE_WORKERS'] = int(os.environ.get('AIBSFMS_FRAME_STORE_WORKERS', 2))
+app.config['FRAME_STORE_QUEUE'] = int(os.environ.get('AIBSFMS_FRAME_STORE_QUEUE', 64))
+app.config['FRAME_STORE_THUMBNAIL_SIDE'] = int(os.environ.get('AIBSFMS_FRAME_STORE_THUMBNAIL_SIDE', 0))
+app.config['FRAME_STORE_JPEG_QUALITY'] = int(os.environ.get('AIBSFMS_FRAME_STORE_JPEG_QUALITY', 0))
+
+# Cross-frame tracking: one food_detections row per tracked item instead of one per box per frame
+app.config['TRACKING_ENABLED'] = os.environ.get('AIBSFMS_TRACKING_ENABLED', '1') == '1'
+app.config['TRACK_IOU_THRESHOLD'] = float(os.environ.get('AIBSFMS_TRACK_IOU_THRESHOLD', 0.3))
+app.config['TRACK_LOW_CONF'] = float(os.environ.get('AIBSFMS_TRACK_LOW_CONF', 0.25))
+app.config['TRACK_MAX_AGE_S'] = float(os.environ.get('AIBSFMS_TRACK_MAX_AGE_S', 2.0))
+app.config['TRACK_MIN_FRAMES'] = int(os.environ.get('AIBSFMS_TRACK_MIN_FRAMES', 3))
+
+# Food taxonomy: the model classes that are food, their item names, categories and thresholds
+app.config['FOOD_TAXONOMY'] = os.environ.get('AIBSFMS_FOOD_TAXONOMY')  # JSON file; built-in COCO classes if unset
+
+# Suggestion engine configuration
+app.config['SUGGESTION_MIN_INTERVAL_S'] = float(os.environ.get('AIBSFMS_SUGGESTION_MIN_INTERVAL_S', 60))
+app.config['SUGGESTION_MAX_PER_FRAME'] = int(os.environ.get('AIBSFMS_SUGGESTION_MAX_PER_FRAME', 2))
+
+# WebSocket frame channel (optional, requires flask-sock)
+sock = Sock(app) if Sock else None
+if not sock:
+    print("Warning: flask-sock not installed - /api/tracking/stream disabled")
+
+# Database configuration
+app.config['DATABASE'] = os.environ.get('AIBSFMS_DB_PATH', 'aibsfms.db')
+app.config['DB_SYNCHRONOUS'] = os.environ.get('AIBSFMS_DB_SYNCHRONOUS', 'NORMAL')
+app.config['DB_BUSY_TIMEOUT_MS'] = int(os.environ.get('AIBSFMS_DB_BUSY_TIMEOUT_MS', 5000))
+app.config['DB_MMAP_SIZE'] = int(os.environ.get('AIBSFMS_DB_MMAP_SIZE', 256 * 1024 * 1024))
+app.config['DB_CACHE_SIZE_KB'] = int(os.environ.get('AIBSFMS_DB_CACHE_SIZE_KB', 20000))
+app.config['DB_POOL_MAX_IDLE'] = int(os.environ.get('AIBSFMS_DB_POOL_MAX_IDLE', 16))
+
+# Inference configuration
+app.config['MODEL_PATH'] = os.environ.get('AIBSFMS_MODEL_PATH', 'yolov8n.pt')
+app.config['INFERENCE_BACKEND'] = os.environ.get('AIBSFMS_INFERENCE_BACKEND', 'torch')
+app.config['INFERENCE_IMGSZ'] = int(os.environ.get('AIBSFMS_INFERENCE_IMGSZ', 640))
+app.config['INFERENCE_WORKERS'] = int(os.environ.get('AIBSFMS_INFERENCE_WORKERS', 0))
+app.config['INFERENCE_WORKER_CPUS'] = os.environ.get('AIBSFMS_INFERENCE_WORKER_CPUS', '')
+app.config['INFERENCE_SLOT_BYTES'] = int(os.environ.get('AIBSFMS_INFERENCE_SLOT_BYTES', 1920 * 1080 * 3))
+app.config['INFERENCE_MAX_BATCH'] = int(os.environ.get('AIBSFMS_INFERENCE_MAX_BATCH', 8))
+app.config['INFERENCE_MAX_WAIT_MS'] = float(os.environ.get('AIBSFMS_INFERENCE_MAX_WAIT_MS', 10))
+app.config['INFERENCE_TIMEOUT_S'] = float(os.environ.get('AIBSFMS_INFERENCE_TIMEOUT_S', 30))
+
+# Admission control for camera frames: bounded inference queue, in-flight limits per user and
+# session, and frames older than FRAME_MAX_AGE_MS (or replaced by a newer one) are dropped
+app.config['FRAME_QUEUE_MAX'] = int(os.environ.get('AIBSFMS_FRAME_QUEUE_MAX', 32))
+app.config['FRAME_MAX_AGE_MS'] = float(os.environ.get('AIBSFMS_FRAME_MAX_AGE_MS', 2000))
+app.config['FRAME_MAX_PER_USER'] = int(os.environ.get('AIBSFMS_FRAME_MAX_PER_USER', 4))
+app.config['FRAME_MAX_PER_SESSION'] = int(os.environ.get('AIBSFMS_FRAME_MAX_PER_SESSION', 2))
+
+# Preprocessing: reduced-resolution decode, per-session ROI crop and letterboxing before inference,
+# plus the capture size and JPEG quality suggested to the client
+app.config['PREPROCESS_ENABLED'] = os.environ.get('AIBSFMS_PREPROCESS_ENABLED', '1') == '1'
+app.config['CAPTURE_JPEG_QUALITY'] = float(os.environ.get('AIBSFMS_CAPTURE_JPEG_QUALITY', 0.7))
+app.config['CAPTURE_MAX_SIDE'] = int(os.environ.get('AIBSFMS_CAPTURE_MAX_SIDE', 1920))
+
+# Warm-up configuration: frame requests wait up to WARMUP_WAIT_S for the model, then get a 503
+app.config['WARMUP_WAIT_S'] = float(os.environ.get('AIBSFMS_WARMUP_WAIT_S', 0))
+app.config['WARMUP_TIMEOUT_S'] = float(os.environ.get('AIBSFMS_WARMUP_TIMEOUT_S', 300))
+app.config['WARMUP_RETRY_AFTER_S'] = int(os.environ.get('AIBSFMS_WARMUP_RETRY_AFTER_S', 5))
+
+# Parsed now so a broken taxonomy file fails at startup; matched to the model's classes in warm_up()
+food_taxonomy = FoodTaxonomy.load(app.config['FOOD_TAXONOMY'])
+
+# Model, frame codecs and inference scheduler are set up by warm_up() in the background
+worker_pool = None
+food_classes = None
+predict = None
+inference_scheduler = None
+scene_gate = None
+preprocessor = None
+video_preprocessor = None
+frame_from_request = decode_jpeg = decode_data_url = None
+
+def warm_up():
+    """Import the heavy libraries, load YOLO and run one dummy inference"""
+    global worker_pool, predict, inference_scheduler, scene_gate, preprocessor, video_preprocessor, food_classes
+    global frame_from_request, decode_jpeg, decode_data_url
     
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    with startup.phase('imports'):
+        import numpy as np
+        from frames import frame_from_request, decode_jpeg, decode_data_url, SceneChangeGate
+        from preprocess import FramePreprocessor
     
-    # User profiles table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_profiles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            age INTEGER,
-            weight REAL,
-            height REAL,
-            dietary_preference TEXT,
-            goals TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
+    # Only food classes reach NMS; the model's floor leaves room for the tracker's low-confidence stage
+    conf_floor = food_taxonomy.min_threshold
+    if app.config['TRACKING_ENABLED']:
+        conf_floor = min(conf_floor, app.config['TRACK_LOW_CONF'])
     
-    # Tracking sessions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tracking_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            tracking_mode TEXT NOT NULL,
-            start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            end_time TIMESTAMP,
-            status TEXT DEFAULT 'active',
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
+    # Initialize YOLO model, in this process or in a pool of worker processes
+    with startup.phase('model_load'):
+        if app.config['INFERENCE_WORKERS'] > 0:
+            from inference_pool import InferenceWorkerPool, parse_cpu_sets
+            worker_pool = InferenceWorkerPool(
+                app.config['MODEL_PATH'],
+                workers=app.config['INFERENCE_WORKERS'],
+                cpu_sets=parse_cpu_sets(app.config['INFERENCE_WORKER_CPUS'], app.config['INFERENCE_WORKERS']),
+                slots_per_worker=app.config['INFERENCE_MAX_BATCH'] * 2,
+                max_frame_bytes=app.config['INFERENCE_SLOT_BYTES'],
+                task_timeout=app.config['INFERENCE_TIMEOUT_S'],
+                backend=app.config['INFERENCE_BACKEND'],
+                imgsz=app.config['INFERENCE_IMGSZ'],
+                taxonomy=food_taxonomy,
+                conf=conf_floor
+            )
+            atexit.register(worker_pool.close)
+            if not worker_pool.wait_ready(timeout=app.config['WARMUP_TIMEOUT_S']):
+                raise RuntimeError('No inference worker became ready')
+            warm_predict = worker_pool.predict
+            names = worker_pool.names
+            print(f"Started {worker_pool.size} YOLO inference workers ({app.config['INFERENCE_BACKEND']})")
+        else:
+            from inference_backends import load_backend
+            warm_predict, names = load_backend(app.config['INFERENCE_BACKEND'], app.config['MODEL_PATH'],
+                                               imgsz=app.config['INFERENCE_IMGSZ'], taxonomy=food_taxonomy,
+                                               conf=conf_floor)
+            print(f"YOLO model loaded successfully! ({app.config['INFERENCE_BACKEND']})")
     
-    # Food items detected table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS food_detections (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id INTEGER NOT NULL,
-            item_name TEXT NOT NULL,
-            quantity REAL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            detection_type TEXT,
-            confidence REAL,
-            image_path TEXT,
-            FOREIGN KEY (session_id) REFERENCES tracking_sessions (id)
-        )
-    ''')
+    food_classes = food_taxonomy.resolve(names)
+    if object_tracker:
+        object_tracker.class_thresholds = food_classes.thresholds
+    print(f"Detecting {len(food_classes.class_ids)} food classes of {len(names)}")
     
-    # Waste tracking table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS waste_tracking (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id INTEGER NOT NULL,
-            waste_type TEXT NOT NULL,
-            quantity REAL,
-            suggestions TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (session_id) REFERENCES tracking_sessions (id)
-        )
-    ''')
+    # The first call pays for lazy initialisation inside the model; do it before taking traffic
+    with startup.phase('warmup_inference'):
+        warm_predict([np.zeros((app.config['INFERENCE_IMGSZ'], app.config['INFERENCE_IMGSZ'], 3), dtype=np.uint8)])
     
-    # AI suggestions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ai_suggestions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            session_id INTEGER,
-            suggestion_text TEXT NOT NULL,
-            category TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (session_id) REFERENCES tracking_sessions (id)
+    # Batch frames from concurrent requests into a single model call
+    inference_scheduler = BatchInferenceScheduler(
+        warm_predict,
+        max_batch=app.config['INFERENCE_MAX_BATCH'],
+        max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS'],
+        concurrency=worker_pool.size if worker_pool else 1,
+        max_queue=app.config['FRAME_QUEUE_MAX'],
+        max_age_ms=app.config['FRAME_MAX_AGE_MS'],
+        # Worker processes only take frames that fit their shared memory slots
+        max_frame_bytes=app.config['INFERENCE_SLOT_BYTES'] if worker_pool else None
+    )
+    
+    # Skip inference on frames that look the same as the last one inferred in the session
+    if app.config['SCENE_GATE_ENABLED']:
+        scene_gate = SceneChangeGate(
+            threshold=app.config['SCENE_GATE_THRESHOLD'],
+            max_skips=app.config['SCENE_GATE_MAX_SKIPS']
         )
-    ''')
     
-    # Dashboard statistics table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_statistics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            total_sessions INTEGER DEFAULT 0,
-            total_waste_kg REAL DEFAULT 0,
-            total_food_consumed_kg REAL DEFAULT 0,
-            avg_waste_percentage REAL DEFAULT 0,
-            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
+    # Frames are decoded small, cropped and letterboxed into reusable buffers before inference
+    if app.config['PREPROCESS_ENABLED']:
+        preprocessor = FramePreprocessor(
+            imgsz=app.config['INFERENCE_IMGSZ'],
+            max_buffers=app.config['INFERENCE_MAX_BATCH'] * (worker_pool.size if worker_pool else 1) * 4,
+            jpeg_quality=app.config['CAPTURE_JPEG_QUALITY'],
+            max_capture_side=app.config['CAPTURE_MAX_SIDE']
         )
-    ''')
     
-    conn.commit()
+    # Sampled video frames are always letterboxed to the model size, whatever the clip's resolution
+    video_preprocessor = preprocessor or FramePreprocessor(
+        imgsz=app.config['INFERENCE_IMGSZ'],
+        max_buffers=app.config['INFERENCE_MAX_BATCH'] * app.config['VIDEO_MAX_JOBS']
+    )
+    
+    predict = warm_predict
+
+def frame_decoder(session_id):
+    """JPEG decode function for a session's frames: preprocessed when enabled"""
+    if preprocessor:
+        return lambda buffer: preprocessor.decode(buffer, session_id)
+    return decode_jpeg
+
+def capture_hint(session_id=None):
+    """Capture size and JPEG quality the client should send for a session"""
+    if preprocessor:
+        return preprocessor.capture_hint(session_id)
+    return {
+        'max_side': app.config['CAPTURE_MAX_SIDE'],
+        'jpeg_quality': app.config['CAPTURE_JPEG_QUALITY'],
+        'imgsz': app.config['INFERENCE_IMGSZ'],
+        'roi': None
+    }
+
+def inference_unavailable():
+    """503 for frame requests while the model is still warming up or failed to load"""
+    status = startup.status()
+    if status['state'] == 'failed':
+        return jsonify({'error': 'YOLO model not available', 'state': status['state']}), 503
+    return jsonify({
+        'error': 'Model is warming up, retry shortly',
+        'state': status['state']
+    }), 503, {'Retry-After': str(app.config['WARMUP_RETRY_AFTER_S'])}
+
+# Prometheus metrics, served on /metrics
+metrics = MetricsRegistry()
+http_requests = metrics.counter('http_requests_total', 'HTTP requests by endpoint, method and status',
+                                ('endpoint', 'method', 'status'))
+http_errors = metrics.counter('http_request_errors_total', 'Requests that ended in a server error', ('endpoint',))
+request_seconds = metrics.histogram('http_request_duration_seconds', 'Request latency', ('endpoint',))
+stage_seconds = metrics.histogram('stage_duration_seconds', 'Time spent in each stage of a request',
+                                  ('endpoint', 'stage'))
+detections_total = metrics.counter('detections_total', 'Detections above the confidence cutoff by item', ('item',))
+frames_rejected = metrics.counter('frames_rejected_total', 'Frames turned away by admission control', ('reason',))
+db_acquire_seconds = metrics.histogram('db_acquire_duration_seconds', 'Time to check out a pooled SQLite connection')
+db_query_seconds = metrics.histogram('db_query_duration_seconds', 'SQLite statement execution time', ('query',))
+
+timing_handler = logging.StreamHandler()
+timing_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.getLogger('aibsfms.timing').addHandler(timing_handler)
+logging.getLogger('aibsfms.timing').setLevel(logging.INFO)
+
+# Request timer of the request an executor thread is currently working for
+offloaded = threading.local()
+
+def current_timer():
+    if has_request_context():
+        return g.get('request_timer')
+    return getattr(offloaded, 'timer', None)
+
+def timed(stage):
+    """Time a block as a stage of the current request (no-op outside a request)"""
+    timer = current_timer()
+    return timer.stage(stage) if timer else nullcontext()
+
+def record_error(error):
+    timer = current_timer()
+    if timer:
+        timer.fields['error'] = str(error)
+
+def record_query(sql, seconds):
+    db_query_seconds.observe(seconds, query=query_label(sql))
+    timer = current_timer()
+    if timer:
+        timer.fields['db_queries'] = timer.fields.get('db_queries', 0) + 1
+        timer.fields['db_ms'] = timer.fields.get('db_ms', 0.0) + seconds * 1000.0
+
+def record_request(timer, method, status):
+    elapsed = timer.elapsed()
+    http_requests.inc(endpoint=timer.endpoint, method=method, status=status)
+    request_seconds.observe(elapsed, endpoint=timer.endpoint)
+    for name, seconds in timer.stages.items():
+        stage_seconds.observe(seconds, endpoint=timer.endpoint, stage=name)
+    if status >= 500:
+        http_errors.inc(endpoint=timer.endpoint)
+    if app.config['TIMING_LOG']:
+        timer.log(method, status, elapsed)
+
+@app.before_request
+def start_request_timer():
+    g.request_timer = RequestTimer(request.endpoint or 'unmatched')
+
+@app.after_request
+def finish_request_timer(response):
+    timer = g.pop('request_timer', None)
+    if timer:
+        record_request(timer, request.method, response.status_code)
+    return response
+
+# Bounded executors for the heavy routes in async serving mode
+frame_executor = db_executor = None
+if app.config['SERVING_MODE'] == 'async':
+    frame_executor = BoundedExecutor(
+        'frame',
+        max_workers=app.config['FRAME_EXECUTOR_WORKERS'],
+        max_pending=app.config['FRAME_EXECUTOR_QUEUE']
+    )
+    db_executor = BoundedExecutor(
+        'db',
+        max_workers=app.config['DB_EXECUTOR_WORKERS'],
+        max_pending=app.config['DB_EXECUTOR_QUEUE']
+    )
+    atexit.register(frame_executor.shutdown, wait=False)
+    atexit.register(db_executor.shutdown, wait=False)
+elif app.config['SERVING_MODE'] != 'sync':
+    raise ValueError(f"Unknown serving mode: {app.config['SERVING_MODE']}")
+
+def offload(executor, fn, *args):
+    """Run fn on the executor in async serving mode (inline in sync mode) and return its result
+
+    The calling request thread still waits for the result; the executor bounds how many
+    calls run at once and turns the rest away early, it does not free the request thread.
+    """
+    if executor is None:
+        return fn(*args)
+    timer = current_timer()
+    
+    def call():
+        offloaded.timer = timer
+        try:
+            return fn(*args)
+        finally:
+            offloaded.timer = None
+    return executor.run(call)
+
+# Camera frames are admitted before their body is read
+frame_admission = AdmissionController(
+    max_per_user=app.config['FRAME_MAX_PER_USER'],
+    max_per_session=app.config['FRAME_MAX_PER_SESSION']
+)
+
+def frame_retry_after():
+    """Seconds a client should wait before its next frame: the time to drain the inference queue"""
+    estimate = inference_scheduler.drain_estimate() if inference_scheduler else 0.0
+    return max(0.25, min(estimate, 10.0))
+
+def overload_reason(error):
+    if isinstance(error, AdmissionRejected):
+        return error.reason
+    return 'queue_full' if isinstance(error, QueueFull) else 'executor_full'
+
+def frames_overloaded(reason):
+    """429 for a frame turned away by admission control, with when to try again"""
+    frames_rejected.inc(reason=reason)
+    retry_after = frame_retry_after()
+    return jsonify({
+        'error': 'Too many frames, slow down',
+        'reason': reason,
+        'retry_after_ms': round(retry_after * 1000.0)
+    }), 429, {'Retry-After': str(max(1, math.ceil(retry_after)))}
+
+def frame_dropped(error):
+    """409 for a frame the scheduler dropped because a newer one replaced it or it went stale
+
+    This is normal coalescing rather than overload, so it is kept apart from the 429 that
+    makes clients back off.
+    """
+    return {
+        'error': 'Frame skipped, a newer frame from this session is analyzed instead',
+        'reason': error.reason,
+        'dropped': True
+    }
+
+def executor_saturated():
+    """503 for heavy requests while their executor is full"""
+    return jsonify({'error': 'Server busy, retry shortly'}), 503, {
+        'Retry-After': str(app.config['EXECUTOR_RETRY_AFTER_S'])
+    }
+
+# Pre-tuned SQLite connections shared by all routes and helpers
+db_pool = ConnectionPool(
+    app.config['DATABASE'],
+    synchronous=app.config['DB_SYNCHRONOUS'],
+    busy_timeout_ms=app.config['DB_BUSY_TIMEOUT_MS'],
+    mmap_size=app.config['DB_MMAP_SIZE'],
+    cache_size_kb=app.config['DB_CACHE_SIZE_KB'],
+    max_idle=app.config['DB_POOL_MAX_IDLE'],
+    on_acquire=db_acquire_seconds.observe,
+    on_query=record_query
+)
+
+# Serialized dashboard payloads, invalidated whenever the user's data is written
+dashboard_cache = DashboardCache(
+    max_entries=app.config['DASHBOARD_CACHE_MAX_ENTRIES'],
+    ttl=app.config['DASHBOARD_CACHE_TTL_S']
+)
+
+# Detection and suggestion rows are written in batches off the request path
+journal = WriteBehindJournal(
+    db_pool.connect,
+    on_flush=lambda user_ids: dashboard_cache.invalidate(*user_ids),
+    flush_interval_ms=app.config['JOURNAL_FLUSH_INTERVAL_MS'],
+    batch_size=app.config['JOURNAL_BATCH_SIZE'],
+    max_queue=app.config['JOURNAL_MAX_QUEUE'],
+    durability=app.config['JOURNAL_DURABILITY'],
+    max_retries=app.config['JOURNAL_MAX_RETRIES'],
+    retry_backoff_ms=app.config['JOURNAL_RETRY_BACKOFF_MS']
+)
+atexit.register(journal.close)
+atexit.register(db_pool.close_all)
+
+# Tracked items are written to the journal when their track closes
+object_tracker = None
+if app.config['TRACKING_ENABLED']:
+    object_tracker = MultiObjectTracker(
+        lambda session_id, user_id, track: journal.add_tracked_item(session_id, track, user_id=user_id),
+        iou_threshold=app.config['TRACK_IOU_THRESHOLD'],
+        low_conf=app.config['TRACK_LOW_CONF'],
+        max_age_s=app.config['TRACK_MAX_AGE_S'],
+        min_frames=app.config['TRACK_MIN_FRAMES']
+    )
+    # Registered after the journal so open tracks are flushed into it before it closes
+    atexit.register(object_tracker.close_all)
+
+# Old detections and suggestions are archived and the freed pages vacuumed in the background
+retention_worker = None
+if app.config['RETENTION_ENABLED']:
+    retention_worker = RetentionWorker(
+        db_pool.acquire,
+        app.config['ARCHIVE_DIR'],
+        {
+            'food_detections': app.config['RETENTION_DETECTIONS_DAYS'],
+            'ai_suggestions': app.config['RETENTION_SUGGESTIONS_DAYS']
+        },
+        interval_s=app.config['RETENTION_INTERVAL_S'],
+        batch_size=app.config['RETENTION_BATCH_SIZE'],
+        vacuum_step_pages=app.config['VACUUM_STEP_PAGES'],
+        on_archived=lambda user_ids: dashboard_cache.invalidate(*user_ids)
+    )
+    atexit.register(retention_worker.close)
+
+# Frames behind detections are written by background threads; image_path is known right away
+frame_store = None
+if app.config['FRAME_STORE_ENABLED']:
+    frame_store = FrameStore(
+        app.config['FRAME_DIR'],
+        workers=app.config['FRAME_STORE_WORKERS'],
+        max_queue=app.config['FRAME_STORE_QUEUE'],
+        max_bytes=app.config['FRAME_STORE_MAX_MB'] * 1024 * 1024,
+        thumbnail_side=app.config['FRAME_STORE_THUMBNAIL_SIDE'],
+        jpeg_quality=app.config['FRAME_STORE_JPEG_QUALITY']
+    )
+    atexit.register(frame_store.close)
+
+# Rule-table suggestions, throttled and deduplicated per tracking session
+suggestion_engine = SuggestionEngine(
+    lambda session_id: load_suggestion_session(session_id),
+    min_interval=app.config['SUGGESTION_MIN_INTERVAL_S'],
+    max_per_frame=app.config['SUGGESTION_MAX_PER_FRAME']
+)
+
+# Component state read at scrape time
+metrics.gauge_from('inference_queue_depth', 'Frames waiting for the model',
+                   lambda: inference_scheduler.queue_depth() if inference_scheduler else None)
+metrics.counter_from('inference_batches_total', 'Model batches run',
+                     lambda: inference_scheduler.stats()['batches_run'] if inference_scheduler else None)
+metrics.gauge_from('journal_queue_depth', 'Rows waiting to be written by the journal',
+                   lambda: journal.stats()['queue_depth'])
+metrics.counter_from('journal_rows_written_total', 'Rows written by the journal',
+                     lambda: journal.stats()['rows_written'])
+metrics.counter_from('journal_rows_dropped_total', 'Rows dropped because the journal queue was full',
+                     lambda: journal.stats()['rows_dropped'])
+metrics.counter_from('journal_rows_failed_total', 'Rows the journal could not write',
+                     lambda: journal.stats()['rows_failed'])
+metrics.counter_from('journal_flush_retries_total', 'Journal flushes retried because the database was locked',
+                     lambda: journal.stats()['flush_retries'])
+metrics.gauge_from('journal_last_flush_seconds', 'Duration of the last journal flush',
+                   lambda: journal.stats()['last_flush_ms'] / 1000.0)
+metrics.gauge_from('db_pool_idle_connections', 'Idle pooled SQLite connections', lambda: db_pool.stats()['idle'])
+metrics.counter_from('db_connections_opened_total', 'SQLite connections opened',
+                     lambda: db_pool.stats()['connections_opened'])
+metrics.gauge_from('dashboard_cache_entries', 'Cached dashboard payloads',
+                   lambda: dashboard_cache.stats()['entries'])
+metrics.gauge_from('dashboard_cache_hit_ratio', 'Dashboard cache hit ratio',
+                   lambda: dashboard_cache.stats()['hit_ratio'])
+metrics.counter_from('retention_rows_archived_total', 'Rows moved to the archive by retention',
+                     lambda: sum(retention_worker.stats()['rows_archived'].values()) if retention_worker else None)
+metrics.counter_from('retention_pages_vacuumed_total', 'Database pages returned to the filesystem',
+                     lambda: retention_worker.stats()['pages_vacuumed'] if retention_worker else None)
+metrics.gauge_from('frame_store_bytes', 'Bytes of stored frames on disk',
+                   lambda: frame_store.stats()['bytes'] if frame_store else None)
+metrics.counter_from('frame_store_dropped_total', 'Frames not stored because the frame store queue was full',
+                     lambda: frame_store.stats()['dropped'] if frame_store else None)
+metrics.gauge_from('ready', '1 once the model is warmed up', lambda: int(startup.is_ready()))
+metrics.gauge_from('frame_executor_in_flight', 'Frames running or queued on the frame executor',
+                   lambda: frame_executor.stats()['in_flight'] if frame_executor else None)
+metrics.counter_from('frame_executor_rejected_total', 'Frames rejected because the frame executor was full',
+                     lambda: frame_executor.stats()['rejected'] if frame_executor else None)
+metrics.gauge_from('db_executor_in_flight', 'Queries running or queued on the database executor',
+                   lambda: db_executor.stats()['in_flight'] if db_executor else None)
+metrics.counter_from('db_executor_rejected_total', 'Requests rejected because the database executor was full',
+                     lambda: db_executor.stats()['rejected'] if db_executor else None)
+
+# Database initialization
+def init_db():
+    conn = db_pool.acquire()
+    
+    # Create the schema or upgrade an existing database in place
+    migrate(conn)
+    
     conn.close()
     print("Database initialized successfully!")
 
@@ -152,18 +590,62 @@ def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def get_db():
-    conn = sqlite3.connect('aibsfms.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Pooled connection; conn.close() returns it to the pool
+    return db_pool.acquire()
 
-# Health check endpoint
+# Health check endpoints
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
-        'model_loaded': model is not None
+        'ready': startup.is_ready(),
+        'model_loaded': predict is not None,
+        'inference_workers': worker_pool.health() if worker_pool else None
+    }), 200
+
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    # The process is up and serving requests; says nothing about the model
+    return jsonify({'status': 'alive'}), 200
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    status = startup.status()
+    status['inference_workers'] = worker_pool.health() if worker_pool else None
+    return jsonify(status), 200 if startup.is_ready() else 503
+
+@app.route('/api/inference/stats', methods=['GET'])
+def inference_stats():
+    if not inference_scheduler:
+        return jsonify({'error': 'YOLO model not available'}), 503
+    stats = inference_scheduler.stats()
+    stats['scene_gate'] = scene_gate.stats() if scene_gate else None
+    return jsonify(stats), 200
+
+@app.route('/api/stats', methods=['GET'])
+def server_stats():
+    return jsonify({
+        'inference': inference_scheduler.stats() if inference_scheduler else None,
+        'scene_gate': scene_gate.stats() if scene_gate else None,
+        'journal': journal.stats(),
+        'db_pool': db_pool.stats(),
+        'dashboard_cache': dashboard_cache.stats(),
+        'suggestions': suggestion_engine.stats(),
+        'tracker': object_tracker.stats() if object_tracker else None,
+        'preprocess': preprocessor.stats() if preprocessor else None,
+        'retention': retention_worker.stats() if retention_worker else None,
+        'frame_store': frame_store.stats() if frame_store else None,
+        'serving_mode': app.config['SERVING_MODE'],
+        'frame_executor': frame_executor.stats() if frame_executor else None,
+        'db_executor': db_executor.stats() if db_executor else None,
+        'frame_admission': frame_admission.stats(),
+        'food_classes': food_classes.to_dict() if food_classes else None
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return app.response_class(metrics.render(), status=200, content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Authentication routes
 @app.route('/api/auth/signup', methods=['POST'])
 def signup():
@@ -334,17 +816,106 @@ def start_tracking():
         session_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        suggestion_engine.register_session(session_id, user_id, tracking_mode)
+        dashboard_cache.invalidate(user_id)
         
         session['current_session_id'] = session_id
         
         return jsonify({
             'success': True,
-            'session_id': session_id
+            'session_id': session_id,
+            'capture': capture_hint(session_id)
         }), 201
     except Exception as e:
         print(f"Start tracking error: {e}")
         return jsonify({'error': 'Failed to start tracking'}), 500
 
+def analyze_frame(user_id, session_id, frame):
+    """Run a decoded frame through YOLO, store detections and return the response payload"""
+    # With preprocessing the frame is a PreparedFrame holding a pooled model-sized image
+    image = frame.image if preprocessor else frame
+    
+    # Unchanged scene: reuse the last result without touching the model or the database
+    signature = None
+    if scene_gate:
+        with timed('scene_gate'):
+            signature = scene_gate.signature(image)
+            cached = scene_gate.lookup(session_id, signature)
+        if cached is not None:
+            if preprocessor:
+                preprocessor.release(frame)
+            # The same items are still in view
+            if object_tracker:
+                object_tracker.refresh(session_id)
+            return dict(cached, suggestions=[], cached=True)
+    
+    # Process with YOLO (batched with frames from other requests)
+    with timed('inference'):
+        try:
+            # Keyed by session: a newer frame from the same camera replaces this one while it waits
+            frame_detections = inference_scheduler.infer(image, timeout=app.config['INFERENCE_TIMEOUT_S'],
+                                                         key=session_id)
+        except (QueueFull, FrameDropped, FrameTooLarge):
+            # Never reached the model, so the buffer is free again
+            if preprocessor:
+                preprocessor.release(frame)
+            raise
+    if preprocessor:
+        # Only reuse the buffer once the model is done with it; a timed-out frame may still be queued
+        preprocessor.release(frame)
+        frame_detections = frame.to_frame(frame_detections)
+    frame_detections = food_classes.label(frame_detections)
+    
+    # Extract detections
+    detections = []
+    
+    with timed('store_detections'):
+        # Keep the frame behind the detections: the JPEG as sent, or the decoded image without preprocessing
+        image_path = None
+        if frame_store and any(food_classes.accepts(d) for d in frame_detections):
+            source = frame.source if preprocessor else image
+            image_path = frame_store.put(source) if source is not None else None
+        
+        # Tracked items are stored once, when they leave the view
+        track_ids = (
+            object_tracker.update(session_id, user_id, frame_detections, image_path=image_path)
+            if object_tracker else None
+        )
+        
+        for i, detection in enumerate(frame_detections):
+            name = detection.name
+            conf = detection.confidence
+            
+            # Keep food items above their class's confidence threshold
+            if food_classes.accepts(detection):
+                if track_ids is None:
+                    # Save detection (flushed in batches by the journal)
+                    journal.add_detection(session_id, name, conf, user_id=user_id, image_path=image_path)
+                detections_total.inc(item=name)
+                
+                item = {
+                    'item': name,
+                    'category': food_classes.categories[name],
+                    'confidence': conf
+                }
+                if track_ids is not None:
+                    item['track_id'] = track_ids[i]
+                detections.append(item)
+    
+    # Generate AI suggestions based on detections
+    with timed('suggestions'):
+        suggestions = generate_ai_suggestions(session_id, detections)
+    
+    payload = {
+        'success': True,
+        'detections': detections,
+        'suggestions': suggestions,
+        'cached': False
+    }
+    if scene_gate:
+        scene_gate.store(session_id, signature, payload)
+    return payload
+
 @app.route('/api/tracking/process-frame', methods=['POST'])
 @login_required
 def process_frame():
@@ -354,63 +925,222 @@ def process_frame():
         
         session_id = session['current_session_id']
         
-        # Get image data
-        data = request.json
-        image_data = data.get('image')
-        
-        if not model:
-            return jsonify({'error': 'YOLO model not available'}), 503
-        
-        # Decode base64 image
-        image_bytes = base64.b64decode(image_data.split(',')[1])
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Process with YOLO
-        results = model(frame, verbose=False)
-        
-        # Extract detections
-        detections = []
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                cls = int(box.cls[0])
-                conf = float(box.conf[0])
-                name = model.names[cls]
-                
-                # Filter for food-related items (confidence > 0.5)
-                if conf > 0.5:
-                    # Save detection
-                    cursor.execute('''
-                        INSERT INTO food_detections 
-                        (session_id, item_name, confidence, detection_type, timestamp)
-                        VALUES (?, ?, ?, 'yolo', CURRENT_TIMESTAMP)
-                    ''', (session_id, name, conf))
-                    
-                    detections.append({
-                        'item': name,
-                        'confidence': conf
-                    })
-        
-        conn.commit()
-        
-        # Generate AI suggestions based on detections
-        suggestions = generate_ai_suggestions(session_id, detections)
+        if not startup.wait_ready(app.config['WARMUP_WAIT_S']):
+            return inference_unavailable()
         
-        conn.close()
+        if request.content_length and request.content_length > app.config['MAX_FRAME_BYTES']:
+            return jsonify({'error': 'Frame too large'}), 413
         
-        return jsonify({
-            'success': True,
-            'detections': detections,
-            'suggestions': suggestions
-        }), 200
+        # Admitted before the body is read, so a rejected frame costs almost nothing
+        with frame_admission.admit(session['user_id'], session_id):
+            # Decode the raw JPEG, multipart or base64 JSON upload
+            frame = frame_from_request(request, timer=current_timer(), decode=frame_decoder(session_id))
+            if frame is None:
+                return jsonify({'error': 'Could not decode image'}), 400
+            
+            payload = offload(frame_executor, analyze_frame, session['user_id'], session_id, frame)
+        with timed('serialize'):
+            return jsonify(payload), 200
+    except FrameDropped as e:
+        return jsonify(frame_dropped(e)), 409
+    except (AdmissionRejected, QueueFull, ExecutorSaturated) as e:
+        return frames_overloaded(overload_reason(e))
+    except FrameTooLarge:
+        return jsonify({'error': 'Frame too large'}), 413
     except Exception as e:
         print(f"Frame processing error: {e}")
+        record_error(e)
         return jsonify({'error': f'Failed to process frame: {str(e)}'}), 500
 
+@app.route('/api/tracking/capture-hint', methods=['GET'])
+@login_required
+def get_capture_hint():
+    return jsonify(capture_hint(session.get('current_session_id'))), 200
+
+@app.route('/api/tracking/roi', methods=['POST'])
+@login_required
+def set_region_of_interest():
+    """Restrict inference to part of the frame, as [x1, y1, x2, y2] fractions; null clears it"""
+    if 'current_session_id' not in session:
+        return jsonify({'error': 'No active tracking session'}), 400
+    if not preprocessor:
+        if not startup.is_ready():
+            return inference_unavailable()
+        return jsonify({'error': 'Preprocessing is disabled'}), 409
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        preprocessor.set_roi(session['current_session_id'], data.get('roi'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid region of interest: {e}'}), 400
+    return jsonify({'success': True, 'capture': capture_hint(session['current_session_id'])}), 200
+
+# Each running video job holds a request thread and a share of the model until the clip is done
+video_jobs = threading.BoundedSemaphore(app.config['VIDEO_MAX_JOBS'])
+
+def resolve_video_path(name):
+    """Absolute path of a clip inside VIDEO_DIR, or None if it is outside or missing"""
+    if not name:
+        return None
+    root = os.path.realpath(app.config['VIDEO_DIR'])
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+@app.route('/api/tracking/process-video', methods=['POST'])
+@login_required
+def process_video_file():
+    """Sample a server-side clip and stream per-frame detections back as NDJSON or server-sent events"""
+    if 'current_session_id' not in session:
+        return jsonify({'error': 'No active tracking session'}), 400
+    
+    if not startup.wait_ready(app.config['WARMUP_WAIT_S']):
+        return inference_unavailable()
+    
+    data = request.get_json(silent=True) or {}
+    path = resolve_video_path(data.get('path'))
+    if path is None:
+        return jsonify({'error': 'Video not found'}), 404
+    
+    try:
+        from video import VideoSampler, process_video, video_tracker, format_ndjson, format_sse
+        sampler = VideoSampler(
+            path,
+            sample_fps=float(data.get('sample_fps', app.config['VIDEO_SAMPLE_FPS'])),
+            scene_threshold=data.get('scene_threshold'),
+            max_gap_s=float(data.get('max_gap_s', app.config['VIDEO_MAX_GAP_S']))
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid sampling options: {e}'}), 400
+    
+    user_id = session['user_id']
+    session_id = session['current_session_id']
+    use_sse = data.get('format') == 'sse' or request.accept_mimetypes.best == 'text/event-stream'
+    format_event = format_sse if use_sse else format_ndjson
+    
+    def infer_batch(frames):
+        # Letterboxed like camera frames, so a 4K clip costs the model no more than a webcam
+        prepared = [video_preprocessor.prepare(frame) for frame in frames]
+        # Sampled frames share the batch scheduler with live camera frames; when its queue is
+        # full the clip waits for room rather than failing, which paces reading the video
+        futures = []
+        try:
+            for frame in prepared:
+                futures.append(inference_scheduler.submit(frame.image, block=True,
+                                                          timeout=app.config['INFERENCE_TIMEOUT_S']))
+        except Exception:
+            # Frames that were never queued can give their buffers back
+            for frame in prepared[len(futures):]:
+                video_preprocessor.release(frame)
+            raise
+        results = [future.result(timeout=app.config['INFERENCE_TIMEOUT_S']) for future in futures]
+        for frame in prepared:
+            video_preprocessor.release(frame)
+        return [food_classes.label(frame.to_frame(result)) for frame, result in zip(prepared, results)]
+    
+    if app.config['TRACKING_ENABLED']:
+        # One row per item tracked through the clip
+        on_frame = video_tracker(
+            lambda _, __, track: journal.add_tracked_item(session_id, track, 'video', user_id=user_id),
+            max_age_s=app.config['TRACK_MAX_AGE_S'],
+            min_frames=app.config['TRACK_MIN_FRAMES'],
+            class_thresholds=food_classes.thresholds
+        )
+    else:
+        def on_frame(frame_index, time_s, detections):
+            for detection in detections:
+                if food_classes.accepts(detection):
+                    journal.add_detection(session_id, detection.name, detection.confidence, 'video', user_id=user_id)
+        on_frame.close = lambda: None
+    
+    def generate():
+        try:
+            for event in process_video(sampler, infer_batch, batch_size=app.config['INFERENCE_MAX_BATCH'],
+                                       on_frame=on_frame, accept=food_classes.accepts):
+                if event['type'] == 'frame':
+                    for item in event['detections']:
+                        detections_total.inc(item=item['item'])
+                yield format_event(event)
+        except Exception as e:
+            print(f"Video processing error: {e}")
+            yield format_event({'type': 'error', 'error': f'Failed to process video: {str(e)}'})
+        finally:
+            on_frame.close()
+    
+    # Taken last, so nothing between taking and handing the permit to the response can leak it
+    if not video_jobs.acquire(blocking=False):
+        return jsonify({'error': 'Too many video jobs running, retry later'}), 503, {
+            'Retry-After': str(app.config['EXECUTOR_RETRY_AFTER_S'])
+        }
+    try:
+        response = app.response_class(
+            generate(),
+            mimetype='text/event-stream' if use_sse else 'application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        response.call_on_close(video_jobs.release)
+    except Exception:
+        video_jobs.release()
+        raise
+    return response
+
+# Persistent frame channel: one WebSocket per tracking session, binary JPEG messages in, JSON results out
+if sock:
+    @sock.route('/api/tracking/stream')
+    def stream_frames(ws):
+        if 'user_id' not in session:
+            ws.send(json.dumps({'error': 'Authentication required'}))
+            return
+        if 'current_session_id' not in session:
+            ws.send(json.dumps({'error': 'No active tracking session'}))
+            return
+        
+        # Session is resolved once for the lifetime of the channel
+        user_id = session['user_id']
+        session_id = session['current_session_id']
+        
+        while True:
+            message = ws.receive()
+            if message is None:
+                break
+            # Each message is timed and counted like a request of its own
+            g.request_timer = RequestTimer('stream_frame')
+            status = 200
+            try:
+                if not startup.wait_ready(app.config['WARMUP_WAIT_S']):
+                    ws.send(json.dumps({'error': 'Model is warming up, retry shortly', 'state': startup.state}))
+                    continue
+                if not isinstance(message, str) and len(message) > app.config['MAX_FRAME_BYTES']:
+                    ws.send(json.dumps({'error': 'Frame too large'}))
+                    continue
+                with frame_admission.admit(user_id, session_id):
+                    if isinstance(message, str):
+                        frame = decode_data_url(message, decode=frame_decoder(session_id))
+                    else:
+                        frame = frame_decoder(session_id)(message)
+                    if frame is None:
+                        ws.send(json.dumps({'error': 'Could not decode image'}))
+                        continue
+                    ws.send(json.dumps(offload(frame_executor, analyze_frame, user_id, session_id, frame)))
+            except FrameDropped as e:
+                status = 409
+                ws.send(json.dumps(frame_dropped(e)))
+            except (AdmissionRejected, QueueFull, ExecutorSaturated) as e:
+                # Same body as the HTTP 429, so the client backs off the same way
+                status = 429
+                ws.send(frames_overloaded(overload_reason(e))[0].get_data(as_text=True))
+            except FrameTooLarge:
+                status = 413
+                ws.send(json.dumps({'error': 'Frame too large'}))
+            except Exception as e:
+                print(f"Frame stream error: {e}")
+                record_error(e)
+                status = 500
+                ws.send(json.dumps({'error': f'Failed to process frame: {str(e)}'}))
+            finally:
+                record_request(g.pop('request_timer'), 'WS', status)
+
 @app.route('/api/tracking/stop', methods=['POST'])
 @login_required
 def stop_tracking():
@@ -422,6 +1152,7 @@ def stop_tracking():
         
         conn = get_db()
         cursor = conn.cursor()
+        # Completing the session also updates user_statistics through database triggers
         cursor.execute('''
             UPDATE tracking_sessions 
             SET end_time = CURRENT_TIMESTAMP, status = 'completed'
@@ -429,8 +1160,14 @@ def stop_tracking():
         ''', (session_id,))
         conn.commit()
         
-        # Update user statistics
-        update_user_statistics(session['user_id'])
+        if scene_gate:
+            scene_gate.forget(session_id)
+        if object_tracker:
+            object_tracker.close_session(session_id)
+        if preprocessor:
+            preprocessor.forget(session_id)
+        suggestion_engine.forget(session_id)
+        dashboard_cache.invalidate(session['user_id'])
         
         conn.close()
         
@@ -441,6 +1178,79 @@ def stop_tracking():
         print(f"Stop tracking error: {e}")
         return jsonify({'error': 'Failed to stop tracking'}), 500
 
+def build_dashboard_payload(user_id):
+    """Run the dashboard queries for a user and return the response payload"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # Get user statistics
+    cursor.execute('SELECT * FROM user_statistics WHERE user_id = ?', (user_id,))
+    stats = cursor.fetchone()
+    
+    # Get recent sessions
+    cursor.execute('''
+        SELECT id, tracking_mode, start_time, end_time, status
+        FROM tracking_sessions
+        WHERE user_id = ?
+        ORDER BY start_time DESC
+        LIMIT 10
+    ''', (user_id,))
+    recent_sessions = [dict(row) for row in cursor.fetchall()]
+    
+    # Get recent detections
+    cursor.execute('''
+        SELECT fd.item_name, fd.quantity, fd.timestamp, fd.confidence
+        FROM food_detections fd
+        JOIN tracking_sessions ts ON fd.session_id = ts.id
+        WHERE ts.user_id = ?
+        ORDER BY fd.timestamp DESC
+        LIMIT 20
+    ''', (user_id,))
+    recent_detections = [dict(row) for row in cursor.fetchall()]
+    
+    # Get AI suggestions
+    cursor.execute('''
+        SELECT suggestion_text, category, timestamp
+        FROM ai_suggestions
+        WHERE user_id = ?
+        ORDER BY timestamp DESC
+        LIMIT 10
+    ''', (user_id,))
+    suggestions = [dict(row) for row in cursor.fetchall()]
+    
+    # Get waste data (create sample data if empty)
+    cursor.execute('''
+        SELECT wt.waste_type, SUM(wt.quantity) as total_quantity
+        FROM waste_tracking wt
+        JOIN tracking_sessions ts ON wt.session_id = ts.id
+        WHERE ts.user_id = ?
+        GROUP BY wt.waste_type
+    ''', (user_id,))
+    waste_data = [dict(row) for row in cursor.fetchall()]
+    
+    # If no waste data, create sample
+    if not waste_data:
+        waste_data = [
+            {'waste_type': 'Vegetable Peels', 'total_quantity': 0},
+            {'waste_type': 'Leftover Food', 'total_quantity': 0},
+            {'waste_type': 'Spillage', 'total_quantity': 0}
+        ]
+    
+    conn.close()
+    
+    return {
+        'statistics': dict(stats) if stats else {
+            'total_sessions': 0,
+            'total_waste_kg': 0,
+            'total_food_consumed_kg': 0,
+            'avg_waste_percentage': 0
+        },
+        'recent_sessions': recent_sessions,
+        'recent_detections': recent_detections,
+        'suggestions': suggestions,
+        'waste_data': waste_data
+    }
+
 # Dashboard routes
 @app.route('/api/dashboard/stats', methods=['GET'])
 @login_required
@@ -448,87 +1258,55 @@ def get_dashboard_stats():
     try:
         user_id = session['user_id']
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Get user statistics
-        cursor.execute('SELECT * FROM user_statistics WHERE user_id = ?', (user_id,))
-        stats = cursor.fetchone()
-        
-        # Get recent sessions
-        cursor.execute('''
-            SELECT id, tracking_mode, start_time, end_time, status
-            FROM tracking_sessions
-            WHERE user_id = ?
-            ORDER BY start_time DESC
-            LIMIT 10
-        ''', (user_id,))
-        recent_sessions = [dict(row) for row in cursor.fetchall()]
-        
-        # Get recent detections
-        cursor.execute('''
-            SELECT fd.item_name, fd.quantity, fd.timestamp, fd.confidence
-            FROM food_detections fd
-            JOIN tracking_sessions ts ON fd.session_id = ts.id
-            WHERE ts.user_id = ?
-            ORDER BY fd.timestamp DESC
-            LIMIT 20
-        ''', (user_id,))
-        recent_detections = [dict(row) for row in cursor.fetchall()]
-        
-        # Get AI suggestions
-        cursor.execute('''
-            SELECT suggestion_text, category, timestamp
-            FROM ai_suggestions
-            WHERE user_id = ?
-            ORDER BY timestamp DESC
-            LIMIT 10
-        ''', (user_id,))
-        suggestions = [dict(row) for row in cursor.fetchall()]
-        
-        # Get waste data (create sample data if empty)
-        cursor.execute('''
-            SELECT wt.waste_type, SUM(wt.quantity) as total_quantity
-            FROM waste_tracking wt
-            JOIN tracking_sessions ts ON wt.session_id = ts.id
-            WHERE ts.user_id = ?
-            GROUP BY wt.waste_type
-        ''', (user_id,))
-        waste_data = [dict(row) for row in cursor.fetchall()]
-        
-        # If no waste data, create sample
-        if not waste_data:
-            waste_data = [
-                {'waste_type': 'Vegetable Peels', 'total_quantity': 0},
-                {'waste_type': 'Leftover Food', 'total_quantity': 0},
-                {'waste_type': 'Spillage', 'total_quantity': 0}
-            ]
-        
-        conn.close()
+        # Serve from the per-user cache; unchanged polls get a 304 without touching SQLite
+        with timed('cache_lookup'):
+            cached = dashboard_cache.get(user_id)
+        if cached:
+            body, etag = cached
+        else:
+            version = dashboard_cache.version(user_id)
+            with timed('build_payload'):
+                payload = offload(db_executor, build_dashboard_payload, user_id)
+            with timed('serialize'):
+                body = json.dumps(payload, separators=(',', ':')).encode()
+            etag = dashboard_cache.put(user_id, body, version)
         
-        return jsonify({
-            'statistics': dict(stats) if stats else {
-                'total_sessions': 0,
-                'total_waste_kg': 0,
-                'total_food_consumed_kg': 0,
-                'avg_waste_percentage': 0
-            },
-            'recent_sessions': recent_sessions,
-            'recent_detections': recent_detections,
-            'suggestions': suggestions,
-            'waste_data': waste_data
-        }), 200
+        if etag in request.if_none_match:
+            dashboard_cache.record_not_modified()
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except ExecutorSaturated:
+        return executor_saturated()
     except Exception as e:
         print(f"Dashboard stats error: {e}")
+        record_error(e)
         return jsonify({'error': 'Failed to load dashboard data'}), 500
 
 @app.route('/api/dashboard/session/<int:session_id>', methods=['GET'])
 @login_required
 def get_session_details(session_id):
     try:
-        user_id = session['user_id']
+        details = offload(db_executor, load_session_details, session['user_id'], session_id)
+        if details is None:
+            return jsonify({'error': 'Session not found'}), 404
         
-        conn = get_db()
+        with timed('serialize'):
+            return jsonify(details), 200
+    except ExecutorSaturated:
+        return executor_saturated()
+    except Exception as e:
+        print(f"Session details error: {e}")
+        record_error(e)
+        return jsonify({'error': 'Failed to load session details'}), 500
+
+def load_session_details(user_id, session_id):
+    """Session row, detections and waste for one of the user's sessions, or None"""
+    conn = get_db()
+    try:
         cursor = conn.cursor()
         
         # Verify session belongs to user
@@ -539,7 +1317,7 @@ def get_session_details(session_id):
         session_data = cursor.fetchone()
         
         if not session_data:
-            return jsonify({'error': 'Session not found'}), 404
+            return None
         
         # Get detections for this session
         cursor.execute('''
@@ -555,131 +1333,194 @@ def get_session_details(session_id):
             WHERE session_id = ?
         ''', (session_id,))
         waste = [dict(row) for row in cursor.fetchall()]
-        
+    finally:
         conn.close()
-        
-        return jsonify({
-            'session': dict(session_data),
-            'detections': detections,
-            'waste': waste
-        }), 200
-    except Exception as e:
-        print(f"Session details error: {e}")
-        return jsonify({'error': 'Failed to load session details'}), 500
+    
+    return {
+        'session': dict(session_data),
+        'detections': detections,
+        'waste': waste
+    }
 
-# Helper function for AI suggestions
-def generate_ai_suggestions(session_id, detections):
-    """Generate AI-powered suggestions based on detections"""
-    suggestions = []
+@app.route('/api/analytics', methods=['GET'])
+@login_required
+def get_analytics():
+    """Detections and waste per hour, day or week over a date range, read from the rollups"""
+    try:
+        granularity, first, end = parse_range(
+            request.args.get('start'),
+            request.args.get('end'),
+            request.args.get('granularity')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Get session info
-        cursor.execute('''
-            SELECT ts.user_id, ts.tracking_mode
-            FROM tracking_sessions ts
-            WHERE ts.id = ?
-        ''', (session_id,))
-        session_info = cursor.fetchone()
-        
-        if not session_info:
-            return suggestions
-            
-        user_id = session_info['user_id']
-        mode = session_info['tracking_mode']
-        
-        # Generate mode-specific suggestions
-        if mode == 'cooking':
-            suggestion_texts = [
-                'Consider saving vegetable peels for making stock or compost',
-                'Batch cooking can save time and energy',
-                'Store leftovers properly to extend their shelf life'
-            ]
-            for text in suggestion_texts[:2]:
-                cursor.execute('''
-                    INSERT INTO ai_suggestions (user_id, session_id, suggestion_text, category)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, session_id, text, 'waste_reduction'))
-                suggestions.append({'text': text, 'category': 'waste_reduction'})
-                
-        elif mode == 'eating':
-            suggestion_texts = [
-                'Great portion control! This helps minimize waste',
-                'Try to finish what\'s on your plate to reduce food waste',
-                'Consider sharing larger portions with others'
-            ]
-            for text in suggestion_texts[:2]:
-                cursor.execute('''
-                    INSERT INTO ai_suggestions (user_id, session_id, suggestion_text, category)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, session_id, text, 'health'))
-                suggestions.append({'text': text, 'category': 'health'})
-                
-        elif mode == 'summary':
-            suggestion_texts = [
-                'Your tracking consistency is improving!',
-                'Consider meal planning to further reduce waste',
-                'You\'re making good progress in waste reduction'
-            ]
-            for text in suggestion_texts[:2]:
-                cursor.execute('''
-                    INSERT INTO ai_suggestions (user_id, session_id, suggestion_text, category)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, session_id, text, 'planning'))
-                suggestions.append({'text': text, 'category': 'planning'})
-        
-        conn.commit()
-        conn.close()
+        payload = offload(db_executor, load_analytics, session['user_id'], granularity, first, end,
+                          request.args.getlist('item'))
+        with timed('serialize'):
+            return jsonify(payload), 200
+    except ExecutorSaturated:
+        return executor_saturated()
     except Exception as e:
-        print(f"Suggestion generation error: {e}")
-    
-    return suggestions
+        print(f"Analytics error: {e}")
+        record_error(e)
+        return jsonify({'error': 'Failed to load analytics'}), 500
 
-def update_user_statistics(user_id):
-    """Update user statistics after session completion"""
+def load_analytics(user_id, granularity, first, end, items=None):
+    """Rollup rows for [first, end) grouped by bucket; cost depends on the buckets, not the raw rows"""
+    conn = get_db()
     try:
-        conn = get_db()
         cursor = conn.cursor()
-        
-        # Count total sessions
         cursor.execute('''
-            SELECT COUNT(*) as total FROM tracking_sessions WHERE user_id = ? AND status = 'completed'
-        ''', (user_id,))
-        total_sessions = cursor.fetchone()['total']
+            SELECT bucket, item_name, detections, quantity, confidence_sum
+            FROM detection_rollups
+            WHERE user_id = ? AND granularity = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+        ''', (user_id, granularity, first, end))
+        detection_rows = cursor.fetchall()
         
-        # Calculate waste (simulated for now)
-        cursor.execute('''
-            SELECT COALESCE(SUM(quantity), 0) as total_waste
-            FROM waste_tracking wt
-            JOIN tracking_sessions ts ON wt.session_id = ts.id
-            WHERE ts.user_id = ?
-        ''', (user_id,))
-        total_waste = cursor.fetchone()['total_waste']
-        
-        # Estimate consumed food (2x waste as placeholder)
-        total_consumed = total_waste * 2.5
-        waste_percentage = (total_waste / total_consumed * 100) if total_consumed > 0 else 0
-        
-        # Update statistics
         cursor.execute('''
-            UPDATE user_statistics
-            SET total_sessions = ?,
-                total_waste_kg = ?,
-                total_food_consumed_kg = ?,
-                avg_waste_percentage = ?,
-                last_updated = CURRENT_TIMESTAMP
-            WHERE user_id = ?
-        ''', (total_sessions, total_waste, total_consumed, waste_percentage, user_id))
-        
-        conn.commit()
+            SELECT bucket, waste_type, entries, quantity
+            FROM waste_rollups
+            WHERE user_id = ? AND granularity = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+        ''', (user_id, granularity, first, end))
+        waste_rows = cursor.fetchall()
+    finally:
+        conn.close()
+    
+    series = {bucket: {'bucket': bucket, 'detections': {}, 'waste': {}}
+              for bucket in bucket_starts(first, end, granularity)}
+    detection_totals = {}
+    waste_totals = {}
+    wanted = set(items) if items else None
+    
+    for row in detection_rows:
+        if wanted is not None and row['item_name'] not in wanted:
+            continue
+        series[row['bucket']]['detections'][row['item_name']] = {
+            'count': row['detections'],
+            'quantity': row['quantity'],
+            'avg_confidence': row['confidence_sum'] / row['detections'] if row['detections'] else None
+        }
+        total = detection_totals.setdefault(row['item_name'], {'count': 0, 'quantity': 0, 'confidence_sum': 0})
+        total['count'] += row['detections']
+        total['quantity'] += row['quantity']
+        total['confidence_sum'] += row['confidence_sum']
+    
+    for row in waste_rows:
+        if row['entries'] == 0:
+            continue
+        series[row['bucket']]['waste'][row['waste_type']] = {
+            'entries': row['entries'],
+            'quantity': row['quantity']
+        }
+        total = waste_totals.setdefault(row['waste_type'], {'entries': 0, 'quantity': 0})
+        total['entries'] += row['entries']
+        total['quantity'] += row['quantity']
+    
+    for total in detection_totals.values():
+        confidence_sum = total.pop('confidence_sum')
+        total['avg_confidence'] = confidence_sum / total['count'] if total['count'] else None
+    
+    return {
+        'granularity': granularity,
+        'start': first,
+        'end': end,
+        'series': list(series.values()),
+        'totals': {'detections': detection_totals, 'waste': waste_totals}
+    }
+
+export_jobs = threading.BoundedSemaphore(app.config['EXPORT_MAX_JOBS'])
+
+@app.route('/api/export/<kind>', methods=['GET'])
+@login_required
+def export_history(kind):
+    """Stream the user's sessions or detections as NDJSON, CSV or Parquet"""
+    if kind not in EXPORT_COLUMNS:
+        return jsonify({'error': 'Unknown export'}), 404
+    
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({'error': f"'format' must be one of {', '.join(FORMATS)}"}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Parquet export is not available on this server'}), 400
+    try:
+        start, end = parse_bounds(request.args.get('start'), request.args.get('end'))
+        session_id = int(request.args['session_id']) if request.args.get('session_id') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not export_jobs.acquire(blocking=False):
+        return jsonify({'error': 'Too many exports running, retry later'}), 503, {
+            'Retry-After': str(app.config['EXECUTOR_RETRY_AFTER_S'])
+        }
+    
+    mimetype, extension = FORMATS[fmt]
+    chunks = export_chunks(
+        db_pool.acquire, kind, fmt,
+        user_id=session['user_id'],
+        session_id=session_id,
+        start=start,
+        end=end,
+        page_size=app.config['EXPORT_PAGE_SIZE'],
+        # Rows retention moved out of the database are read back from the archive
+        archive_dir=app.config['ARCHIVE_DIR'] if os.path.isdir(app.config['ARCHIVE_DIR']) else None
+    )
+    response = app.response_class(
+        chunks,
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="aibsfms-{kind}.{extension}"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    response.call_on_close(export_jobs.release)
+    return response
+
+# Helper functions for AI suggestions
+def load_suggestion_session(session_id):
+    """Load session metadata for the suggestion engine when it is not already in memory"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT ts.user_id, ts.tracking_mode
+        FROM tracking_sessions ts
+        WHERE ts.id = ?
+    ''', (session_id,))
+    session_info = cursor.fetchone()
+    if not session_info:
         conn.close()
+        return None
+    
+    cursor.execute('''
+        SELECT suggestion_text FROM ai_suggestions WHERE session_id = ?
+    ''', (session_id,))
+    given = [row['suggestion_text'] for row in cursor.fetchall()]
+    conn.close()
+    return session_info['user_id'], session_info['tracking_mode'], given
+
+def generate_ai_suggestions(session_id, detections):
+    """Generate AI-powered suggestions based on detections"""
+    try:
+        # Only suggestions not yet given in this session come back, at most once per interval
+        user_id, suggestions = suggestion_engine.suggest(session_id, detections)
+        for suggestion in suggestions:
+            journal.add_suggestion(user_id, session_id, suggestion['text'], suggestion['category'])
+        return suggestions
     except Exception as e:
-        print(f"Statistics update error: {e}")
+        print(f"Suggestion generation error: {e}")
+        return []
 
 # Initialize database on startup
-init_db()
+startup.mark('app_setup')
+with startup.phase('init_db'):
+    init_db()
+
+# Load the model in the background so the app answers requests right away
+startup.start(warm_up)
 
 @app.route('/')
 def index():
@@ -693,4 +1534,5 @@ if __name__ == '__main__':
     print(f"📍 API Base: http://localhost:5000/api")
     print(f"🔐 CORS Enabled for local development")
     print("="*50 + "\n")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(debug=os.environ.get('AIBSFMS_DEBUG', '0') == '1', host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
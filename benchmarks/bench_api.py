@@ -0,0 +1,344 @@
+"""Load test of the API hot paths: frame uploads, dashboard polls and session-detail reads
+
+Each simulated client logs in as its own user and runs tracking sessions back to back:
+start a session, upload synthetic camera frames, poll the dashboard every few frames, read
+the details of one of its past sessions, then stop the session. By default the app is
+served in this process on a fresh database seeded with --users x --history completed
+sessions; with --url an already running server is targeted instead.
+
+Usage: python benchmarks/bench_api.py [--clients 16] [--duration 30] [--json run.json] [--compare base.json]
+"""
+import argparse
+import hashlib
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'bench-password'
+MODES = ('cooking', 'eating', 'summary')
+ITEMS = ('apple', 'banana', 'orange', 'broccoli', 'carrot', 'sandwich', 'pizza', 'cake', 'bowl', 'cup')
+WASTE_TYPES = ('peels', 'leftovers', 'spoiled', 'packaging')
+ENDPOINTS = ('start_tracking', 'process_frame', 'dashboard_stats', 'session_details', 'stop_tracking')
+
+
+def seed_database(path, users, history, detections, seed=0):
+    """Create a database at the latest schema version with users and completed sessions"""
+    import sqlite3
+    from migrations import migrate, RECOMPUTE_USER_STATISTICS
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    migrate(conn)
+    for user in range(users):
+        user_id = conn.execute(
+            'INSERT INTO users (name, email, password_hash) VALUES (?, ?, ?)',
+            (f'Bench User {user}', f'bench{user}@example.com', hashlib.sha256(PASSWORD.encode()).hexdigest())
+        ).lastrowid
+        conn.execute('INSERT INTO user_statistics (user_id) VALUES (?)', (user_id,))
+        for _ in range(history):
+            start = now - timedelta(days=rng.uniform(0, 90))
+            end = start + timedelta(minutes=rng.uniform(5, 45))
+            mode = rng.choice(MODES)
+            session_id = conn.execute(
+                "INSERT INTO tracking_sessions (user_id, tracking_mode, start_time, end_time, status) "
+                "VALUES (?, ?, ?, ?, 'completed')",
+                (user_id, mode, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO food_detections (session_id, item_name, confidence, detection_type, timestamp) "
+                "VALUES (?, ?, ?, 'yolo', ?)",
+                [
+                    (session_id, rng.choice(ITEMS), rng.uniform(0.5, 0.99),
+                     (start + (end - start) * i / detections).strftime('%Y-%m-%d %H:%M:%S'))
+                    for i in range(detections)
+                ]
+            )
+            conn.execute(
+                'INSERT INTO waste_tracking (session_id, waste_type, quantity) VALUES (?, ?, ?)',
+                (session_id, rng.choice(WASTE_TYPES), round(rng.uniform(0.01, 0.5), 3))
+            )
+    conn.execute(RECOMPUTE_USER_STATISTICS)
+    conn.commit()
+    conn.close()
+
+
+def synthetic_frames(count, width, height, quality, seed=0):
+    """JPEG frames of a textured background with a few objects drifting across it"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 8)
+    objects = [
+        (rng.integers(0, width), rng.integers(0, height), rng.integers(20, 80),
+         tuple(int(c) for c in rng.integers(0, 255, 3)), rng.integers(-12, 12, 2))
+        for _ in range(4)
+    ]
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        for x, y, radius, color, (dx, dy) in objects:
+            cv2.circle(frame, (int(x + dx * i) % width, int(y + dy * i) % height), int(radius), color, -1)
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        frames.append(encoded.tobytes())
+    return frames
+
+
+def serve_in_process(db_path, args):
+    """Import the app against the seeded database and serve it on a local port"""
+    os.environ['AIBSFMS_DB_PATH'] = db_path
+    from werkzeug.serving import make_server
+    import backend
+
+    if args.warmup_timeout and not backend.startup.wait_ready(args.warmup_timeout):
+        status = backend.startup.status()
+        print(f"Warning: model not ready ({status['state']}{': ' + status['error'] if status['error'] else ''}); "
+              f"process_frame will measure the 503 path")
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class Recorder:
+    """Latencies and status codes per endpoint, shared by all client threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.statuses = {name: {} for name in ENDPOINTS}
+
+    def record(self, endpoint, status, seconds):
+        with self._lock:
+            self.latencies[endpoint].append(seconds * 1000.0)
+            counts = self.statuses[endpoint]
+            counts[status] = counts.get(status, 0) + 1
+
+    def summary(self, elapsed):
+        results = {}
+        with self._lock:
+            for name in ENDPOINTS:
+                values = sorted(self.latencies[name])
+                if not values:
+                    continue
+                errors = sum(n for status, n in self.statuses[name].items() if status >= 400 and status != 304)
+                results[name] = {
+                    'requests': len(values),
+                    'errors': errors,
+                    'status_counts': {str(k): v for k, v in sorted(self.statuses[name].items())},
+                    'requests_per_sec': len(values) / elapsed,
+                    'mean_ms': sum(values) / len(values),
+                    'p50_ms': percentile(values, 50),
+                    'p95_ms': percentile(values, 95),
+                    'p99_ms': percentile(values, 99),
+                    'max_ms': values[-1]
+                }
+        return results
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+class Client:
+    """One simulated user with its own cookie jar and dashboard ETag"""
+
+    def __init__(self, base_url, index, recorder):
+        self.base_url = base_url
+        self.index = index
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.etag = None
+        self.session_ids = []
+
+    def request(self, endpoint, method, path, body=None, content_type='application/json', headers=None):
+        data = json.dumps(body).encode() if content_type == 'application/json' and body is not None else body
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=dict(headers or {}))
+        if data is not None:
+            req.add_header('Content-Type', content_type)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                status, payload, response_headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, payload, response_headers = e.code, e.read(), e.headers
+        if endpoint:
+            self.recorder.record(endpoint, status, time.perf_counter() - started)
+        return status, payload, response_headers
+
+    def log_in(self):
+        email = f'bench{self.index}@example.com'
+        status, _, _ = self.request(None, 'POST', '/api/auth/login', {'email': email, 'password': PASSWORD})
+        if status != 200:
+            status, _, _ = self.request(None, 'POST', '/api/auth/signup',
+                                        {'name': f'Bench User {self.index}', 'email': email, 'password': PASSWORD})
+        if status not in (200, 201):
+            raise RuntimeError(f'client {self.index} could not log in (HTTP {status})')
+
+    def poll_dashboard(self):
+        headers = {'If-None-Match': f'"{self.etag}"'} if self.etag else None
+        status, _, response_headers = self.request('dashboard_stats', 'GET', '/api/dashboard/stats', headers=headers)
+        if status == 200:
+            self.etag = (response_headers.get('ETag') or '').strip('"') or None
+
+    def run_session(self, frames, args, rng, deadline):
+        status, payload, _ = self.request('start_tracking', 'POST', '/api/tracking/start', {'mode': rng.choice(MODES)})
+        if status != 201:
+            return
+        session_id = json.loads(payload)['session_id']
+        offset = rng.randrange(len(frames)) if frames else 0
+        for i in range(args.frames_per_session):
+            if time.monotonic() >= deadline:
+                break
+            if frames:
+                self.request('process_frame', 'POST', '/api/tracking/process-frame',
+                             frames[(offset + i) % len(frames)], content_type='image/jpeg')
+            if (i + 1) % args.poll_every == 0:
+                self.poll_dashboard()
+            if args.frame_interval_ms:
+                time.sleep(args.frame_interval_ms / 1000.0)
+        if self.session_ids:
+            self.request('session_details', 'GET', f'/api/dashboard/session/{rng.choice(self.session_ids)}')
+        self.request('stop_tracking', 'POST', '/api/tracking/stop', {})
+        self.session_ids.append(session_id)
+
+    def load_history(self):
+        """Past session ids to read details of; seeded ones come back in the dashboard payload"""
+        status, payload, _ = self.request(None, 'GET', '/api/dashboard/stats')
+        if status == 200:
+            self.session_ids = [s['id'] for s in json.loads(payload).get('recent_sessions', []) if 'id' in s]
+
+
+def run_load(base_url, frames, args):
+    recorder = Recorder()
+    clients = [Client(base_url, i % args.users if args.users else i, recorder) for i in range(args.clients)]
+    for client in clients:
+        client.log_in()
+        client.load_history()
+
+    deadline = time.monotonic() + args.duration
+    errors = []
+
+    def drive(client, seed):
+        rng = random.Random(seed)
+        try:
+            while time.monotonic() < deadline:
+                client.run_session(frames, args, rng, deadline)
+        except Exception as e:
+            errors.append(f'client {client.index}: {e}')
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=drive, args=(client, n)) for n, client in enumerate(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    for error in errors:
+        print(f"Warning: {error}")
+    return recorder.summary(elapsed), elapsed
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'endpoint':<18}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<18}{r['requests']:>10}{r['errors']:>8}{r['requests_per_sec']:>9.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+
+
+def print_comparison(baseline, results):
+    """Relative change of each endpoint against a previous --json run (negative latency change is better)"""
+    print(f"\nChange vs baseline ({baseline.get('git_revision') or 'unknown revision'}, {baseline.get('created_at')}):")
+    print(f"{'endpoint':<18}{'req/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, r in results.items():
+        base = baseline.get('endpoints', {}).get(name)
+        if not base:
+            continue
+
+        def change(key):
+            return f"{(r[key] / base[key] - 1) * 100:+.1f}%" if base[key] else '-'
+        print(f"{name:<18}{change('requests_per_sec'):>10}{change('p50_ms'):>9}{change('p95_ms'):>9}{change('p99_ms'):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='benchmark a running server instead of serving the app in-process')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent simulated tracking sessions')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--frames-per-session', type=int, default=60)
+    parser.add_argument('--frame-interval-ms', type=float, default=0, help='pause between frames; 0 sends back to back')
+    parser.add_argument('--poll-every', type=int, default=10, help='dashboard poll every N frames')
+    parser.add_argument('--no-frames', action='store_true', help='skip process_frame, e.g. without a model')
+    parser.add_argument('--frame-size', default='640x480')
+    parser.add_argument('--jpeg-quality', type=int, default=80)
+    parser.add_argument('--users', type=int, default=50, help='seeded users (in-process mode)')
+    parser.add_argument('--history', type=int, default=100, help='seeded completed sessions per user')
+    parser.add_argument('--detections', type=int, default=40, help='seeded detections per session')
+    parser.add_argument('--warmup-timeout', type=float, default=300, help='seconds to wait for the model')
+    parser.add_argument('--json', help='write machine-readable results to this file')
+    parser.add_argument('--compare', help='print the change against a previous --json file')
+    args = parser.parse_args()
+
+    frames = []
+    if not args.no_frames:
+        width, height = (int(v) for v in args.frame_size.lower().split('x'))
+        frames = synthetic_frames(64, width, height, args.jpeg_quality)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            db_path = os.path.join(tmp, 'bench.db')
+            print(f"Seeding {args.users} users x {args.history} sessions x {args.detections} detections...")
+            seed_database(db_path, args.users, args.history, args.detections)
+            server, base_url = serve_in_process(db_path, args)
+
+        print(f"Running {args.clients} clients for {args.duration:.0f}s against {base_url}")
+        results, elapsed = run_load(base_url, frames, args)
+        if server:
+            server.shutdown()
+
+    print_results(results)
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': vars(args),
+        'elapsed_seconds': elapsed,
+        'endpoints': results
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
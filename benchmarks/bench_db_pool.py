@@ -0,0 +1,137 @@
+"""Compare request throughput of connect-per-call SQLite access against the pooled connections
+
+Usage: python benchmarks/bench_db_pool.py [--threads 8] [--requests 2000] [--sessions 200]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import ConnectionPool
+
+SCHEMA_SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'aibsfms.db')
+
+
+def create_database(path, sessions, detections_per_session):
+    """Create a database with the app schema and some seeded rows"""
+    source = sqlite3.connect(SCHEMA_SOURCE)
+    schema = [row[0] for row in source.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )]
+    source.close()
+
+    conn = sqlite3.connect(path)
+    for statement in schema:
+        conn.execute(statement)
+    conn.execute("INSERT INTO users (name, email, password_hash) VALUES ('bench', 'bench@example.com', 'x')")
+    conn.execute('INSERT INTO user_statistics (user_id) VALUES (1)')
+    for _ in range(sessions):
+        session_id = conn.execute(
+            "INSERT INTO tracking_sessions (user_id, tracking_mode) VALUES (1, 'cooking')"
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO food_detections (session_id, item_name, confidence, detection_type) VALUES (?, ?, ?, 'yolo')",
+            [(session_id, 'apple', 0.9)] * detections_per_session
+        )
+    conn.commit()
+    conn.close()
+
+
+def connect_per_call(path):
+    def get_db():
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return get_db
+
+
+def simulated_request(get_db, session_id):
+    """Roughly what one frame request plus one dashboard poll does against SQLite"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT ts.user_id, ts.tracking_mode FROM tracking_sessions ts WHERE ts.id = ?', (session_id,))
+    cursor.fetchone()
+    cursor.execute(
+        "INSERT INTO food_detections (session_id, item_name, confidence, detection_type) VALUES (?, 'apple', 0.9, 'yolo')",
+        (session_id,)
+    )
+    conn.commit()
+    conn.close()
+
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM user_statistics WHERE user_id = ?', (1,))
+    cursor.fetchone()
+    cursor.execute('''
+        SELECT id, tracking_mode, start_time, end_time, status
+        FROM tracking_sessions WHERE user_id = ? ORDER BY start_time DESC LIMIT 10
+    ''', (1,))
+    [dict(row) for row in cursor.fetchall()]
+    conn.close()
+
+
+def run(get_db, threads, requests, sessions):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = requests // threads
+
+    def worker(offset):
+        local = []
+        for i in range(per_thread):
+            started = time.perf_counter()
+            simulated_request(get_db, (offset + i) % sessions + 1)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i * per_thread,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--detections', type=int, default=50, help='seeded detections per session')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline_path = os.path.join(tmp, 'baseline.db')
+        pooled_path = os.path.join(tmp, 'pooled.db')
+        create_database(baseline_path, args.sessions, args.detections)
+        create_database(pooled_path, args.sessions, args.detections)
+
+        baseline = run(connect_per_call(baseline_path), args.threads, args.requests, args.sessions)
+
+        pool = ConnectionPool(pooled_path, max_idle=args.threads)
+        pooled = run(pool.acquire, args.threads, args.requests, args.sessions)
+        pool.close_all()
+
+    print(f"{'mode':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, result in (('connect-per-call', baseline), ('pooled', pooled)):
+        print(f"{name:<18}{result['requests_per_sec']:>10.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+    print(f"speedup: {pooled['requests_per_sec'] / baseline['requests_per_sec']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Compare latency and detection agreement of the CPU inference backends
+
+The torch backend is the reference. For every other backend the harness reports how many
+reference detections above the confidence cutoff it finds again (same class, IoU >= 0.5)
+and exits non-zero when that recall is below --min-recall.
+
+Usage: python benchmarks/compare_backends.py [--images DIR] [--backends onnx,openvino] [--runs 20]
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_backends import BACKENDS, load_backend
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def load_images(directory):
+    import cv2
+
+    if directory is None:
+        from ultralytics.utils import ASSETS
+        directory = str(ASSETS)
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(directory, pattern)))
+    images = [cv2.imread(path) for path in paths]
+    return [image for image in images if image is not None]
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def matched(reference, candidate, conf, min_iou):
+    """Count reference detections above conf that the candidate also reports above conf"""
+    expected = [d for d in reference if d.confidence > conf]
+    remaining = [d for d in candidate if d.confidence > conf]
+    found = 0
+    for ref in expected:
+        best = max(
+            (d for d in remaining if d.class_id == ref.class_id),
+            key=lambda d: iou(ref.box, d.box),
+            default=None
+        )
+        if best is not None and iou(ref.box, best.box) >= min_iou:
+            remaining.remove(best)
+            found += 1
+    return found, len(expected), len(remaining)
+
+
+def benchmark(predict, images, runs):
+    """Per-image latency in ms over all runs, plus the detections of the last run"""
+    predict(images[:1])
+    latencies = []
+    detections = None
+    for _ in range(runs):
+        detections = []
+        for image in images:
+            started = time.perf_counter()
+            detections.extend(predict([image]))
+            latencies.append((time.perf_counter() - started) * 1000.0)
+    return latencies, detections
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.environ.get('AIBSFMS_MODEL_PATH', 'yolov8n.pt'))
+    parser.add_argument('--images', help='directory of test images (default: ultralytics sample assets)')
+    parser.add_argument('--backends', default=','.join(BACKENDS[1:]),
+                        help='comma-separated backends to compare against torch')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--conf', type=float, default=0.5, help='confidence cutoff used by process_frame')
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--min-recall', type=float, default=0.95)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        parser.error('no images found')
+
+    names = ['torch'] + [b for b in args.backends.split(',') if b and b != 'torch']
+    results = {}
+    reference = None
+    for name in names:
+        predict, _ = load_backend(name, args.model)
+        latencies, detections = benchmark(predict, images, args.runs)
+        result = {
+            'mean_ms': statistics.mean(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95)
+        }
+        if reference is None:
+            reference = detections
+        else:
+            found = expected = extra = 0
+            for ref_frame, frame in zip(reference, detections):
+                f, e, x = matched(ref_frame, frame, args.conf, args.iou)
+                found, expected, extra = found + f, expected + e, extra + x
+            result.update({
+                'reference_detections': expected,
+                'matched': found,
+                'extra': extra,
+                'recall': (found / expected) if expected else 1.0
+            })
+        results[name] = result
+
+    base = results['torch']['mean_ms']
+    print(f"{len(images)} images x {args.runs} runs, detections above conf {args.conf}")
+    print(f"{'backend':<15}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>9}{'recall':>9}{'extra':>7}")
+    failed = []
+    for name, result in results.items():
+        recall = result.get('recall')
+        print(f"{name:<15}{result['mean_ms']:>10.1f}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+              f"{base / result['mean_ms']:>8.2f}x"
+              f"{'-' if recall is None else f'{recall:.3f}':>9}{result.get('extra', '-'):>7}")
+        if recall is not None and recall < args.min_recall:
+            failed.append(name)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'images': len(images), 'runs': args.runs, 'conf': args.conf, 'backends': results}, f, indent=2)
+
+    if failed:
+        print(f"Recall below {args.min_recall} for: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class DashboardCache:
+    """Per-user cache of serialized dashboard payloads with ETags
+
+    Entries are dropped when the user's data changes (invalidate), when they are older
+    than ttl seconds, or when the cache holds more than max_entries users.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+
+        self._entries = OrderedDict()
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._not_modified = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def make_etag(body):
+        return hashlib.sha1(body).hexdigest()
+
+    def get(self, user_id):
+        """Return (body, etag) for a fresh entry, or None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry['stored_at'] > self.ttl:
+                if entry is not None:
+                    del self._entries[user_id]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self._hits += 1
+            return entry['body'], entry['etag']
+
+    def put(self, user_id, body, version):
+        """Store a payload built while the user's data was at the given version; returns its ETag"""
+        etag = self.make_etag(body)
+        with self._lock:
+            # A write that landed while the payload was being built makes it stale already
+            if version != self._version(user_id):
+                return etag
+            self._entries[user_id] = {
+                'body': body,
+                'etag': etag,
+                'stored_at': time.monotonic(),
+                'version': version
+            }
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+    def version(self, user_id):
+        """Current data version for a user; read it before building a payload to pass to put()"""
+        with self._lock:
+            return self._version(user_id)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+                self._versions.move_to_end(user_id)
+                if self._entries.pop(user_id, None) is not None:
+                    self._invalidations += 1
+            # Version counters only matter while a payload may be in flight; keep them bounded
+            while len(self._versions) > self.max_entries * 4:
+                self._versions.popitem(last=False)
+
+    def record_not_modified(self):
+        with self._lock:
+            self._not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'not_modified': self._not_modified,
+                'invalidations': self._invalidations,
+                'hit_ratio': (self._hits / lookups) if lookups else 0
+            }
+
+    def _version(self, user_id):
+        return self._versions.get(user_id, 0)
@@ -0,0 +1,313 @@
+"""Streaming export of tracking sessions and detections as NDJSON, CSV or Parquet
+
+Rows are read in pages with keyset pagination (WHERE key > last key ORDER BY key LIMIT n),
+so each page is an index range scan whatever the export's offset. Each page runs on a
+freshly acquired connection that is handed back before the page is yielded on, so a long
+download never holds a connection or a read snapshot. Memory use is one page plus
+whatever the output format buffers (one row group for Parquet).
+
+CLI: python export.py detections --format csv [--user 3] [--start 2026-09-01] [--end ...] > out.csv
+"""
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import os
+import sqlite3
+import sys
+from datetime import timedelta
+
+from rollups import BUCKET_FORMAT, parse_moment
+
+SESSION_COLUMNS = ('id', 'user_id', 'tracking_mode', 'start_time', 'end_time', 'status')
+
+DETECTION_COLUMNS = (
+    'id', 'session_id', 'user_id', 'tracking_mode', 'item_name', 'quantity', 'confidence',
+    'detection_type', 'timestamp', 'track_id', 'first_seen', 'last_seen', 'frame_count', 'image_path'
+)
+
+EXPORT_COLUMNS = {
+    'sessions': SESSION_COLUMNS,
+    'detections': DETECTION_COLUMNS
+}
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+DEFAULT_PAGE_SIZE = 5000
+
+# Parquet row groups; each is built in memory before it is written out
+PARQUET_ROW_GROUP = 50000
+
+# Column types in Parquet output; everything else (names, timestamps as stored) is a string
+PARQUET_INTEGERS = frozenset(('id', 'user_id', 'session_id', 'track_id', 'frame_count'))
+PARQUET_FLOATS = frozenset(('quantity', 'confidence'))
+
+
+def parquet_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def parse_bounds(start=None, end=None):
+    """start/end filters (UTC ISO dates or timestamps) in the stored timestamp format
+
+    A date-only end includes that whole day. Raises ValueError for unparseable bounds.
+    """
+    bounds = []
+    for value, name in ((start, 'start'), (end, 'end')):
+        if not value:
+            bounds.append(None)
+            continue
+        moment, date_only = parse_moment(value, name)
+        if date_only and name == 'end':
+            moment += timedelta(days=1)
+        bounds.append(moment.strftime(BUCKET_FORMAT))
+    if bounds[0] and bounds[1] and bounds[0] >= bounds[1]:
+        raise ValueError("'start' must be before 'end'")
+    return tuple(bounds)
+
+
+def _fetch(connect, sql, params):
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def iter_sessions(connect, user_id=None, session_id=None, start=None, end=None, page_size=DEFAULT_PAGE_SIZE,
+                  archive_dir=None):
+    """Yield session rows, one page at a time; filters are optional
+
+    start/end (UTC timestamps) keep the sessions that overlap [start, end). Sessions are
+    never archived, so archive_dir is accepted only for symmetry with iter_detections.
+    """
+    params = {'user_id': user_id, 'start': start, 'end': end, 'limit': page_size}
+    if session_id is not None:
+        params['session_id'] = session_id
+        yield from _fetch(connect, '''
+            SELECT id, user_id, tracking_mode, start_time, end_time, status
+            FROM tracking_sessions
+            WHERE id = :session_id AND user_id = COALESCE(:user_id, user_id)
+        ''', params)
+        return
+
+    if user_id is None:
+        # Every user's sessions, in id order
+        params['after_id'] = 0
+        while True:
+            rows = _fetch(connect, '''
+                SELECT id, user_id, tracking_mode, start_time, end_time, status
+                FROM tracking_sessions
+                WHERE id > :after_id
+                AND (:end IS NULL OR start_time < :end)
+                AND (:start IS NULL OR end_time IS NULL OR end_time >= :start)
+                ORDER BY id
+                LIMIT :limit
+            ''', params)
+            yield from rows
+            if len(rows) < page_size:
+                return
+            params['after_id'] = rows[-1]['id']
+
+    # One user's sessions, in start time order along idx_tracking_sessions_user_start
+    params['after_time'], params['after_id'] = '', 0
+    while True:
+        rows = _fetch(connect, '''
+            SELECT id, user_id, tracking_mode, start_time, end_time, status
+            FROM tracking_sessions
+            WHERE user_id = :user_id AND (start_time, id) > (:after_time, :after_id)
+            AND (:end IS NULL OR start_time < :end)
+            AND (:start IS NULL OR end_time IS NULL OR end_time >= :start)
+            ORDER BY start_time, id
+            LIMIT :limit
+        ''', params)
+        yield from rows
+        if len(rows) < page_size:
+            return
+        params['after_time'], params['after_id'] = rows[-1]['start_time'], rows[-1]['id']
+
+
+def iter_detections(connect, user_id=None, session_id=None, start=None, end=None, page_size=DEFAULT_PAGE_SIZE,
+                    archive_dir=None):
+    """Yield detection rows with their session's user and mode, session by session in id order
+
+    With archive_dir, rows moved out of the database by retention come first, in date order.
+    """
+    if archive_dir:
+        from retention import iter_archived
+        yield from iter_archived(archive_dir, 'food_detections', start, end, batch_size=page_size,
+                                 user_id=user_id, session_id=session_id)
+
+    for tracking_session in iter_sessions(connect, user_id, session_id, start, end, page_size):
+        params = {
+            'session_id': tracking_session['id'],
+            'after_id': 0,
+            'start': start,
+            'end': end,
+            'limit': page_size
+        }
+        while True:
+            rows = _fetch(connect, '''
+                SELECT id, session_id, item_name, quantity, confidence, detection_type, timestamp,
+                    track_id, first_seen, last_seen, frame_count, image_path
+                FROM food_detections
+                WHERE session_id = :session_id AND id > :after_id
+                AND (:start IS NULL OR timestamp >= :start)
+                AND (:end IS NULL OR timestamp < :end)
+                ORDER BY id
+                LIMIT :limit
+            ''', params)
+            for row in rows:
+                row['user_id'] = tracking_session['user_id']
+                row['tracking_mode'] = tracking_session['tracking_mode']
+                yield row
+            if len(rows) < page_size:
+                break
+            params['after_id'] = rows[-1]['id']
+
+
+ITERATORS = {
+    'sessions': iter_sessions,
+    'detections': iter_detections
+}
+
+
+def ndjson_chunks(rows, columns):
+    for row in rows:
+        yield json.dumps({name: row.get(name) for name in columns}, separators=(',', ':')) + '\n'
+
+
+def csv_chunks(rows, columns, rows_per_chunk=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow([row.get(name) for name in columns])
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects what pyarrow writes until it is drained"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def parquet_schema(columns):
+    import pyarrow as pa
+    return pa.schema([
+        (name, pa.int64() if name in PARQUET_INTEGERS else pa.float64() if name in PARQUET_FLOATS else pa.string())
+        for name in columns
+    ])
+
+
+def parquet_chunks(rows, columns, row_group=PARQUET_ROW_GROUP):
+    """Parquet file bytes, one row group at a time (requires pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        batch = {name: [] for name in columns}
+        count = 0
+        for row in rows:
+            for name in columns:
+                batch[name].append(row.get(name))
+            count += 1
+            if count >= row_group:
+                writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+                batch = {name: [] for name in columns}
+                count = 0
+                yield sink.drain()
+        if count:
+            writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+WRITERS = {
+    'ndjson': ndjson_chunks,
+    'csv': csv_chunks,
+    'parquet': parquet_chunks
+}
+
+
+def export_chunks(connect, kind, fmt, **filters):
+    """Encoded output of an export, as an iterator of str (ndjson, csv) or bytes (parquet) chunks"""
+    columns = EXPORT_COLUMNS[kind]
+    return WRITERS[fmt](ITERATORS[kind](connect, **filters), columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export sessions or detections to stdout or a file')
+    parser.add_argument('kind', choices=sorted(EXPORT_COLUMNS))
+    parser.add_argument('--db', default=os.environ.get('AIBSFMS_DB_PATH', 'aibsfms.db'))
+    parser.add_argument('--format', default='ndjson', choices=sorted(FORMATS))
+    parser.add_argument('--user', type=int, default=None, help='only this user (default: everyone)')
+    parser.add_argument('--session', type=int, default=None, help='only this tracking session')
+    parser.add_argument('--start', default=None, help='UTC date or timestamp, inclusive')
+    parser.add_argument('--end', default=None, help='UTC timestamp, exclusive (a date includes that day)')
+    parser.add_argument('--archive-dir', default=os.environ.get('AIBSFMS_ARCHIVE_DIR', 'archive'),
+                        help='also read rows moved here by retention')
+    parser.add_argument('--output', '-o', default=None, help='file to write (default: stdout)')
+    args = parser.parse_args(argv)
+
+    if args.format == 'parquet' and not parquet_available():
+        print('Parquet export requires pyarrow', file=sys.stderr)
+        return 2
+    try:
+        start, end = parse_bounds(args.start, args.end)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    chunks = export_chunks(
+        lambda: sqlite3.connect(args.db), args.kind, args.format,
+        user_id=args.user, session_id=args.session, start=start, end=end,
+        archive_dir=args.archive_dir if os.path.isdir(args.archive_dir) else None
+    )
+    binary = args.format == 'parquet'
+    if args.output:
+        out = open(args.output, 'wb' if binary else 'w', newline='' if not binary else None)
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Content-addressed storage of the frames behind detections
+
+put() hashes a frame on the calling thread and returns its path right away; the file is
+written by background threads, so a request never waits for the disk. Frames are stored
+once per content hash at <root>/<h[:2]>/<h[2:4]>/<h>.jpg, optionally re-encoded or
+shrunk to a thumbnail first. When the queue is full the frame is not stored and put()
+returns None; it never blocks.
+
+The store is kept under max_bytes by deleting the least recently stored or reused
+frames. Rows that pointed at an evicted frame keep its path, and readers treat the file
+as missing.
+"""
+import hashlib
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+_SHUTDOWN = object()
+
+
+def frame_path(digest):
+    """Path of a frame relative to the store root, sharded by the first bytes of its hash"""
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+
+
+class FrameStore:
+    """Deduplicating frame files written by a pool of background threads
+
+    Raw JPEG bytes are written as sent unless thumbnail_side or jpeg_quality is set, in
+    which case they are decoded and re-encoded on the background threads. Decoded images
+    (numpy arrays) are always encoded there, at jpeg_quality or 90.
+    """
+
+    def __init__(self, root, workers=2, max_queue=64, max_bytes=2 * 1024 ** 3, thumbnail_side=None,
+                 jpeg_quality=None, evict_to=0.9):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.thumbnail_side = int(thumbnail_side) if thumbnail_side else None
+        self.jpeg_quality = int(jpeg_quality) if jpeg_quality else None
+        # Eviction frees space down to this fraction of max_bytes, so it does not run on every write
+        self.evict_to = float(evict_to)
+
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        # digest -> file size, least recently stored or reused first
+        self._index = OrderedDict()
+        self._pending = set()
+        self._bytes = 0
+        self._closed = False
+
+        self._stored = 0
+        self._deduplicated = 0
+        self._dropped = 0
+        self._failed = 0
+        self._evicted = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._threads = [threading.Thread(target=self._scan, name='frame-store-scan', daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._run, name=f'frame-store-{i}', daemon=True)
+            for i in range(max(1, int(workers)))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, frame):
+        """Queue a frame (JPEG bytes or a decoded BGR image) for storage; returns its path or None if dropped"""
+        if self._closed:
+            return None
+        data = memoryview(frame).cast('B') if not isinstance(frame, (bytes, bytearray)) else frame
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with self._lock:
+            if digest in self._index:
+                self._index.move_to_end(digest)
+                self._deduplicated += 1
+                return frame_path(digest)
+            if digest in self._pending:
+                self._deduplicated += 1
+                return frame_path(digest)
+            self._pending.add(digest)
+        try:
+            self._queue.put_nowait((digest, frame))
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(digest)
+                self._dropped += 1
+            return None
+        return frame_path(digest)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'queued': self._queue.qsize(),
+                'stored': self._stored,
+                'deduplicated': self._deduplicated,
+                'dropped': self._dropped,
+                'failed': self._failed,
+                'evicted': self._evicted
+            }
+
+    def close(self, timeout=10):
+        """Write what is still queued, then stop the threads"""
+        self._closed = True
+        for _ in self._threads[1:]:
+            self._queue.put(_SHUTDOWN)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def _encode(self, frame):
+        """Bytes to write for a frame: as sent, or re-encoded / thumbnailed"""
+        is_jpeg = isinstance(frame, (bytes, bytearray))
+        if is_jpeg and not self.thumbnail_side and not self.jpeg_quality:
+            return bytes(frame)
+
+        import cv2
+        import numpy as np
+        image = frame
+        if is_jpeg:
+            image = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError('Frame is not a decodable image')
+        if self.thumbnail_side:
+            height, width = image.shape[:2]
+            ratio = self.thumbnail_side / max(width, height)
+            if ratio < 1:
+                image = cv2.resize(image, (max(1, round(width * ratio)), max(1, round(height * ratio))),
+                                   interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality or 90])
+        if not ok:
+            raise ValueError('Frame could not be encoded')
+        return encoded.tobytes()
+
+    def _write(self, digest, frame):
+        path = os.path.join(self.root, frame_path(digest))
+        data = self._encode(frame)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return len(data)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _SHUTDOWN:
+                return
+            digest, frame = item
+            try:
+                size = self._write(digest, frame)
+            except Exception as e:
+                print(f"Frame store error: {e}")
+                with self._lock:
+                    self._pending.discard(digest)
+                    self._failed += 1
+                continue
+            with self._lock:
+                self._pending.discard(digest)
+                if digest not in self._index:
+                    self._bytes += size
+                self._index[digest] = size
+                self._stored += 1
+            self._evict()
+
+    def _evict(self):
+        """Delete the least recently used frames once the store is over max_bytes"""
+        victims = []
+        with self._lock:
+            if self._bytes <= self.max_bytes:
+                return
+            target = self.max_bytes * self.evict_to
+            while self._index and self._bytes > target:
+                digest, size = self._index.popitem(last=False)
+                self._bytes -= size
+                victims.append(digest)
+            self._evicted += len(victims)
+        for digest in victims:
+            try:
+                os.remove(os.path.join(self.root, frame_path(digest)))
+            except OSError:
+                pass
+
+    def _scan(self):
+        """Index the frames already on disk, oldest first, so they count towards max_bytes and deduplicate"""
+        found = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith('.jpg'):
+                    continue
+                try:
+                    info = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                found.append((info.st_mtime, name[:-4], info.st_size))
+        found.sort()
+        with self._lock:
+            # Frames stored since startup are newer than anything found on disk
+            newer = self._index
+            self._index = OrderedDict((digest, size) for _, digest, size in found if digest not in newer)
+            self._bytes = sum(self._index.values()) + sum(newer.values())
+            self._index.update(newer)
+        self._evict()
@@ -0,0 +1,126 @@
+import base64
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+import cv2
+import numpy as np
+
+# Content types accepted as a raw JPEG request body
+RAW_FRAME_TYPES = ('image/jpeg', 'image/jpg', 'application/octet-stream')
+
+
+def decode_jpeg(buffer):
+    """Decode JPEG bytes (bytes, bytearray or memoryview) into a BGR frame without copying the input"""
+    if not buffer:
+        return None
+    nparr = np.frombuffer(buffer, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def decode_data_url(image_data, decode=decode_jpeg):
+    """Decode a legacy 'data:image/jpeg;base64,...' string into a BGR frame"""
+    if not image_data:
+        return None
+    _, _, encoded = image_data.partition(',')
+    return decode(base64.b64decode(encoded or image_data))
+
+
+def frame_from_request(req, timer=None, decode=decode_jpeg):
+    """Extract and decode the frame from a raw JPEG, multipart or JSON upload
+
+    decode(buffer) turns the JPEG bytes into the frame, e.g. a preprocessor's reduced
+    decode. With a metrics.RequestTimer, reading the body, base64 decoding and JPEG
+    decoding are timed as separate stages.
+    """
+    stage = timer.stage if timer is not None else (lambda name: nullcontext())
+    content_type = (req.mimetype or '').lower()
+
+    with stage('read_body'):
+        # Raw JPEG body: decode straight from the request buffer
+        if content_type in RAW_FRAME_TYPES:
+            buffer = req.get_data(cache=False)
+        # Multipart upload: read the uploaded file part directly
+        elif content_type == 'multipart/form-data':
+            upload = req.files.get('frame') or req.files.get('image')
+            if upload is None:
+                return None
+            buffer = upload.read()
+        # Legacy base64 JSON body
+        else:
+            image_data = (req.get_json(silent=True) or {}).get('image')
+            if not image_data:
+                return None
+            buffer = None
+
+    if buffer is None:
+        with stage('base64_decode'):
+            _, _, encoded = image_data.partition(',')
+            buffer = base64.b64decode(encoded or image_data)
+
+    with stage('jpeg_decode'):
+        return decode(buffer)
+
+
+class SceneChangeGate:
+    """Skips inference for frames that are nearly identical to the last frame inferred in a session"""
+
+    def __init__(self, threshold=4.0, size=32, max_skips=30, max_sessions=1024):
+        # threshold is the mean absolute difference (0-255) of the downscaled grayscale frames
+        self.threshold = float(threshold)
+        self.size = int(size)
+        # Re-run the model after this many consecutive skips so the cache never goes stale forever
+        self.max_skips = int(max_skips)
+        self.max_sessions = int(max_sessions)
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._checks = 0
+        self._skipped = 0
+
+    def signature(self, frame):
+        """Cheap fingerprint of a frame: a tiny grayscale thumbnail"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (self.size, self.size), interpolation=cv2.INTER_AREA)
+
+    def lookup(self, session_id, signature):
+        """Return the cached payload if the scene has not changed, otherwise None"""
+        with self._lock:
+            self._checks += 1
+            state = self._sessions.get(session_id)
+            if state is None:
+                return None
+            self._sessions.move_to_end(session_id)
+
+            if state['skips'] >= self.max_skips:
+                return None
+            if cv2.absdiff(signature, state['signature']).mean() > self.threshold:
+                return None
+
+            state['skips'] += 1
+            self._skipped += 1
+            return state['payload']
+
+    def store(self, session_id, signature, payload):
+        """Remember the frame that was actually inferred and its result"""
+        with self._lock:
+            self._sessions[session_id] = {'signature': signature, 'payload': payload, 'skips': 0}
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threshold': self.threshold,
+                'max_skips': self.max_skips,
+                'sessions': len(self._sessions),
+                'frames_checked': self._checks,
+                'frames_skipped': self._skipped,
+                'frames_inferred': self._checks - self._skipped,
+                'skip_ratio': (self._skipped / self._checks) if self._checks else 0
+            }
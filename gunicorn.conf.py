@@ -0,0 +1,42 @@
+"""Production launch configuration: gunicorn -c gunicorn.conf.py wsgi:app
+
+One worker process owns the model, the batch scheduler, the journal and the dashboard cache,
+so scale inference with AIBSFMS_INFERENCE_WORKERS (model subprocesses) rather than with more
+gunicorn workers. Async mode does not free request threads: a request waiting on the frame or
+database executor still holds its thread, the executors only cap how many run at once. So the
+thread pool is sized for every thread that can be held at the same time: full executors, the
+long-lived streams (each video job, export and /api/tracking/stream WebSocket holds one thread
+for its whole lifetime), and headroom for the light routes (auth, health, cached dashboard polls).
+"""
+import os
+
+# The app reads its configuration from the environment when it is imported in the worker
+os.environ.setdefault('AIBSFMS_SERVING_MODE', 'async')
+
+bind = os.environ.get('AIBSFMS_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('AIBSFMS_GUNICORN_WORKERS', 1))
+worker_class = 'gthread'
+
+# Threads that can be waiting on each executor
+_frame_slots = int(os.environ.get('AIBSFMS_FRAME_EXECUTOR_WORKERS', 8)) + int(os.environ.get('AIBSFMS_FRAME_EXECUTOR_QUEUE', 16))
+_db_slots = int(os.environ.get('AIBSFMS_DB_EXECUTOR_WORKERS', 4)) + int(os.environ.get('AIBSFMS_DB_EXECUTOR_QUEUE', 32))
+# Threads held for a whole response: video jobs, exports and open WebSockets
+_stream_slots = (
+    int(os.environ.get('AIBSFMS_VIDEO_MAX_JOBS', 2))
+    + int(os.environ.get('AIBSFMS_EXPORT_MAX_JOBS', 2))
+    + int(os.environ.get('AIBSFMS_EXPECTED_STREAMS', 16))
+)
+threads = int(os.environ.get(
+    'AIBSFMS_GUNICORN_THREADS',
+    _frame_slots + _db_slots + _stream_slots + int(os.environ.get('AIBSFMS_LIGHT_THREADS', 16))
+))
+
+# Model warm-up and the journal writer start threads at import; they must start in the worker, not the master
+preload_app = False
+timeout = int(os.environ.get('AIBSFMS_GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get('AIBSFMS_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('AIBSFMS_LOG_LEVEL', 'info')
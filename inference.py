@@ -0,0 +1,260 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+# Detection structure returned by every inference path; box is (x1, y1, x2, y2) in frame pixels
+Detection = namedtuple('Detection', ['class_id', 'name', 'confidence', 'box'])
+
+
+def detections_from_result(result, names):
+    """Convert one ultralytics Results object into a list of Detection"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return []
+    classes = boxes.cls.tolist()
+    confidences = boxes.conf.tolist()
+    coords = boxes.xyxy.tolist()
+    return [
+        Detection(int(cls), names[int(cls)], float(conf), tuple(box))
+        for cls, conf, box in zip(classes, confidences, coords)
+    ]
+
+
+def yolo_predictor(model, imgsz=None, classes=None, conf=None):
+    """Batch predict function for an in-process ultralytics model
+
+    classes restricts the model to those class ids, so other classes are dropped before
+    NMS; conf is the confidence floor below which boxes are never returned.
+    """
+    options = {'verbose': False}
+    if imgsz:
+        options['imgsz'] = imgsz
+    if classes is not None:
+        options['classes'] = list(classes)
+    if conf is not None:
+        options['conf'] = conf
+
+    def predict(frames):
+        results = model(frames, **options)
+        return [detections_from_result(result, model.names) for result in results]
+    return predict
+
+
+class QueueFull(Exception):
+    """Raised by submit() when the inference queue already holds max_queue frames"""
+
+
+class FrameTooLarge(ValueError):
+    """Raised by submit() for a frame bigger than the model backend accepts (max_frame_bytes)"""
+
+
+class FrameDropped(Exception):
+    """Set on a queued frame's future when it is dropped without being inferred
+
+    reason is 'superseded' (a newer frame from the same source replaced it) or 'expired'
+    (it waited longer than max_age_ms and its result would be stale).
+    """
+
+    def __init__(self, reason):
+        super().__init__(f'Frame dropped: {reason}')
+        self.reason = reason
+
+
+class BatchInferenceScheduler:
+    """Collects frames from concurrent requests and runs them through the model as one batch
+
+    The queue is bounded by max_queue: submit() fails fast with QueueFull when it is full
+    (or waits for room with block=True). Frames submitted with a key (e.g. the tracking
+    session) replace any frame with the same key still waiting, so a camera that sends
+    faster than the model keeps up only ever has its newest frame queued. Keyed frames
+    that waited longer than max_age_ms are dropped instead of inferred; unkeyed ones (e.g.
+    sampled video frames) are never stale. Frames over max_frame_bytes (e.g. a worker pool's
+    shared memory slot) are refused one by one with FrameTooLarge, so they can never fail a
+    batch shared with other requests.
+    """
+
+    def __init__(self, predict, max_batch=8, max_wait_ms=10, concurrency=1, max_queue=None, max_age_ms=None,
+                 max_frame_bytes=None):
+        # predict takes a list of frames and returns one result per frame, in order
+        self.predict = predict
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = int(max_queue) if max_queue else None
+        self.max_age = float(max_age_ms) / 1000.0 if max_age_ms else None
+        self.max_frame_bytes = int(max_frame_bytes) if max_frame_bytes else None
+
+        # (frame, future, submitted, key)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._running = True
+
+        self._batches_run = 0
+        self._frames_processed = 0
+        self._frames_rejected = 0
+        self._frames_superseded = 0
+        self._frames_expired = 0
+        self._total_wait = 0.0
+        self._total_infer = 0.0
+
+        # One dispatcher thread per batch that may be in flight at once (e.g. one per worker process)
+        self.concurrency = max(1, int(concurrency))
+        self._workers = [
+            threading.Thread(target=self._run, name=f'batch-inference-{i}', daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, frame, key=None, block=False, timeout=None):
+        """Queue a frame for the next batch and return a Future for its result"""
+        if self.max_frame_bytes and frame.nbytes > self.max_frame_bytes:
+            with self._cond:
+                self._frames_rejected += 1
+            raise FrameTooLarge(f'Frame of {frame.nbytes} bytes is over the {self.max_frame_bytes} byte limit')
+        future = Future()
+        superseded = []
+        with self._cond:
+            if not self._running:
+                raise RuntimeError('Inference scheduler is shut down')
+            if key is not None:
+                kept = []
+                for item in self._pending:
+                    (superseded if item[3] == key else kept).append(item)
+                if superseded:
+                    self._pending = kept
+                    self._frames_superseded += len(superseded)
+            if self.max_queue and len(self._pending) >= self.max_queue:
+                if not block or not self._cond.wait_for(
+                    lambda: len(self._pending) < self.max_queue or not self._running, timeout
+                ):
+                    self._frames_rejected += 1
+                    raise QueueFull(f'Inference queue is full ({self.max_queue} frames)')
+                if not self._running:
+                    raise RuntimeError('Inference scheduler is shut down')
+            self._pending.append((frame, future, time.monotonic(), key))
+            self._cond.notify_all()
+        for item in superseded:
+            item[1].set_exception(FrameDropped('superseded'))
+        return future
+
+    def infer(self, frame, timeout=None, key=None):
+        """Run a single frame through the batcher and wait for its result"""
+        return self.submit(frame, key=key).result(timeout=timeout)
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def drain_estimate(self):
+        """Seconds until the frames queued now have been inferred, from the recent batch times"""
+        with self._cond:
+            depth = len(self._pending)
+            per_batch = (self._total_infer / self._batches_run) if self._batches_run else 0.0
+        return per_batch * (depth / float(self.max_batch * self.concurrency) + 1)
+
+    def stats(self):
+        with self._cond:
+            batches = self._batches_run
+            frames = self._frames_processed
+            return {
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'concurrency': self.concurrency,
+                'max_queue': self.max_queue,
+                'max_age_ms': self.max_age * 1000.0 if self.max_age else None,
+                'queue_depth': len(self._pending),
+                'batches_run': batches,
+                'frames_processed': frames,
+                'frames_rejected': self._frames_rejected,
+                'frames_superseded': self._frames_superseded,
+                'frames_expired': self._frames_expired,
+                'avg_batch_size': (frames / batches) if batches else 0,
+                'avg_queue_wait_ms': (self._total_wait / frames * 1000.0) if frames else 0,
+                'avg_batch_infer_ms': (self._total_infer / batches * 1000.0) if batches else 0
+            }
+
+    def shutdown(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=5)
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._pending:
+                    return [], []
+
+                # Wait for the batch to fill up, but never hold the oldest frame past max_wait
+                deadline = self._pending[0][2] + self.max_wait
+                while self._running and len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                # Another dispatcher thread may have taken the frames in the meantime
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                # Room in the queue for blocked submitters
+                self._cond.notify_all()
+
+                expired = []
+                if self.max_age is not None:
+                    # One pass on age; frames are arrays, so items must never be compared with ==
+                    now = time.monotonic()
+                    kept = []
+                    for item in batch:
+                        stale = item[3] is not None and now - item[2] > self.max_age
+                        (expired if stale else kept).append(item)
+                    batch = kept
+                    self._frames_expired += len(expired)
+                if batch or expired:
+                    return batch, expired
+
+    def _run(self):
+        while True:
+            batch, expired = [], []
+            try:
+                batch, expired = self._next_batch()
+                if not self._dispatch(batch, expired):
+                    return
+            except Exception as e:
+                # Never let one bad batch stop the dispatcher: fail its frames and carry on
+                print(f"Batch inference error: {e}")
+                for item in batch + expired:
+                    if not item[1].done():
+                        item[1].set_exception(e)
+
+    def _dispatch(self, batch, expired):
+        """Infer one batch and resolve its futures; returns False once the scheduler is shut down"""
+        for item in expired:
+            item[1].set_exception(FrameDropped('expired'))
+        if not batch:
+            return bool(expired)
+
+        started = time.monotonic()
+        frames = [item[0] for item in batch]
+        try:
+            results = list(self.predict(frames))
+            if len(results) != len(frames):
+                raise RuntimeError(f'Model returned {len(results)} results for {len(frames)} frames')
+        except Exception as e:
+            for item in batch:
+                item[1].set_exception(e)
+            return True
+        finished = time.monotonic()
+
+        for item, result in zip(batch, results):
+            item[1].set_result(result)
+
+        with self._cond:
+            self._batches_run += 1
+            self._frames_processed += len(batch)
+            self._total_infer += finished - started
+            self._total_wait += sum(started - item[2] for item in batch)
+        return True
@@ -0,0 +1,106 @@
+"""CPU inference backends for the YOLO detector
+
+Every backend is built by load_backend(name, model_path) and returns a batch predict
+function with the same output: one list of inference.Detection per frame. Exported models
+are written next to the .pt file on first use and reused afterwards.
+
+    torch          ultralytics/PyTorch eager inference on the .pt weights
+    onnx           ONNX export run by ONNX Runtime
+    onnx-int8      ONNX export with dynamically quantized int8 weights, run by ONNX Runtime
+    openvino       OpenVINO IR export run by the OpenVINO runtime
+    openvino-int8  OpenVINO IR export with int8 post-training quantization
+"""
+import glob
+import os
+
+from inference import yolo_predictor
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8', 'openvino', 'openvino-int8')
+
+
+def _export(model_path, expected, imgsz, **export_args):
+    """Export the .pt model once; later calls reuse the exported file or directory"""
+    if os.path.exists(expected):
+        return expected
+    from ultralytics import YOLO
+    print(f"Exporting {model_path} ({export_args.get('format')}{', int8' if export_args.get('int8') else ''})...")
+    # dynamic=True keeps the batch dimension open so the scheduler can send whole batches
+    exported = YOLO(model_path).export(imgsz=imgsz, dynamic=True, **export_args)
+    return str(exported)
+
+
+def export_model(name, model_path, imgsz=640):
+    """Return the path of the model file/directory the named backend runs"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}' (choose from {', '.join(BACKENDS)})")
+
+    stem = os.path.splitext(model_path)[0]
+    if name == 'torch':
+        return model_path
+    if name == 'onnx':
+        return _export(model_path, f'{stem}.onnx', imgsz, format='onnx')
+    if name == 'onnx-int8':
+        quantized = f'{stem}.int8.onnx'
+        if not os.path.exists(quantized):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            source = _export(model_path, f'{stem}.onnx', imgsz, format='onnx')
+            quantize_dynamic(source, quantized, weight_type=QuantType.QUInt8)
+        return quantized
+    if name == 'openvino':
+        return _export(model_path, f'{stem}_openvino_model', imgsz, format='openvino')
+    return _export(model_path, f'{stem}_int8_openvino_model', imgsz, format='openvino', int8=True)
+
+
+def limit_threads(model, name, path, threads, imgsz=640):
+    """Cap the intra-op threads of a loaded backend, e.g. to the cores a worker is pinned to
+
+    torch takes a process-wide setting. ONNX Runtime and OpenVINO take it per session, and
+    ultralytics builds that session on the first call without a way to pass options, so the
+    session is built once and then replaced by one with the thread count set.
+    """
+    if name == 'torch':
+        try:
+            import torch
+        except ImportError:
+            return
+        torch.set_num_threads(threads)
+        return
+
+    import numpy as np
+    model([np.zeros((imgsz, imgsz, 3), dtype=np.uint8)], imgsz=imgsz, verbose=False)
+    backend = getattr(model.predictor, 'model', None)
+    if name.startswith('onnx') and hasattr(backend, 'session'):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        backend.session = onnxruntime.InferenceSession(
+            path, sess_options=options, providers=backend.session.get_providers()
+        )
+    elif name.startswith('openvino') and hasattr(backend, 'ov_compiled_model'):
+        import openvino as ov
+        core = ov.Core()
+        hint = backend.ov_compiled_model.get_property('PERFORMANCE_HINT')
+        xml = glob.glob(os.path.join(path, '*.xml'))[0]
+        backend.ov_compiled_model = core.compile_model(
+            core.read_model(xml), 'CPU', {'INFERENCE_NUM_THREADS': threads, 'PERFORMANCE_HINT': str(hint)}
+        )
+    else:
+        print(f"Warning: cannot set the thread count of the {name} backend; relying on CPU affinity")
+
+
+def load_backend(name, model_path, imgsz=640, taxonomy=None, conf=None, threads=None):
+    """Load the named backend and return (predict, class names)
+
+    With a taxonomy.FoodTaxonomy the model only considers the taxonomy's classes. conf
+    is the confidence floor passed to the model (defaults to the ultralytics default).
+    threads caps the runtime's intra-op threads (default: the runtime's own choice).
+    """
+    from ultralytics import YOLO
+
+    path = export_model(name, model_path, imgsz=imgsz)
+    model = YOLO(path, task='detect')
+    if threads:
+        limit_threads(model, name, path, int(threads), imgsz=imgsz)
+    classes = taxonomy.resolve(model.names).class_ids if taxonomy is not None else None
+    return yolo_predictor(model, imgsz=imgsz, classes=classes, conf=conf), model.names
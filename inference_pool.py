@@ -0,0 +1,419 @@
+"""Multi-process inference workers with shared-memory frame hand-off
+
+Each worker is a separate Python process that loads the model backend once and can be pinned to
+its own set of CPU cores. The parent copies frames into shared memory slots owned by the
+worker, so only small JSON messages (slot numbers, shapes and detections) cross the pipes.
+Crashed or unresponsive workers are restarted by a monitor thread.
+
+Run as a script, this module is the worker process itself.
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from inference import Detection
+
+
+def parse_cpu_sets(spec, workers):
+    """Turn '0-3;4-7' into one core set per worker; 'auto' splits the available cores evenly"""
+    if not spec:
+        return [None] * workers
+
+    if spec == 'auto':
+        if hasattr(os, 'sched_getaffinity'):
+            available = sorted(os.sched_getaffinity(0))
+        else:
+            available = list(range(os.cpu_count() or 1))
+        per_worker = max(1, len(available) // workers)
+        sets = []
+        for i in range(workers):
+            start = (i * per_worker) % len(available)
+            sets.append(set(available[start:start + per_worker]))
+        return sets
+
+    sets = []
+    for group in spec.split(';'):
+        cores = set()
+        for part in group.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                start, end = part.split('-')
+                cores.update(range(int(start), int(end) + 1))
+            else:
+                cores.add(int(part))
+        sets.append(cores)
+    # Reuse the listed sets round-robin if there are more workers than groups
+    return [sets[i % len(sets)] for i in range(workers)]
+
+
+class _Worker:
+    """Parent-side handle for one worker process"""
+
+    def __init__(self, index, cpus, slots, slot_bytes):
+        self.index = index
+        self.cpus = cpus
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.free_slots = list(range(slots))
+        self.inflight = {}
+        self.names = None
+        self.proc = None
+        self.task_pipe = None
+        self.write_lock = threading.Lock()
+        self.ready = False
+        self.alive = False
+        self.restart_at = 0.0
+        self.last_pong = 0.0
+        self.tasks_done = 0
+        self.restarts = 0
+
+    def frame_view(self, slot, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def send(self, message):
+        with self.write_lock:
+            self.task_pipe.write(json.dumps(message) + '\n')
+            self.task_pipe.flush()
+
+
+class InferenceWorkerPool:
+    """Pool of model worker processes fed through shared memory"""
+
+    def __init__(self, model_path, workers=2, cpu_sets=None, slots_per_worker=16,
+                 max_frame_bytes=1920 * 1080 * 3, health_interval=5, task_timeout=60, backend='torch', imgsz=640,
+                 taxonomy=None, conf=None):
+        self.model_path = model_path
+        self.backend = backend
+        self.imgsz = int(imgsz)
+        # taxonomy.FoodTaxonomy restricting the workers' model call, and its confidence floor
+        self.taxonomy = taxonomy
+        self.conf = conf
+        self.slots_per_worker = max(1, int(slots_per_worker))
+        self.max_frame_bytes = int(max_frame_bytes)
+        self.health_interval = float(health_interval)
+        self.task_timeout = float(task_timeout)
+
+        cpu_sets = cpu_sets or [None] * workers
+        self._cond = threading.Condition()
+        self._closing = False
+        self._task_ids = itertools.count(1)
+        self._workers = [
+            _Worker(i, cpu_sets[i], self.slots_per_worker, self.max_frame_bytes)
+            for i in range(max(1, int(workers)))
+        ]
+        for worker in self._workers:
+            self._start(worker)
+
+        self._monitor = threading.Thread(target=self._monitor_loop, name='inference-pool-monitor', daemon=True)
+        self._monitor.start()
+
+    @property
+    def size(self):
+        return len(self._workers)
+
+    @property
+    def names(self):
+        for worker in self._workers:
+            if worker.names:
+                return worker.names
+        return None
+
+    def wait_ready(self, timeout=None):
+        """Block until at least one worker has loaded the model"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not any(w.ready for w in self._workers):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def predict(self, frames):
+        """Run a batch of frames on one worker and return a list of detections per frame"""
+        return self.submit(frames).result(timeout=self.task_timeout)
+
+    def submit(self, frames):
+        for frame in frames:
+            if frame.dtype != np.uint8 or frame.nbytes > self.max_frame_bytes:
+                raise ValueError('Frame does not fit in a shared memory slot')
+        if len(frames) > self.slots_per_worker:
+            raise ValueError('Batch is larger than the slots available per worker')
+
+        future = Future()
+        task_id = next(self._task_ids)
+        deadline = time.monotonic() + self.task_timeout
+        with self._cond:
+            while True:
+                if self._closing:
+                    raise RuntimeError('Inference pool is closed')
+                candidates = [
+                    w for w in self._workers
+                    if w.ready and len(w.free_slots) >= len(frames)
+                ]
+                if candidates:
+                    worker = min(candidates, key=lambda w: len(w.inflight))
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError('No inference worker available')
+                self._cond.wait(remaining)
+
+            slots = [worker.free_slots.pop() for _ in frames]
+            worker.inflight[task_id] = (future, slots)
+
+        # Copy each frame straight into its slot; the worker reads it in place
+        items = []
+        for slot, frame in zip(slots, frames):
+            worker.frame_view(slot, frame.shape)[...] = frame
+            items.append([slot, list(frame.shape)])
+
+        try:
+            worker.send({'type': 'infer', 'id': task_id, 'items': items})
+        except (OSError, ValueError) as e:
+            self._finish(worker, task_id, error=RuntimeError(f'Inference worker {worker.index} unavailable: {e}'))
+        return future
+
+    def health(self):
+        now = time.monotonic()
+        with self._cond:
+            return [
+                {
+                    'worker': w.index,
+                    'pid': w.proc.pid if w.proc else None,
+                    'alive': w.alive,
+                    'ready': w.ready,
+                    'cpus': sorted(w.cpus) if w.cpus else None,
+                    'inflight': len(w.inflight),
+                    'free_slots': len(w.free_slots),
+                    'tasks_done': w.tasks_done,
+                    'restarts': w.restarts,
+                    'last_pong_age_s': (now - w.last_pong) if w.last_pong else None
+                }
+                for w in self._workers
+            ]
+
+    def close(self):
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify_all()
+
+        for worker in self._workers:
+            try:
+                worker.send({'type': 'stop'})
+            except (OSError, ValueError, AttributeError):
+                pass
+        for worker in self._workers:
+            if worker.proc:
+                try:
+                    worker.proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    worker.proc.kill()
+            worker.shm.close()
+            worker.shm.unlink()
+
+    def _start(self, worker):
+        task_r, task_w = os.pipe()
+        result_r, result_w = os.pipe()
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            '--model', self.model_path,
+            '--backend', self.backend,
+            '--imgsz', str(self.imgsz),
+            '--shm', worker.shm.name,
+            '--slot-bytes', str(worker.slot_bytes),
+            '--task-fd', str(task_r),
+            '--result-fd', str(result_w)
+        ]
+        if self.taxonomy is not None:
+            command += ['--taxonomy', json.dumps(self.taxonomy.to_config())]
+        if self.conf is not None:
+            command += ['--conf', str(self.conf)]
+        if worker.cpus:
+            command += ['--cpus', ','.join(str(c) for c in sorted(worker.cpus))]
+
+        worker.proc = subprocess.Popen(command, pass_fds=(task_r, result_w), cwd=os.path.dirname(os.path.abspath(__file__)))
+        os.close(task_r)
+        os.close(result_w)
+        worker.task_pipe = os.fdopen(task_w, 'w')
+        worker.alive = True
+        worker.ready = False
+        worker.last_pong = 0.0
+
+        reader = threading.Thread(
+            target=self._read_results, args=(worker, os.fdopen(result_r, 'r')),
+            name=f'inference-worker-{worker.index}-reader', daemon=True
+        )
+        reader.start()
+
+    def _read_results(self, worker, pipe):
+        with pipe:
+            for line in pipe:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                kind = message.get('type')
+                if kind == 'ready':
+                    with self._cond:
+                        worker.names = {int(k): v for k, v in message['names'].items()}
+                        worker.ready = True
+                        worker.last_pong = time.monotonic()
+                        self._cond.notify_all()
+                    print(f"Inference worker {worker.index} ready (pid {message.get('pid')})")
+                elif kind == 'pong':
+                    worker.last_pong = time.monotonic()
+                elif kind == 'result':
+                    names = worker.names or {}
+                    detections = [
+                        [Detection(int(d[0]), names.get(int(d[0]), str(d[0])), float(d[1]), tuple(d[2:6])) for d in frame]
+                        for frame in message['detections']
+                    ]
+                    self._finish(worker, message['id'], result=detections)
+                elif kind == 'error':
+                    self._finish(worker, message['id'], error=RuntimeError(message.get('error')))
+
+        # EOF: the worker exited or crashed; fail its in-flight batches and let the monitor restart it
+        with self._cond:
+            # Back off between restarts so a worker that cannot load the model does not spin
+            worker.restart_at = time.monotonic() + min(60.0, self.health_interval * 2 ** min(worker.restarts, 4))
+            worker.alive = False
+            worker.ready = False
+            failed = list(worker.inflight.items())
+            worker.inflight.clear()
+            worker.free_slots = list(range(self.slots_per_worker))
+            self._cond.notify_all()
+        for _, (future, _) in failed:
+            future.set_exception(RuntimeError(f'Inference worker {worker.index} crashed'))
+        if not self._closing:
+            print(f"Warning: inference worker {worker.index} exited with code {worker.proc.wait()}")
+
+    def _finish(self, worker, task_id, result=None, error=None):
+        with self._cond:
+            entry = worker.inflight.pop(task_id, None)
+            if entry is None:
+                return
+            future, slots = entry
+            worker.free_slots.extend(slots)
+            worker.tasks_done += 1
+            self._cond.notify_all()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _monitor_loop(self):
+        while not self._closing:
+            time.sleep(self.health_interval)
+            now = time.monotonic()
+            for worker in self._workers:
+                if self._closing:
+                    return
+                if not worker.alive:
+                    # Restart crashed workers; the shared memory segment is reused
+                    if worker.proc and worker.proc.poll() is None or now < worker.restart_at:
+                        continue
+                    worker.restarts += 1
+                    print(f"Restarting inference worker {worker.index}")
+                    self._start(worker)
+                    continue
+
+                if worker.ready:
+                    # Kill workers that stop answering pings; the reader thread then fails their batches
+                    if now - worker.last_pong > self.health_interval * 3 + self.task_timeout:
+                        print(f"Warning: inference worker {worker.index} unresponsive, killing it")
+                        worker.proc.kill()
+                        continue
+                    try:
+                        worker.send({'type': 'ping'})
+                    except (OSError, ValueError):
+                        pass
+
+
+def worker_main(argv=None):
+    """Entry point of a worker process: load the model once, then serve batches from shared memory"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True)
+    parser.add_argument('--backend', default='torch')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--shm', required=True)
+    parser.add_argument('--slot-bytes', type=int, required=True)
+    parser.add_argument('--task-fd', type=int, required=True)
+    parser.add_argument('--result-fd', type=int, required=True)
+    parser.add_argument('--cpus', default='')
+    parser.add_argument('--taxonomy', default=None, help='food taxonomy as JSON')
+    parser.add_argument('--conf', type=float, default=None)
+    args = parser.parse_args(argv)
+
+    cpus = [int(c) for c in args.cpus.split(',') if c]
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+    # The parent owns the segment; stop this process's resource tracker from unlinking it on exit
+    shm = shared_memory.SharedMemory(name=args.shm)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+
+    results = os.fdopen(args.result_fd, 'w')
+
+    def send(message):
+        results.write(json.dumps(message) + '\n')
+        results.flush()
+
+    from inference_backends import load_backend
+    taxonomy = None
+    if args.taxonomy:
+        from taxonomy import FoodTaxonomy
+        config = json.loads(args.taxonomy)
+        taxonomy = FoodTaxonomy(config['classes'], config.get('default_threshold', 0.5))
+    # One runtime thread per pinned core, whichever backend runs the model
+    predict, names = load_backend(args.backend, args.model, imgsz=args.imgsz, taxonomy=taxonomy, conf=args.conf,
+                                  threads=len(cpus) or None)
+    send({'type': 'ready', 'pid': os.getpid(), 'names': {str(k): v for k, v in names.items()}})
+
+    with os.fdopen(args.task_fd, 'r') as tasks:
+        for line in tasks:
+            message = json.loads(line)
+            kind = message.get('type')
+            if kind == 'stop':
+                break
+            if kind == 'ping':
+                send({'type': 'pong'})
+                continue
+            if kind != 'infer':
+                continue
+
+            frames = None
+            try:
+                frames = [
+                    np.ndarray(tuple(shape), dtype=np.uint8, buffer=shm.buf, offset=slot * args.slot_bytes)
+                    for slot, shape in message['items']
+                ]
+                detections = [
+                    [[d.class_id, d.confidence, *d.box] for d in frame_detections]
+                    for frame_detections in predict(frames)
+                ]
+                send({'type': 'result', 'id': message['id'], 'detections': detections})
+            except Exception as e:
+                send({'type': 'error', 'id': message['id'], 'error': str(e)})
+            finally:
+                # Views into the segment must be gone before it can be closed
+                frames = None
+
+    shm.close()
+
+
+if __name__ == '__main__':
+    worker_main()
@@ -0,0 +1,246 @@
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+# Row kinds the journal knows how to write, and the statement used to flush each of them
+JOURNAL_STATEMENTS = {
+    'detection': '''
+        INSERT INTO food_detections
+        (session_id, item_name, confidence, detection_type, timestamp, image_path)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''',
+    'tracked_item': '''
+        INSERT INTO food_detections
+        (session_id, item_name, quantity, confidence, detection_type, timestamp,
+         track_id, first_seen, last_seen, frame_count, image_path)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''',
+    'suggestion': '''
+        INSERT INTO ai_suggestions (user_id, session_id, suggestion_text, category, timestamp)
+        VALUES (?, ?, ?, ?, ?)
+    '''
+}
+
+# Durability modes map onto SQLite's synchronous setting for the journal connection
+DURABILITY_MODES = {
+    'off': 'OFF',
+    'normal': 'NORMAL',
+    'full': 'FULL'
+}
+
+_SHUTDOWN = object()
+
+
+def db_timestamp(epoch=None):
+    """UTC time (now, or the given epoch seconds) in the same format SQLite uses for CURRENT_TIMESTAMP"""
+    moment = datetime.now(timezone.utc) if epoch is None else datetime.fromtimestamp(epoch, timezone.utc)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class WriteBehindJournal:
+    """Buffers rows from request threads and writes them to SQLite in batched transactions
+
+    A flush that fails with sqlite3.OperationalError (e.g. 'database is locked' while
+    retention or a manage.py command holds the write lock) is retried up to max_retries
+    times with a doubling backoff. Any other error writes the batch row by row instead, so
+    one bad row only loses itself.
+    """
+
+    def __init__(self, connect, flush_interval_ms=200, batch_size=500, max_queue=10000,
+                 durability='normal', enqueue_timeout_ms=50, on_flush=None, max_retries=5, retry_backoff_ms=100):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f'Unknown durability mode: {durability}')
+
+        # connect() returns a new SQLite connection owned by the writer thread
+        self.connect = connect
+        self.flush_interval = max(0.001, float(flush_interval_ms) / 1000.0)
+        self.batch_size = max(1, int(batch_size))
+        self.durability = durability
+        self.enqueue_timeout = max(0.0, float(enqueue_timeout_ms) / 1000.0)
+        self.max_retries = max(0, int(max_retries))
+        self.retry_backoff = max(0.0, float(retry_backoff_ms) / 1000.0)
+        # on_flush(user_ids) is called after each commit with the owners of the rows written
+        self.on_flush = on_flush
+
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self._enqueued = 0
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._retries = 0
+        self._flushes = 0
+        self._last_flush_ms = 0.0
+
+        self._writer = threading.Thread(target=self._run, name='write-behind-journal', daemon=True)
+        self._writer.start()
+
+    def append(self, kind, row, owner=None):
+        """Queue a row for the next flush; returns False if the queue stayed full and the row was dropped"""
+        if kind not in JOURNAL_STATEMENTS:
+            raise ValueError(f'Unknown journal row kind: {kind}')
+        if self._closed:
+            raise RuntimeError('Journal is closed')
+        try:
+            self._queue.put((kind, row, owner), timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            print(f"Journal queue full - dropped {kind} row")
+            return False
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    def add_detection(self, session_id, item_name, confidence, detection_type='yolo', user_id=None, image_path=None):
+        return self.append(
+            'detection', (session_id, item_name, confidence, detection_type, db_timestamp(), image_path), owner=user_id
+        )
+
+    def add_tracked_item(self, session_id, track, detection_type='tracked', user_id=None):
+        """One consolidated row for a tracking.Track: counted once, with its peak confidence"""
+        first_seen = db_timestamp(track.first_seen)
+        return self.append('tracked_item', (
+            session_id, track.name, 1, track.peak_confidence, detection_type, first_seen,
+            track.track_id, first_seen, db_timestamp(track.last_seen), track.frames, track.image_path
+        ), owner=user_id)
+
+    def add_suggestion(self, user_id, session_id, text, category):
+        return self.append('suggestion', (user_id, session_id, text, category, db_timestamp()), owner=user_id)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'durability': self.durability,
+                'flush_interval_ms': self.flush_interval * 1000.0,
+                'batch_size': self.batch_size,
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'rows_enqueued': self._enqueued,
+                'rows_written': self._written,
+                'rows_dropped': self._dropped,
+                'rows_failed': self._failed,
+                'flush_retries': self._retries,
+                'flushes': self._flushes,
+                'last_flush_ms': self._last_flush_ms
+            }
+
+    def close(self, timeout=10):
+        """Flush everything still queued and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_SHUTDOWN)
+        self._writer.join(timeout=timeout)
+
+    def _connect(self):
+        conn = self.connect()
+        conn.execute(f'PRAGMA synchronous = {DURABILITY_MODES[self.durability]}')
+        return conn
+
+    def _collect(self):
+        """Block for the first row, then gather more until the batch is full or the interval ends"""
+        first = self._queue.get()
+        if first is _SHUTDOWN:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _SHUTDOWN:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, conn, batch):
+        """Insert a batch in one transaction, retrying while another writer holds the lock"""
+        grouped = {}
+        for kind, row, _ in batch:
+            grouped.setdefault(kind, []).append(row)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with conn:
+                    for kind, rows in grouped.items():
+                        conn.executemany(JOURNAL_STATEMENTS[kind], rows)
+                return
+            except sqlite3.OperationalError:
+                if attempt == self.max_retries:
+                    raise
+                with self._lock:
+                    self._retries += 1
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def _flush(self, conn, batch):
+        started = time.monotonic()
+        try:
+            self._write(conn, batch)
+            written = batch
+        except sqlite3.OperationalError as e:
+            print(f"Journal flush error after {self.max_retries} retries: {e}")
+            with self._lock:
+                self._failed += len(batch)
+            return
+        except Exception as e:
+            print(f"Journal flush error: {e} - writing the rows one by one")
+            written = []
+            for item in batch:
+                try:
+                    self._write(conn, [item])
+                except Exception as e:
+                    print(f"Journal row error ({item[0]}): {e}")
+                    continue
+                written.append(item)
+            with self._lock:
+                self._failed += len(batch) - len(written)
+            if not written:
+                return
+
+        owners = {owner for _, _, owner in written if owner is not None}
+        with self._lock:
+            self._written += len(written)
+            self._flushes += 1
+            self._last_flush_ms = (time.monotonic() - started) * 1000.0
+
+        if self.on_flush and owners:
+            try:
+                self.on_flush(owners)
+            except Exception as e:
+                print(f"Journal flush callback error: {e}")
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch, shutting_down = self._collect()
+                if batch:
+                    self._flush(conn, batch)
+                if shutting_down:
+                    # Drain whatever arrived before close() was called
+                    remaining = []
+                    while True:
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is not _SHUTDOWN:
+                            remaining.append(item)
+                    for i in range(0, len(remaining), self.batch_size):
+                        self._flush(conn, remaining[i:i + self.batch_size])
+                    return
+        finally:
+            conn.close()
@@ -0,0 +1,190 @@
+"""Maintenance commands for the AiBSFMS database
+
+Usage:
+    python manage.py migrate [--db PATH] [--target VERSION]
+    python manage.py check-query-plans [--db PATH] [FILE ...]
+    python manage.py reconcile-stats [--db PATH] [--dry-run]
+    python manage.py backfill-rollups [--db PATH] [--since DATE]
+    python manage.py archive [--db PATH] [--archive-dir DIR] [--detections-days N] [--suggestions-days N]
+    python manage.py vacuum [--db PATH] [--enable-incremental] [--pages N]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from migrations import migrate, current_version
+from query_plans import collect_queries, full_scans
+from user_stats import reconcile_user_statistics
+from rollups import backfill_rollups
+from journal import db_timestamp
+from retention import archive_available, archive_table, incremental_vacuum
+
+DEFAULT_DB = os.environ.get('AIBSFMS_DB_PATH', 'aibsfms.db')
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def cmd_migrate(args):
+    conn = connect(args.db)
+    before = current_version(conn)
+    applied = migrate(conn, target=args.target)
+    conn.close()
+    if applied:
+        print(f"Schema upgraded from version {before} to {applied[-1]}")
+    else:
+        print(f"Schema already at version {before}")
+    return 0
+
+
+def cmd_check_query_plans(args):
+    files = args.files or ['backend.py']
+
+    # Check against a fresh database at the latest schema unless one is given
+    if args.db:
+        conn = connect(args.db)
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        conn = connect(os.path.join(tmp.name, 'plans.db'))
+        migrate(conn)
+
+    failures = 0
+    checked = 0
+    for path in files:
+        for line, sql in collect_queries(path):
+            checked += 1
+            try:
+                scans = full_scans(conn, sql)
+            except sqlite3.Error as e:
+                failures += 1
+                print(f"{path}:{line}: cannot explain query ({e})\n    {sql}")
+                continue
+            if scans:
+                failures += 1
+                print(f"{path}:{line}: full table scan ({'; '.join(scans)})\n    {sql}")
+    conn.close()
+
+    print(f"Checked {checked} queries, {failures} failed")
+    return 1 if failures else 0
+
+
+def cmd_reconcile_stats(args):
+    conn = connect(args.db)
+    drift = reconcile_user_statistics(conn, fix=not args.dry_run)
+    conn.close()
+
+    for entry in drift:
+        if entry.get('missing'):
+            print(f"user {entry['user_id']}: no statistics row")
+        else:
+            print(
+                f"user {entry['user_id']}: sessions {entry['total_sessions']} -> {entry['expected_sessions']}, "
+                f"waste {entry['total_waste_kg']} -> {entry['expected_waste_kg']}"
+            )
+    action = 'found' if args.dry_run else 'fixed'
+    print(f"{len(drift)} user(s) with drifted statistics {action}")
+    return 1 if drift and args.dry_run else 0
+
+
+def cmd_backfill_rollups(args):
+    conn = connect(args.db)
+    try:
+        written, bound = backfill_rollups(conn, since=args.since)
+    except ValueError as e:
+        print(e)
+        return 2
+    finally:
+        conn.close()
+
+    scope = f"from {bound} on" if bound else 'from all stored rows'
+    print(f"Rebuilt {written} rollup row(s) {scope}")
+    return 0
+
+
+def cmd_archive(args):
+    if not archive_available():
+        print("Archiving requires pyarrow")
+        return 2
+
+    policies = {'food_detections': args.detections_days, 'ai_suggestions': args.suggestions_days}
+    for table, days in policies.items():
+        if not days:
+            continue
+        cutoff = db_timestamp(time.time() - days * 86400)
+        rows, files = archive_table(lambda: connect(args.db), args.archive_dir, table, cutoff)
+        print(f"{table}: archived {rows} row(s) older than {cutoff} into {files} file(s)")
+    return 0
+
+
+def cmd_vacuum(args):
+    conn = connect(args.db)
+    try:
+        if args.enable_incremental:
+            # Switching an existing database to incremental auto-vacuum takes one full VACUUM
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            print("Incremental auto-vacuum enabled")
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            print("Database does not use incremental auto-vacuum; run with --enable-incremental once")
+            return 1
+        pages = incremental_vacuum(conn, max_pages=args.pages)
+    finally:
+        conn.close()
+    print(f"Returned {pages} free page(s) to the filesystem")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AiBSFMS maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('migrate', help='upgrade the database schema in place')
+    p.add_argument('--db', default=DEFAULT_DB)
+    p.add_argument('--target', type=int, default=None, help='stop at this schema version')
+    p.set_defaults(func=cmd_migrate)
+
+    p = commands.add_parser('check-query-plans', help='fail if any query does a full table scan')
+    p.add_argument('--db', default=None, help='database to explain against (default: fresh schema)')
+    p.add_argument('files', nargs='*', help='source files to scan for queries (default: backend.py)')
+    p.set_defaults(func=cmd_check_query_plans)
+
+    p = commands.add_parser('reconcile-stats', help='rebuild user_statistics from scratch and report drift')
+    p.add_argument('--db', default=DEFAULT_DB)
+    p.add_argument('--dry-run', action='store_true', help='only report drift, do not rewrite the totals')
+    p.set_defaults(func=cmd_reconcile_stats)
+
+    p = commands.add_parser('backfill-rollups', help='rebuild the hour/day/week rollups from the raw rows')
+    p.add_argument('--db', default=DEFAULT_DB)
+    p.add_argument('--since', default=None, help='only rebuild buckets from the week of this UTC date on')
+    p.set_defaults(func=cmd_backfill_rollups)
+
+    p = commands.add_parser('archive', help='move old detections and suggestions to Parquet archive files')
+    p.add_argument('--db', default=DEFAULT_DB)
+    p.add_argument('--archive-dir', default=os.environ.get('AIBSFMS_ARCHIVE_DIR', 'archive'))
+    p.add_argument('--detections-days', type=int,
+                   default=int(os.environ.get('AIBSFMS_RETENTION_DETECTIONS_DAYS', 180)),
+                   help='archive detections older than this (0: keep all)')
+    p.add_argument('--suggestions-days', type=int,
+                   default=int(os.environ.get('AIBSFMS_RETENTION_SUGGESTIONS_DAYS', 90)),
+                   help='archive suggestions older than this (0: keep all)')
+    p.set_defaults(func=cmd_archive)
+
+    p = commands.add_parser('vacuum', help='return free pages to the filesystem')
+    p.add_argument('--db', default=DEFAULT_DB)
+    p.add_argument('--enable-incremental', action='store_true',
+                   help='switch the database to incremental auto-vacuum (one full VACUUM)')
+    p.add_argument('--pages', type=int, default=None, help='free at most this many pages')
+    p.set_defaults(func=cmd_vacuum)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Counters, histograms and per-request stage timers exposed in the Prometheus text format"""
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Seconds; covers a sub-millisecond cache hit up to a slow CPU inference batch
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_QUERY_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+(\w+)', re.IGNORECASE)
+
+timing_logger = logging.getLogger('aibsfms.timing')
+
+
+@lru_cache(maxsize=1024)
+def query_label(sql):
+    """Short, low-cardinality label for a statement, e.g. 'select tracking_sessions'"""
+    words = sql.split(None, 1)
+    if not words:
+        return 'other'
+    match = _QUERY_TABLE.search(sql)
+    return f'{words[0].lower()} {match.group(1)}' if match else words[0].lower()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count], sum
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, [("le", le)])} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+class Collected:
+    """Value read from a callback at scrape time, e.g. a queue depth from a component's stats()"""
+
+    def __init__(self, name, help, kind, read):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            value = None
+        if value is None:
+            return []
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}', f'{self.name} {value}']
+
+
+class MetricsRegistry:
+    """All metrics of the process, rendered together for /metrics"""
+
+    def __init__(self, prefix='aibsfms'):
+        self.prefix = prefix
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(f'{self.prefix}_{name}', help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(f'{self.prefix}_{name}', help, labels, buckets))
+
+    def gauge_from(self, name, help, read):
+        return self._register(Collected(f'{self.prefix}_{name}', help, 'gauge', read))
+
+    def counter_from(self, name, help, read):
+        return self._register(Collected(f'{self.prefix}_{name}', help, 'counter', read))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+
+class RequestTimer:
+    """Wall time of one request split into named stages
+
+    Stages that run more than once (e.g. several queries) accumulate. Time not covered by
+    any stage shows up as 'other' in the timing log.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.stages = OrderedDict()
+        self.fields = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def log(self, method, status, elapsed):
+        """Emit one structured timing line (JSON) for the request"""
+        stages_ms = {name: round(seconds * 1000.0, 3) for name, seconds in self.stages.items()}
+        stages_ms['other'] = round(max(0.0, elapsed * 1000.0 - sum(stages_ms.values())), 3)
+        timing_logger.info(json.dumps(dict(
+            self.fields,
+            endpoint=self.endpoint,
+            method=method,
+            status=status,
+            duration_ms=round(elapsed * 1000.0, 3),
+            stages_ms=stages_ms
+        ), separators=(',', ':')))
@@ -0,0 +1,451 @@
+"""Versioned schema migrations for the AiBSFMS database
+
+Each migration is a (version, description, statements) entry, where a statement is SQL or
+an (sql, parameters) pair. migrate() applies every migration newer than the version
+recorded in schema_migrations, one transaction per migration, so an existing aibsfms.db
+is upgraded in place.
+"""
+
+# Full recomputation of user_statistics; used to seed the incremental triggers and to reconcile drift
+RECOMPUTE_USER_STATISTICS = '''
+    UPDATE user_statistics
+    SET total_sessions = (
+            SELECT COUNT(*) FROM tracking_sessions ts
+            WHERE ts.user_id = user_statistics.user_id AND ts.status = 'completed'
+        ),
+        total_waste_kg = (
+            SELECT COALESCE(SUM(wt.quantity), 0)
+            FROM waste_tracking wt
+            JOIN tracking_sessions ts ON wt.session_id = ts.id
+            WHERE ts.user_id = user_statistics.user_id
+        ),
+        last_updated = CURRENT_TIMESTAMP
+'''
+
+# Start of the hour/day/week bucket a timestamp falls in; weeks start on Monday (UTC)
+ROLLUP_BUCKET = '''
+    CASE {granularity}
+        WHEN 'hour' THEN strftime('%Y-%m-%d %H:00:00', {column})
+        WHEN 'day' THEN strftime('%Y-%m-%d 00:00:00', {column})
+        ELSE strftime('%Y-%m-%d 00:00:00', {column}, 'weekday 0', '-6 days')
+    END
+'''
+
+ROLLUP_GRANULARITIES = "(SELECT 'hour' AS granularity UNION ALL SELECT 'day' UNION ALL SELECT 'week')"
+
+# Full rebuild of the rollups from the raw rows from `since` on (a bucket start; None for
+# everything); used to backfill the incremental triggers and by manage.py backfill-rollups
+REBUILD_ROLLUPS = [
+    'DELETE FROM detection_rollups WHERE bucket >= COALESCE(:since, bucket)',
+    '''
+    INSERT INTO detection_rollups (user_id, granularity, bucket, item_name, detections, quantity, confidence_sum)
+    SELECT ts.user_id, g.granularity, {bucket} AS bucket, fd.item_name,
+        COUNT(*), SUM(COALESCE(fd.quantity, 0)), SUM(COALESCE(fd.confidence, 0))
+    FROM food_detections fd
+    JOIN tracking_sessions ts ON fd.session_id = ts.id
+    CROSS JOIN {granularities} g
+    WHERE fd.timestamp >= COALESCE(:since, fd.timestamp)
+    GROUP BY ts.user_id, g.granularity, bucket, fd.item_name
+    '''.format(bucket=ROLLUP_BUCKET.format(granularity='g.granularity', column='fd.timestamp'),
+               granularities=ROLLUP_GRANULARITIES),
+    'DELETE FROM waste_rollups WHERE bucket >= COALESCE(:since, bucket)',
+    '''
+    INSERT INTO waste_rollups (user_id, granularity, bucket, waste_type, entries, quantity)
+    SELECT ts.user_id, g.granularity, {bucket} AS bucket, wt.waste_type,
+        COUNT(*), SUM(COALESCE(wt.quantity, 0))
+    FROM waste_tracking wt
+    JOIN tracking_sessions ts ON wt.session_id = ts.id
+    CROSS JOIN {granularities} g
+    WHERE wt.timestamp >= COALESCE(:since, wt.timestamp)
+    GROUP BY ts.user_id, g.granularity, bucket, wt.waste_type
+    '''.format(bucket=ROLLUP_BUCKET.format(granularity='g.granularity', column='wt.timestamp'),
+               granularities=ROLLUP_GRANULARITIES)
+]
+
+
+def _waste_rollup_delta(row, sign):
+    """Trigger statement adding (sign '+') or removing (sign '-') one waste row from its buckets"""
+    return '''
+            INSERT INTO waste_rollups (user_id, granularity, bucket, waste_type, entries, quantity)
+            SELECT ts.user_id, g.granularity, {bucket}, {row}.waste_type, {sign}1, {sign}COALESCE({row}.quantity, 0)
+            FROM tracking_sessions ts CROSS JOIN {granularities} g
+            WHERE ts.id = {row}.session_id
+            ON CONFLICT (user_id, granularity, bucket, waste_type) DO UPDATE
+            SET entries = entries + excluded.entries, quantity = quantity + excluded.quantity;
+    '''.format(
+        row=row, sign=sign, granularities=ROLLUP_GRANULARITIES,
+        bucket=ROLLUP_BUCKET.format(granularity='g.granularity', column=f'COALESCE({row}.timestamp, CURRENT_TIMESTAMP)')
+    )
+
+
+MIGRATIONS = [
+    (1, 'Initial schema', [
+        # Users table
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # User profiles table
+        '''
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            age INTEGER,
+            weight REAL,
+            height REAL,
+            dietary_preference TEXT,
+            goals TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        # Tracking sessions table
+        '''
+        CREATE TABLE IF NOT EXISTS tracking_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            tracking_mode TEXT NOT NULL,
+            start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_time TIMESTAMP,
+            status TEXT DEFAULT 'active',
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        # Food items detected table
+        '''
+        CREATE TABLE IF NOT EXISTS food_detections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            item_name TEXT NOT NULL,
+            quantity REAL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            detection_type TEXT,
+            confidence REAL,
+            image_path TEXT,
+            FOREIGN KEY (session_id) REFERENCES tracking_sessions (id)
+        )
+        ''',
+        # Waste tracking table
+        '''
+        CREATE TABLE IF NOT EXISTS waste_tracking (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            waste_type TEXT NOT NULL,
+            quantity REAL,
+            suggestions TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES tracking_sessions (id)
+        )
+        ''',
+        # AI suggestions table
+        '''
+        CREATE TABLE IF NOT EXISTS ai_suggestions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            session_id INTEGER,
+            suggestion_text TEXT NOT NULL,
+            category TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (session_id) REFERENCES tracking_sessions (id)
+        )
+        ''',
+        # Dashboard statistics table
+        '''
+        CREATE TABLE IF NOT EXISTS user_statistics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            total_sessions INTEGER DEFAULT 0,
+            total_waste_kg REAL DEFAULT 0,
+            total_food_consumed_kg REAL DEFAULT 0,
+            avg_waste_percentage REAL DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        '''
+    ]),
+    (2, 'Indexes for session, detection and dashboard lookups', [
+        # Recent sessions per user, and completed-session counts
+        'CREATE INDEX IF NOT EXISTS idx_tracking_sessions_user_start ON tracking_sessions (user_id, start_time)',
+        'CREATE INDEX IF NOT EXISTS idx_tracking_sessions_user_status ON tracking_sessions (user_id, status)',
+        # Session details and the recent-detections join, covering the dashboard columns
+        '''
+        CREATE INDEX IF NOT EXISTS idx_food_detections_session_time
+        ON food_detections (session_id, timestamp, item_name, quantity, confidence)
+        ''',
+        # Per-user waste totals grouped by type
+        '''
+        CREATE INDEX IF NOT EXISTS idx_waste_tracking_session_type
+        ON waste_tracking (session_id, waste_type, quantity)
+        ''',
+        # Latest suggestions per user
+        'CREATE INDEX IF NOT EXISTS idx_ai_suggestions_user_time ON ai_suggestions (user_id, timestamp)',
+        # One-row lookups by user
+        'CREATE INDEX IF NOT EXISTS idx_user_statistics_user ON user_statistics (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_user_profiles_user ON user_profiles (user_id)'
+    ]),
+    (3, 'Keep user_statistics current with triggers', [
+        # Completed sessions: count a session once when it first becomes completed
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_completed
+        AFTER UPDATE OF status ON tracking_sessions
+        WHEN NEW.status = 'completed' AND OLD.status IS NOT 'completed'
+        BEGIN
+            UPDATE user_statistics
+            SET total_sessions = total_sessions + 1, last_updated = CURRENT_TIMESTAMP
+            WHERE user_id = NEW.user_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_uncompleted
+        AFTER UPDATE OF status ON tracking_sessions
+        WHEN OLD.status = 'completed' AND NEW.status IS NOT 'completed'
+        BEGIN
+            UPDATE user_statistics
+            SET total_sessions = total_sessions - 1, last_updated = CURRENT_TIMESTAMP
+            WHERE user_id = NEW.user_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_sessions_deleted
+        AFTER DELETE ON tracking_sessions
+        WHEN OLD.status = 'completed'
+        BEGIN
+            UPDATE user_statistics
+            SET total_sessions = total_sessions - 1, last_updated = CURRENT_TIMESTAMP
+            WHERE user_id = OLD.user_id;
+        END
+        ''',
+        # Waste totals: apply each row's quantity as a delta to its user's total
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_waste_inserted
+        AFTER INSERT ON waste_tracking
+        BEGIN
+            UPDATE user_statistics
+            SET total_waste_kg = total_waste_kg + COALESCE(NEW.quantity, 0), last_updated = CURRENT_TIMESTAMP
+            WHERE user_id = (SELECT user_id FROM tracking_sessions WHERE id = NEW.session_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_waste_updated
+        AFTER UPDATE OF quantity, session_id ON waste_tracking
+        BEGIN
+            UPDATE user_statistics
+            SET total_waste_kg = total_waste_kg - COALESCE(OLD.quantity, 0), last_updated = CURRENT_TIMESTAMP
+            WHERE user_id = (SELECT user_id FROM tracking_sessions WHERE id = OLD.session_id);
+            UPDATE user_statistics
+            SET total_waste_kg = total_waste_kg + COALESCE(NEW.quantity, 0), last_updated = CURRENT_TIMESTAMP
+            WHERE user_id = (SELECT user_id FROM tracking_sessions WHERE id = NEW.session_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_waste_deleted
+        AFTER DELETE ON waste_tracking
+        BEGIN
+            UPDATE user_statistics
+            SET total_waste_kg = total_waste_kg - COALESCE(OLD.quantity, 0), last_updated = CURRENT_TIMESTAMP
+            WHERE user_id = (SELECT user_id FROM tracking_sessions WHERE id = OLD.session_id);
+        END
+        ''',
+        # Consumption estimate (2.5x waste) and waste percentage follow the waste total
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_statistics_derived
+        AFTER UPDATE OF total_waste_kg ON user_statistics
+        BEGIN
+            UPDATE user_statistics
+            SET total_food_consumed_kg = NEW.total_waste_kg * 2.5,
+                avg_waste_percentage = CASE
+                    WHEN NEW.total_waste_kg * 2.5 > 0 THEN NEW.total_waste_kg / (NEW.total_waste_kg * 2.5) * 100
+                    ELSE 0
+                END
+            WHERE id = NEW.id;
+        END
+        ''',
+        # Bring existing rows up to date once so the triggers start from correct totals
+        RECOMPUTE_USER_STATISTICS
+    ]),
+    (4, 'Index suggestions by session', [
+        # Suggestions already given in a session, for deduplication after a restart
+        'CREATE INDEX IF NOT EXISTS idx_ai_suggestions_session ON ai_suggestions (session_id, suggestion_text)'
+    ]),
+    (5, 'Consolidated rows for tracked items', [
+        # One food_detections row per tracked object instead of one per box per frame;
+        # confidence holds the peak confidence and timestamp the first sighting
+        'ALTER TABLE food_detections ADD COLUMN track_id INTEGER',
+        'ALTER TABLE food_detections ADD COLUMN first_seen TIMESTAMP',
+        'ALTER TABLE food_detections ADD COLUMN last_seen TIMESTAMP',
+        'ALTER TABLE food_detections ADD COLUMN frame_count INTEGER'
+    ]),
+    (6, 'Hourly, daily and weekly rollups per user and item', [
+        # One row per user, bucket and item; the primary key serves every range query
+        '''
+        CREATE TABLE IF NOT EXISTS detection_rollups (
+            user_id INTEGER NOT NULL,
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            item_name TEXT NOT NULL,
+            detections INTEGER NOT NULL DEFAULT 0,
+            quantity REAL NOT NULL DEFAULT 0,
+            confidence_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, granularity, bucket, item_name)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS waste_rollups (
+            user_id INTEGER NOT NULL,
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            waste_type TEXT NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            quantity REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, granularity, bucket, waste_type)
+        ) WITHOUT ROWID
+        ''',
+        # Detections only ever add to their buckets: the rollups outlive the raw rows they summarize
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_detection_rollups
+        AFTER INSERT ON food_detections
+        BEGIN
+            INSERT INTO detection_rollups (user_id, granularity, bucket, item_name, detections, quantity, confidence_sum)
+            SELECT ts.user_id, g.granularity, {bucket}, NEW.item_name,
+                1, COALESCE(NEW.quantity, 0), COALESCE(NEW.confidence, 0)
+            FROM tracking_sessions ts CROSS JOIN {granularities} g
+            WHERE ts.id = NEW.session_id
+            ON CONFLICT (user_id, granularity, bucket, item_name) DO UPDATE
+            SET detections = detections + excluded.detections,
+                quantity = quantity + excluded.quantity,
+                confidence_sum = confidence_sum + excluded.confidence_sum;
+        END
+        '''.format(
+            bucket=ROLLUP_BUCKET.format(granularity='g.granularity',
+                                        column='COALESCE(NEW.timestamp, CURRENT_TIMESTAMP)'),
+            granularities=ROLLUP_GRANULARITIES
+        ),
+        # Waste entries can be corrected, so edits and deletes move their quantity like trg_waste_*
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_waste_rollups_inserted
+        AFTER INSERT ON waste_tracking
+        BEGIN{_waste_rollup_delta('NEW', '+')}END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_waste_rollups_updated
+        AFTER UPDATE OF quantity, session_id, waste_type, timestamp ON waste_tracking
+        BEGIN{_waste_rollup_delta('OLD', '-')}{_waste_rollup_delta('NEW', '+')}END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_waste_rollups_deleted
+        AFTER DELETE ON waste_tracking
+        BEGIN{_waste_rollup_delta('OLD', '-')}END
+        ''',
+        # Backfill from the rows already stored
+        *[(statement, {'since': None}) for statement in REBUILD_ROLLUPS]
+    ]),
+    (7, 'Index detections by session in id order', [
+        # Keyset pagination for exports: WHERE session_id = ? AND id > ? ORDER BY id
+        'CREATE INDEX IF NOT EXISTS idx_food_detections_session_id ON food_detections (session_id, id)'
+    ]),
+    (8, 'Retention: age indexes and archive watermarks', [
+        # Oldest rows first, for moving them to the archive
+        'CREATE INDEX IF NOT EXISTS idx_food_detections_time ON food_detections (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_ai_suggestions_time ON ai_suggestions (timestamp)',
+        # Every row of table_name older than archived_before lives in the archive files, not here
+        '''
+        CREATE TABLE IF NOT EXISTS archive_watermarks (
+            table_name TEXT PRIMARY KEY,
+            archived_before TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        '''
+    ]),
+    (9, 'Offline re-detection results and checkpoints', [
+        # One row per stored frame run through a model version; also what makes a rerun skip it
+        '''
+        CREATE TABLE IF NOT EXISTS redetected_frames (
+            model_version TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            session_id INTEGER,
+            detections INTEGER NOT NULL,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (model_version, image_path)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS redetections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_version TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            session_id INTEGER,
+            item_name TEXT NOT NULL,
+            category TEXT,
+            confidence REAL NOT NULL,
+            x1 REAL, y1 REAL, x2 REAL, y2 REAL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_redetections_version_session ON redetections (model_version, session_id)',
+        'CREATE INDEX IF NOT EXISTS idx_redetections_version_image ON redetections (model_version, image_path)',
+        # Progress of a run, committed with each page of results so an interrupted run resumes
+        # after (after_key, after_id): the last (timestamp or session id, detection id) walked
+        '''
+        CREATE TABLE IF NOT EXISTS redetection_runs (
+            model_version TEXT PRIMARY KEY,
+            filters TEXT NOT NULL,
+            after_key NOT NULL DEFAULT '',
+            after_id INTEGER NOT NULL DEFAULT 0,
+            frames INTEGER NOT NULL DEFAULT 0,
+            detections INTEGER NOT NULL DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+        '''
+    ])
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to target (default: latest); returns the versions applied"""
+    target = LATEST_VERSION if target is None else target
+    version = current_version(conn)
+    conn.commit()
+
+    applied = []
+    for number, description, statements in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        try:
+            conn.execute('BEGIN')
+            for statement in statements:
+                # Either plain SQL or (sql, parameters)
+                if isinstance(statement, tuple):
+                    conn.execute(*statement)
+                else:
+                    conn.execute(statement)
+            conn.execute(
+                'INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                (number, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {number}: {description}")
+        applied.append(number)
+    return applied
@@ -0,0 +1,229 @@
+"""Frame preprocessing in front of inference
+
+Incoming JPEGs are decoded at reduced resolution when the frame is larger than the model
+input needs (libjpeg scales during the DCT, which is much cheaper than decoding at full
+size and resizing), cropped to the session's region of interest, and letterboxed into
+preallocated model-sized buffers. Detections on the prepared image are mapped back to
+the coordinates of the frame the client sent.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from inference import Detection
+
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+# Start-of-frame markers that carry the image size (everything in C0-CF but DHT, JPG and DAC)
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+LETTERBOX_FILL = 114
+
+
+def jpeg_dimensions(buffer):
+    """(width, height) from the JPEG header without decoding, or None"""
+    data = memoryview(buffer)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+def reduction_factor(size, needed):
+    """Largest JPEG reduction (8, 4, 2) that keeps a side of `size` pixels at least `needed` pixels"""
+    for factor in (8, 4, 2):
+        if size / factor >= needed:
+            return factor
+    return 1
+
+
+def normalize_roi(roi):
+    """Validate a region of interest given as [x1, y1, x2, y2] fractions of the frame"""
+    if roi is None:
+        return None
+    x1, y1, x2, y2 = (float(v) for v in roi)
+    x1, x2 = max(0.0, min(x1, x2)), min(1.0, max(x1, x2))
+    y1, y2 = max(0.0, min(y1, y2)), min(1.0, max(y1, y2))
+    if x2 - x1 < 0.05 or y2 - y1 < 0.05:
+        raise ValueError('Region of interest is too small')
+    if (x1, y1, x2, y2) == (0.0, 0.0, 1.0, 1.0):
+        return None
+    return x1, y1, x2, y2
+
+
+class PreparedFrame:
+    """A letterboxed model input and the mapping back to the client's frame"""
+
+    __slots__ = ('image', 'scale', 'offset', 'buffer', 'source')
+
+    def __init__(self, image, scale, offset, buffer=None, source=None):
+        self.image = image
+        # original pixel = prepared pixel * scale + offset
+        self.scale = scale
+        self.offset = offset
+        self.buffer = buffer
+        # The JPEG bytes the frame was decoded from, if it came from decode()
+        self.source = source
+
+    def to_frame(self, detections):
+        """Map detection boxes from the prepared image back to the client's frame"""
+        s, (ox, oy) = self.scale, self.offset
+        return [
+            Detection(d.class_id, d.name, d.confidence,
+                      (d.box[0] * s + ox, d.box[1] * s + oy, d.box[2] * s + ox, d.box[3] * s + oy))
+            for d in detections
+        ]
+
+
+class FramePreprocessor:
+    """Reduced decode, per-session ROI crop and letterboxing into reusable buffers"""
+
+    def __init__(self, imgsz=640, max_buffers=64, max_sessions=1024, jpeg_quality=0.7, max_capture_side=1920):
+        self.imgsz = int(imgsz)
+        self.max_buffers = int(max_buffers)
+        self.max_sessions = int(max_sessions)
+        self.jpeg_quality = float(jpeg_quality)
+        self.max_capture_side = int(max_capture_side)
+
+        self._rois = OrderedDict()
+        self._free = []
+        self._lock = threading.Lock()
+        self._frames = 0
+        self._decodes_by_factor = {factor: 0 for factor in REDUCED_DECODE_FLAGS}
+        self._buffers_allocated = 0
+        self._buffers_reused = 0
+
+    # Regions of interest
+
+    def set_roi(self, session_id, roi):
+        roi = normalize_roi(roi)
+        with self._lock:
+            if roi is None:
+                self._rois.pop(session_id, None)
+                return None
+            self._rois[session_id] = roi
+            self._rois.move_to_end(session_id)
+            while len(self._rois) > self.max_sessions:
+                self._rois.popitem(last=False)
+        return roi
+
+    def get_roi(self, session_id):
+        with self._lock:
+            return self._rois.get(session_id)
+
+    def forget(self, session_id):
+        with self._lock:
+            self._rois.pop(session_id, None)
+
+    def capture_hint(self, session_id=None):
+        """Capture size and JPEG quality the client should use so no pixel is sent only to be thrown away"""
+        roi = self.get_roi(session_id)
+        fraction = max(roi[2] - roi[0], roi[3] - roi[1]) if roi else 1.0
+        return {
+            'max_side': min(self.max_capture_side, int(math.ceil(self.imgsz / fraction))),
+            'jpeg_quality': self.jpeg_quality,
+            'imgsz': self.imgsz,
+            'roi': list(roi) if roi else None
+        }
+
+    # Frames
+
+    def decode(self, buffer, session_id=None):
+        """Decode a JPEG at the smallest resolution that still fills the model input; returns PreparedFrame or None"""
+        if not buffer:
+            return None
+        roi = self.get_roi(session_id)
+        factor = 1
+        dims = jpeg_dimensions(buffer)
+        if dims:
+            width, height = dims
+            if roi:
+                width, height = width * (roi[2] - roi[0]), height * (roi[3] - roi[1])
+            factor = reduction_factor(max(width, height), self.imgsz)
+        image = cv2.imdecode(np.frombuffer(buffer, np.uint8), REDUCED_DECODE_FLAGS[factor])
+        if image is None:
+            return None
+        with self._lock:
+            self._decodes_by_factor[factor] += 1
+        prepared = self.prepare(image, session_id, roi=roi, scale=float(factor))
+        prepared.source = buffer
+        return prepared
+
+    def prepare(self, image, session_id=None, roi=None, scale=1.0):
+        """Crop an already decoded frame to the session ROI and letterbox it into a pooled buffer"""
+        if roi is None:
+            roi = self.get_roi(session_id)
+        height, width = image.shape[:2]
+        left = top = 0
+        if roi:
+            left, top = int(roi[0] * width), int(roi[1] * height)
+            image = image[top:int(roi[3] * height), left:int(roi[2] * width)]
+            height, width = image.shape[:2]
+
+        ratio = self.imgsz / max(width, height)
+        new_w, new_h = max(1, round(width * ratio)), max(1, round(height * ratio))
+        buffer = self._acquire()
+        region = buffer[:new_h, :new_w]
+        resized = cv2.resize(image, (new_w, new_h), dst=region,
+                             interpolation=cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR)
+        if not np.shares_memory(resized, buffer):
+            region[...] = resized
+        # Pad right and bottom only, so the mapping back is a scale plus the ROI offset
+        buffer[new_h:, :] = LETTERBOX_FILL
+        buffer[:new_h, new_w:] = LETTERBOX_FILL
+
+        with self._lock:
+            self._frames += 1
+        return PreparedFrame(buffer, scale / ratio, (left * scale, top * scale), buffer)
+
+    def release(self, prepared):
+        """Return a frame's buffer once inference is done with it"""
+        if prepared.buffer is None:
+            return
+        buffer, prepared.buffer = prepared.buffer, None
+        with self._lock:
+            if len(self._free) < self.max_buffers:
+                self._free.append(buffer)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'imgsz': self.imgsz,
+                'frames': self._frames,
+                'decodes_by_reduction': {str(k): v for k, v in self._decodes_by_factor.items()},
+                'buffers_allocated': self._buffers_allocated,
+                'buffers_reused': self._buffers_reused,
+                'buffers_free': len(self._free),
+                'sessions_with_roi': len(self._rois)
+            }
+
+    def _acquire(self):
+        with self._lock:
+            if self._free:
+                self._buffers_reused += 1
+                return self._free.pop()
+            self._buffers_allocated += 1
+        return np.empty((self.imgsz, self.imgsz, 3), dtype=np.uint8)
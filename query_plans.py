@@ -0,0 +1,45 @@
+"""EXPLAIN QUERY PLAN checks for the SQL used by the app
+
+collect_queries() pulls every literal SQL string passed to cursor.execute()/executemany()
+out of a Python source file, and full_scans() reports the tables a query would read with
+a full table scan.
+"""
+import ast
+import re
+
+# Only statements that read rows through a WHERE/JOIN/ORDER BY are worth checking
+CHECKED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+# Named parameters (:name); queries use either these or ? placeholders
+NAMED_PARAMETER = re.compile(r'(?<!:):([A-Za-z_]\w*)')
+
+# "SCAN fd", "SCAN food_detections AS fd" or "SCAN fd USING COVERING INDEX ..." all visit every row
+FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(\S+)')
+
+
+def collect_queries(path):
+    """Return (line, sql) for every string literal passed to execute()/executemany() in a file"""
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    queries = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not node.args:
+            continue
+        func = node.func
+        if not isinstance(func, ast.Attribute) or func.attr not in ('execute', 'executemany'):
+            continue
+        arg = node.args[0]
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            sql = ' '.join(arg.value.split())
+            if sql.upper().startswith(CHECKED_STATEMENTS):
+                queries.append((node.lineno, sql))
+    return sorted(queries)
+
+
+def full_scans(conn, sql):
+    """Return the plan lines of a query that scan a whole table"""
+    names = NAMED_PARAMETER.findall(sql)
+    params = dict.fromkeys(names) if names else [None] * sql.count('?')
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    return [row[3] for row in plan if FULL_SCAN.match(row[3])]
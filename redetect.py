@@ -0,0 +1,372 @@
+"""Offline re-detection: run stored frames through a model again and keep the results per model version
+
+Walks the food_detections rows that have a stored frame (image_path) for a date range or a
+set of sessions. Frames are read and decoded on a pool of threads (OpenCV releases the GIL
+while decoding), letterboxed by FramePreprocessor and inferred in batches on
+InferenceWorkerPool processes, which can be pinned to a subset of cores and run at a lower
+priority next to the live API.
+
+Results go to redetections under a model version tag, one bulk insert per page of frames.
+The same transaction advances the run's checkpoint in redetection_runs, so an interrupted
+run resumes after the last page written. A frame that backs several detection rows is
+inferred once, and frames already in redetected_frames for the version are skipped, so
+overlapping runs never store a frame's results twice.
+
+CLI: python redetect.py --model yolov8s.pt --start 2026-09-01 --end 2026-09-30 --workers 2 --cpus auto
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from export import parse_bounds
+
+DEFAULT_PAGE_SIZE = 256
+
+
+def model_version(model_path, backend='torch'):
+    """Default version tag: model file name, backend and a hash of the weights"""
+    digest = hashlib.sha1()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return f'{stem}-{backend}-{digest.hexdigest()[:8]}'
+
+
+def start_run(conn, version, filters, restart=False):
+    """Checkpoint (after_key, after_id) to walk from, or None if this exact run is complete
+
+    A run with different filters under the same version starts a new walk but keeps the
+    results stored so far; restart drops every result of the version first.
+    """
+    encoded = json.dumps(filters, sort_keys=True)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if restart:
+            conn.execute('DELETE FROM redetections WHERE model_version = ?', (version,))
+            conn.execute('DELETE FROM redetected_frames WHERE model_version = ?', (version,))
+            conn.execute('DELETE FROM redetection_runs WHERE model_version = ?', (version,))
+        row = conn.execute('''
+            SELECT filters, after_key, after_id, completed_at FROM redetection_runs WHERE model_version = ?
+        ''', (version,)).fetchone()
+        if row is not None and row[0] == encoded:
+            conn.commit()
+            return None if row[3] else (row[1], row[2])
+        conn.execute('''
+            INSERT INTO redetection_runs (model_version, filters) VALUES (?, ?)
+            ON CONFLICT (model_version) DO UPDATE
+            SET filters = excluded.filters, after_key = '', after_id = 0, completed_at = NULL,
+                started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+        ''', (version, encoded))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return '', 0
+
+
+def iter_pages(conn, start=None, end=None, session_ids=None, after=('', 0), page_size=DEFAULT_PAGE_SIZE):
+    """Yield pages of stored frames after a checkpoint: lists of (walk key, detection id, session id, image path)
+
+    Without sessions the walk follows (timestamp, id) along idx_food_detections_time; with
+    sessions it goes session by session in id order along idx_food_detections_session_id.
+    """
+    if not session_ids:
+        params = {'end': end, 'limit': page_size, 'after_time': after[0] or start or '', 'after_id': after[1]}
+        while True:
+            rows = conn.execute('''
+                SELECT timestamp, id, session_id, image_path
+                FROM food_detections
+                WHERE (timestamp, id) > (:after_time, :after_id)
+                AND (:end IS NULL OR timestamp < :end)
+                AND image_path IS NOT NULL
+                ORDER BY timestamp, id
+                LIMIT :limit
+            ''', params).fetchall()
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            params['after_time'], params['after_id'] = rows[-1][0], rows[-1][1]
+
+    after_session = int(after[0] or 0)
+    for session_id in sorted(set(session_ids)):
+        if session_id < after_session:
+            continue
+        params = {
+            'session_id': session_id,
+            'after_id': after[1] if session_id == after_session else 0,
+            'start': start,
+            'end': end,
+            'limit': page_size
+        }
+        while True:
+            rows = conn.execute('''
+                SELECT session_id, id, session_id, image_path
+                FROM food_detections
+                WHERE session_id = :session_id AND id > :after_id
+                AND (:start IS NULL OR timestamp >= :start)
+                AND (:end IS NULL OR timestamp < :end)
+                AND image_path IS NOT NULL
+                ORDER BY id
+                LIMIT :limit
+            ''', params).fetchall()
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                break
+            params['after_id'] = rows[-1][1]
+
+
+def pending_frames(conn, version, rows):
+    """The page's distinct frames not yet processed for the version, as {image path: session id}"""
+    frames = {}
+    for _, _, session_id, image_path in rows:
+        if image_path in frames:
+            continue
+        done = conn.execute(
+            'SELECT 1 FROM redetected_frames WHERE model_version = ? AND image_path = ?', (version, image_path)
+        ).fetchone()
+        if done is None:
+            frames[image_path] = session_id
+    return frames
+
+
+def write_page(conn, version, results, checkpoint, categories):
+    """Store a page's results and advance the checkpoint in one transaction
+
+    results is a list of (image path, session id, accepted detections); categories maps
+    item names to their taxonomy category.
+    """
+    detections = [
+        (version, image_path, session_id, d.name, categories.get(d.name), d.confidence, *d.box)
+        for image_path, session_id, accepted in results
+        for d in accepted
+    ]
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.executemany('''
+            INSERT INTO redetections (model_version, image_path, session_id, item_name, category, confidence,
+                x1, y1, x2, y2)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', detections)
+        conn.executemany('''
+            INSERT OR IGNORE INTO redetected_frames (model_version, image_path, session_id, detections)
+            VALUES (?, ?, ?, ?)
+        ''', [(version, image_path, session_id, len(accepted)) for image_path, session_id, accepted in results])
+        conn.execute('''
+            UPDATE redetection_runs
+            SET after_key = ?, after_id = ?, frames = frames + ?, detections = detections + ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE model_version = ?
+        ''', (checkpoint[0], checkpoint[1], len(results), len(detections), version))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(detections)
+
+
+def finish_run(conn, version):
+    conn.execute('''
+        UPDATE redetection_runs SET completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+        WHERE model_version = ?
+    ''', (version,))
+    conn.commit()
+
+
+class Redetector:
+    """Decode threads, batched inference on a worker pool, and the bookkeeping of one run"""
+
+    def __init__(self, pool, preprocessor, food_classes, frame_dir, batch_size=8, decode_threads=2, max_fps=None):
+        self.pool = pool
+        self.preprocessor = preprocessor
+        self.food_classes = food_classes
+        self.frame_dir = frame_dir
+        self.batch_size = max(1, int(batch_size))
+        self.max_fps = max_fps
+        self.decoder = ThreadPoolExecutor(max_workers=max(1, int(decode_threads)), thread_name_prefix='redetect-decode')
+
+        self.frames = 0
+        self.missing = 0
+        self.detections = 0
+        self.started = time.perf_counter()
+
+    def load(self, image_path):
+        """Read and preprocess one stored frame; None if the file is gone or unreadable"""
+        try:
+            with open(os.path.join(self.frame_dir, image_path), 'rb') as f:
+                return self.preprocessor.decode(f.read())
+        except OSError:
+            return None
+
+    def infer(self, frames):
+        """{image path: session id} -> [(image path, session id, accepted detections)]"""
+        paths = list(frames)
+        prepared = list(self.decoder.map(self.load, paths))
+        loaded = [(path, frame) for path, frame in zip(paths, prepared) if frame is not None]
+        self.missing += len(paths) - len(loaded)
+
+        # The pool's task_timeout runs from submit, so only as many batches as the workers
+        # have slots for are in flight; the next one is submitted as each result comes back
+        batches = deque(loaded[i:i + self.batch_size] for i in range(0, len(loaded), self.batch_size))
+        window = self.pool.size * max(1, self.pool.slots_per_worker // self.batch_size)
+        in_flight = deque()
+        results = []
+        try:
+            while batches or in_flight:
+                while batches and len(in_flight) < window:
+                    future = self.pool.submit([frame.image for _, frame in batches[0]])
+                    in_flight.append((batches.popleft(), future))
+                batch, future = in_flight.popleft()
+                try:
+                    outputs = future.result(timeout=self.pool.task_timeout)
+                finally:
+                    for _, frame in batch:
+                        self.preprocessor.release(frame)
+                for (path, frame), detections in zip(batch, outputs):
+                    labelled = self.food_classes.label(frame.to_frame(detections))
+                    accepted = [d for d in labelled if self.food_classes.accepts(d)]
+                    results.append((path, frames[path], accepted))
+        finally:
+            for batch, future in in_flight:
+                future.cancel()
+                for _, frame in batch:
+                    self.preprocessor.release(frame)
+            for batch in batches:
+                for _, frame in batch:
+                    self.preprocessor.release(frame)
+        return results
+
+    def run(self, conn, version, pages, progress=None):
+        for rows in pages:
+            frames = pending_frames(conn, version, rows)
+            results = self.infer(frames) if frames else []
+            self.detections += write_page(conn, version, results, (rows[-1][0], rows[-1][1]),
+                                          self.food_classes.categories)
+            self.frames += len(results)
+            if progress is not None:
+                progress(self.stats())
+            self._throttle()
+        finish_run(conn, version)
+        return self.stats()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'frames': self.frames,
+            'missing': self.missing,
+            'detections': self.detections,
+            'seconds': round(elapsed, 1),
+            'frames_per_s': round(self.frames / elapsed, 2) if elapsed > 0 else 0.0
+        }
+
+    def _throttle(self):
+        if not self.max_fps:
+            return
+        ahead = self.frames / self.max_fps - (time.perf_counter() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def close(self):
+        self.decoder.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-run stored frames through a model and store the results')
+    parser.add_argument('--db', default=os.environ.get('AIBSFMS_DB_PATH', 'aibsfms.db'))
+    parser.add_argument('--model', default=os.environ.get('AIBSFMS_MODEL_PATH', 'yolov8n.pt'))
+    parser.add_argument('--backend', default=os.environ.get('AIBSFMS_INFERENCE_BACKEND', 'torch'))
+    parser.add_argument('--imgsz', type=int, default=int(os.environ.get('AIBSFMS_INFERENCE_IMGSZ', 640)))
+    parser.add_argument('--model-version', default=None,
+                        help='tag the results are stored under (default: model name, backend and weights hash)')
+    parser.add_argument('--taxonomy', default=os.environ.get('AIBSFMS_FOOD_TAXONOMY'),
+                        help='food taxonomy JSON file (default: the built-in COCO food classes)')
+    parser.add_argument('--frame-dir', default=os.environ.get('AIBSFMS_FRAME_DIR', 'frames'),
+                        help='directory image_path is relative to')
+    parser.add_argument('--start', default=None, help='UTC date or timestamp, inclusive')
+    parser.add_argument('--end', default=None, help='UTC timestamp, exclusive (a date includes that day)')
+    parser.add_argument('--session', type=int, action='append', default=None,
+                        help='only this tracking session (repeatable)')
+    parser.add_argument('--workers', type=int, default=2, help='inference processes')
+    parser.add_argument('--cpus', default='', help="cores per worker, e.g. '0-1;2-3', or 'auto'")
+    parser.add_argument('--decode-threads', type=int, default=2)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='frames per checkpoint')
+    parser.add_argument('--max-fps', type=float, default=None, help='cap on frames per second')
+    parser.add_argument('--nice', type=int, default=10, help='lower the priority of this run and its workers')
+    parser.add_argument('--restart', action='store_true', help="drop the version's stored results first")
+    args = parser.parse_args(argv)
+
+    try:
+        start, end = parse_bounds(args.start, args.end)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    version = args.model_version or model_version(args.model, args.backend)
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    conn.isolation_level = None
+    filters = {'start': start, 'end': end, 'sessions': sorted(set(args.session or []))}
+    after = start_run(conn, version, filters, restart=args.restart)
+    if after is None:
+        print(f"{version}: this run is already complete (use --restart to run it again)", file=sys.stderr)
+        return 0
+
+    if args.nice and hasattr(os, 'nice'):
+        # Inherited by the worker processes started below
+        os.nice(args.nice)
+
+    from inference_pool import InferenceWorkerPool, parse_cpu_sets
+    from preprocess import FramePreprocessor
+    from taxonomy import FoodTaxonomy
+
+    taxonomy = FoodTaxonomy.load(args.taxonomy)
+    pool = InferenceWorkerPool(
+        args.model,
+        workers=args.workers,
+        cpu_sets=parse_cpu_sets(args.cpus, args.workers),
+        slots_per_worker=args.batch * 2,
+        max_frame_bytes=args.imgsz * args.imgsz * 3,
+        backend=args.backend,
+        imgsz=args.imgsz,
+        taxonomy=taxonomy,
+        conf=taxonomy.min_threshold
+    )
+    redetector = None
+    try:
+        if not pool.wait_ready(timeout=300):
+            print('No inference worker became ready', file=sys.stderr)
+            return 1
+        preprocessor = FramePreprocessor(imgsz=args.imgsz, max_buffers=args.page_size)
+        redetector = Redetector(pool, preprocessor, taxonomy.resolve(pool.names), args.frame_dir,
+                                batch_size=args.batch, decode_threads=args.decode_threads, max_fps=args.max_fps)
+        print(f"{version}: resuming after {after}" if after != ('', 0) else f"{version}: starting", file=sys.stderr)
+
+        def progress(stats):
+            print(f"{stats['frames']} frames, {stats['detections']} detections, "
+                  f"{stats['missing']} missing, {stats['frames_per_s']} frames/s", file=sys.stderr)
+
+        pages = iter_pages(conn, start, end, filters['sessions'], after, page_size=args.page_size)
+        stats = redetector.run(conn, version, pages, progress=progress)
+    except KeyboardInterrupt:
+        print(f"{version}: interrupted; run again with the same options to resume", file=sys.stderr)
+        return 130
+    finally:
+        if redetector is not None:
+            redetector.close()
+        pool.close()
+        conn.close()
+
+    print(json.dumps(dict(stats, model_version=version)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Retention: move old rows out of SQLite into date-partitioned Parquet archives
+
+Rows older than a table's retention age are written to
+<archive_dir>/<table>/date=YYYY-MM-DD/part-<lowest id>-<highest id>.parquet (zstd) and then
+deleted, oldest first and in batches, each batch in its own short transaction. A file is
+complete on disk before its rows are deleted; if the process dies in between, the next
+run selects the same rows and rewrites the same file. archive_watermarks records, per
+table, the time before which every row lives in the archive.
+
+The detection rollups are only ever added to, so they already hold every archived row
+and analytics are unaffected. Exports read the archive back with iter_archived().
+Freed pages are returned to the filesystem with incremental vacuum in small steps.
+"""
+import os
+import threading
+import time
+
+from export import DETECTION_COLUMNS, parquet_schema
+from journal import db_timestamp
+
+SUGGESTION_COLUMNS = ('id', 'user_id', 'session_id', 'suggestion_text', 'category', 'timestamp')
+
+# Per table: archived columns, the oldest-first batch query and the delete
+RETENTION_TABLES = {
+    'food_detections': {
+        'columns': DETECTION_COLUMNS,
+        'select': '''
+            SELECT fd.id, fd.session_id, ts.user_id, ts.tracking_mode, fd.item_name, fd.quantity,
+                fd.confidence, fd.detection_type, fd.timestamp, fd.track_id, fd.first_seen,
+                fd.last_seen, fd.frame_count, fd.image_path
+            FROM food_detections fd
+            LEFT JOIN tracking_sessions ts ON ts.id = fd.session_id
+            WHERE fd.timestamp < ?
+            ORDER BY fd.timestamp, fd.id
+            LIMIT ?
+        ''',
+        'delete': 'DELETE FROM food_detections WHERE id = ?'
+    },
+    'ai_suggestions': {
+        'columns': SUGGESTION_COLUMNS,
+        'select': '''
+            SELECT id, user_id, session_id, suggestion_text, category, timestamp
+            FROM ai_suggestions
+            WHERE timestamp < ?
+            ORDER BY timestamp, id
+            LIMIT ?
+        ''',
+        'delete': 'DELETE FROM ai_suggestions WHERE id = ?'
+    }
+}
+
+
+def archive_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def archived_before(conn, table):
+    """Watermark of a table: every row older than this is archived (None if nothing is)"""
+    row = conn.execute(
+        'SELECT archived_before FROM archive_watermarks WHERE table_name = ?', (table,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def write_partition(path, rows, columns):
+    """Write rows to a Parquet file atomically (temporary file, fsync, rename)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pydict(
+        {name: [row[name] for row in rows] for name in columns}, schema=parquet_schema(columns)
+    )
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pq.write_table(table, f, compression='zstd')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def archive_table(connect, archive_dir, table, cutoff, batch_size=20000, pause_s=0.05, on_archived=None):
+    """Archive and delete every row of table older than cutoff (a stored-format timestamp)
+
+    on_archived(user_ids) is called after each batch with the owners of the deleted rows.
+    Returns (rows archived, files written).
+    """
+    spec = RETENTION_TABLES[table]
+    columns = spec['columns']
+    rows_archived = files_written = 0
+    while True:
+        conn = connect()
+        try:
+            rows = [dict(zip(columns, row)) for row in conn.execute(spec['select'], (cutoff, batch_size)).fetchall()]
+            if not rows:
+                _set_watermark(conn, table, cutoff)
+                conn.commit()
+                break
+
+            by_day = {}
+            for row in rows:
+                by_day.setdefault(row['timestamp'][:10], []).append(row)
+            for day, day_rows in by_day.items():
+                ids = [row['id'] for row in day_rows]
+                path = os.path.join(archive_dir, table, f'date={day}', f'part-{min(ids):012d}-{max(ids):012d}.parquet')
+                write_partition(path, day_rows, columns)
+                files_written += 1
+
+            # Rows come oldest first, so everything before the newest one archived is gone
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(spec['delete'], [(row['id'],) for row in rows])
+            _set_watermark(conn, table, rows[-1]['timestamp'])
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        rows_archived += len(rows)
+        if on_archived is not None:
+            on_archived({row['user_id'] for row in rows if row['user_id'] is not None})
+        if len(rows) == batch_size:
+            # Let the journal and request threads in between batches
+            time.sleep(pause_s)
+    return rows_archived, files_written
+
+
+def _set_watermark(conn, table, before):
+    conn.execute('''
+        INSERT INTO archive_watermarks (table_name, archived_before) VALUES (?, ?)
+        ON CONFLICT (table_name) DO UPDATE
+        SET archived_before = MAX(archived_before, excluded.archived_before), updated_at = CURRENT_TIMESTAMP
+    ''', (table, before))
+
+
+def iter_archived(archive_dir, table, start=None, end=None, batch_size=5000, **filters):
+    """Yield archived rows in date order, restricted to [start, end) and to columns equal to filters
+
+    Only the partitions in the date range are opened, and files are read one record batch
+    at a time. Filters with a None value are ignored.
+    """
+    root = os.path.join(archive_dir, table)
+    if not os.path.isdir(root):
+        return
+    import pyarrow.parquet as pq
+
+    filters = {name: value for name, value in filters.items() if value is not None}
+    for partition in sorted(os.listdir(root)):
+        if not partition.startswith('date='):
+            continue
+        day = partition[5:]
+        if (start and day < start[:10]) or (end and day > end[:10]):
+            continue
+        directory = os.path.join(root, partition)
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.parquet'):
+                continue
+            for batch in pq.ParquetFile(os.path.join(directory, name)).iter_batches(batch_size=batch_size):
+                for row in batch.to_pylist():
+                    if start and row['timestamp'] < start:
+                        continue
+                    if end and row['timestamp'] >= end:
+                        continue
+                    if any(row.get(column) != value for column, value in filters.items()):
+                        continue
+                    yield row
+
+
+def incremental_vacuum(conn, max_pages=None, step_pages=256, pause_s=0.05):
+    """Return free pages to the filesystem a step at a time; returns the pages freed
+
+    Only has an effect on databases with auto_vacuum = INCREMENTAL (see manage.py vacuum).
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 0
+    freed = 0
+    while max_pages is None or freed < max_pages:
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free:
+            break
+        step = min(free, step_pages, max_pages - freed if max_pages is not None else step_pages)
+        # executescript steps the pragma to completion; execute() would free a single page
+        conn.executescript(f'PRAGMA incremental_vacuum({int(step)})')
+        freed += step
+        time.sleep(pause_s)
+    return freed
+
+
+class RetentionWorker:
+    """Background thread that archives old rows and vacuums on an interval
+
+    policies maps a table in RETENTION_TABLES to its retention age in days (0 or None
+    keeps the table's rows forever). Archiving is skipped when pyarrow is missing, so no
+    row is ever deleted without being written out first.
+    """
+
+    def __init__(self, connect, archive_dir, policies, interval_s=3600, batch_size=20000, vacuum_step_pages=256,
+                 on_archived=None, start_delay_s=60):
+        unknown = set(policies) - set(RETENTION_TABLES)
+        if unknown:
+            raise ValueError(f"No retention support for: {', '.join(sorted(unknown))}")
+        self.connect = connect
+        self.archive_dir = archive_dir
+        self.policies = {table: days for table, days in policies.items() if days}
+        self.interval = float(interval_s)
+        self.batch_size = int(batch_size)
+        self.vacuum_step_pages = int(vacuum_step_pages)
+        self.on_archived = on_archived
+        self.start_delay = float(start_delay_s)
+        self.archiving = archive_available()
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._runs = 0
+        self._rows_archived = {table: 0 for table in self.policies}
+        self._files_written = 0
+        self._pages_vacuumed = 0
+        self._last_run = None
+        self._last_run_ms = 0.0
+        self._last_error = None
+
+        if self.policies and not self.archiving:
+            print("Warning: pyarrow not installed - old rows are kept, not archived")
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+
+    def run_once(self, now=None):
+        """One archive pass over every table with a policy, then an incremental vacuum"""
+        now = time.time() if now is None else now
+        started = time.perf_counter()
+        if self.archiving:
+            for table, days in self.policies.items():
+                rows, files = archive_table(
+                    self.connect, self.archive_dir, table, db_timestamp(now - days * 86400),
+                    batch_size=self.batch_size, on_archived=self.on_archived
+                )
+                with self._lock:
+                    self._rows_archived[table] += rows
+                    self._files_written += files
+
+        conn = self.connect()
+        try:
+            pages = incremental_vacuum(conn, step_pages=self.vacuum_step_pages)
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._runs += 1
+            self._pages_vacuumed += pages
+            self._last_run = db_timestamp(now)
+            self._last_run_ms = (time.perf_counter() - started) * 1000.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'archiving': self.archiving,
+                'retention_days': dict(self.policies),
+                'runs': self._runs,
+                'rows_archived': dict(self._rows_archived),
+                'files_written': self._files_written,
+                'pages_vacuumed': self._pages_vacuumed,
+                'last_run': self._last_run,
+                'last_run_ms': self._last_run_ms,
+                'last_error': self._last_error
+            }
+
+    def close(self, timeout=10):
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+
+    def _run(self):
+        if self._stop.wait(self.start_delay):
+            return
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Retention error: {e}")
+                with self._lock:
+                    self._last_error = str(e)
+            if self._stop.wait(self.interval):
+                return
@@ -0,0 +1,142 @@
+"""Hour, day and week rollups of detections and waste, and the date ranges queried on them
+
+The rollup tables from migration 6 are kept current by triggers as rows are written.
+backfill_rollups() rebuilds them from the raw tables, e.g. after importing old data;
+parse_range() turns the analytics API's query parameters into bucket bounds.
+"""
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from migrations import REBUILD_ROLLUPS
+
+GRANULARITIES = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1)
+}
+
+# Same format as the bucket column (and SQLite's CURRENT_TIMESTAMP)
+BUCKET_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Upper bound on buckets per query so one request cannot ask for years of hours
+MAX_BUCKETS = 2000
+
+
+def floor_bucket(moment, granularity):
+    """Start of the bucket a datetime falls in; weeks start on Monday"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def pick_granularity(start, end):
+    """Coarsest granularity that still gives a useful number of points for the range"""
+    span = end - start
+    if span <= timedelta(days=2):
+        return 'hour'
+    if span <= timedelta(days=90):
+        return 'day'
+    return 'week'
+
+
+def parse_moment(value, name):
+    """(datetime, date_only) from a UTC ISO date or timestamp; the error names the parameter"""
+    try:
+        moment = datetime.fromisoformat(value.strip().replace('T', ' ').rstrip('Z'))
+    except ValueError:
+        raise ValueError(f"'{name}' must be an ISO date or date and time")
+    if moment.tzinfo is not None:
+        raise ValueError(f"'{name}' must be in UTC without an offset")
+    date_only = len(value.strip()) <= 10
+    return moment, date_only
+
+
+def parse_range(start, end, granularity=None, now=None):
+    """Validate analytics query parameters; returns (granularity, first_bucket, end_bucket)
+
+    start and end are UTC ISO dates or timestamps; a date-only end includes that whole
+    day. The range is widened to whole buckets and is half-open: [first_bucket, end_bucket).
+    Both bounds come back as strings comparable with the bucket column.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    end_moment, end_is_date = parse_moment(end, 'end') if end else (now, False)
+    if end_is_date:
+        end_moment += timedelta(days=1)
+    start_moment = parse_moment(start, 'start')[0] if start else end_moment - timedelta(days=7)
+    if start_moment >= end_moment:
+        raise ValueError("'start' must be before 'end'")
+
+    granularity = granularity or pick_granularity(start_moment, end_moment)
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"'granularity' must be one of {', '.join(GRANULARITIES)}")
+
+    first = floor_bucket(start_moment, granularity)
+    last = floor_bucket(end_moment, granularity)
+    if last < end_moment:
+        last += GRANULARITIES[granularity]
+    if (last - first) / GRANULARITIES[granularity] > MAX_BUCKETS:
+        raise ValueError(f'Range spans more than {MAX_BUCKETS} {granularity} buckets; use a coarser granularity')
+    return granularity, first.strftime(BUCKET_FORMAT), last.strftime(BUCKET_FORMAT)
+
+
+def backfill_rollups(conn, since=None):
+    """Rebuild the rollups from food_detections and waste_tracking, from `since` on or entirely
+
+    since (a date or datetime) is moved back to the start of its week, so every bucket that
+    is rebuilt is rebuilt whole. Detections archived by retention are no longer in the
+    database, so the rebuild never reaches back past the first whole week after the archive
+    watermark; older buckets are kept as they are. Returns (rollup rows written, bucket the
+    rebuild started from or None for everything).
+    """
+    bound = None
+    if since is not None:
+        if isinstance(since, str):
+            since = parse_moment(since, 'since')[0]
+        bound = floor_bucket(since, 'week').strftime(BUCKET_FORMAT)
+
+    archived = _archived_before(conn)
+    if archived:
+        watermark = datetime.strptime(archived[:19], BUCKET_FORMAT)
+        first_whole = floor_bucket(watermark, 'week')
+        if first_whole < watermark:
+            first_whole += GRANULARITIES['week']
+        bound = max(bound or '', first_whole.strftime(BUCKET_FORMAT))
+
+    written = 0
+    try:
+        conn.execute('BEGIN')
+        for statement in REBUILD_ROLLUPS:
+            cursor = conn.execute(statement, {'since': bound})
+            if statement.lstrip().upper().startswith('INSERT'):
+                written += cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return written, bound
+
+
+def _archived_before(conn):
+    try:
+        row = conn.execute(
+            "SELECT archived_before FROM archive_watermarks WHERE table_name = 'food_detections'"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # Schema from before retention
+        return None
+    return row[0] if row else None
+
+
+def bucket_starts(first, end, granularity):
+    """Every bucket start in [first, end), as strings, for filling buckets with no rows"""
+    moment = datetime.strptime(first, BUCKET_FORMAT)
+    stop = datetime.strptime(end, BUCKET_FORMAT)
+    step = GRANULARITIES[granularity]
+    starts = []
+    while moment < stop:
+        starts.append(moment.strftime(BUCKET_FORMAT))
+        moment += step
+    return starts
@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a bounded executor already has as much work as it accepts"""
+
+
+class BoundedExecutor:
+    """Thread pool with a cap on queued work
+
+    At most max_workers calls run at once and at most max_pending more wait for a thread;
+    run() fails fast with ExecutorSaturated beyond that. Heavy routes go through one of
+    these so they can never occupy every server thread, leaving room for the light routes.
+    """
+
+    def __init__(self, name, max_workers=4, max_pending=16):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(0, int(max_pending))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Call fn on a pool thread and wait for its result"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorSaturated(f'{self.name} executor is saturated')
+
+        submitted = time.perf_counter()
+
+        def call():
+            with self._lock:
+                self._total_wait += time.perf_counter() - submitted
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(call)
+        except Exception:
+            self._done()
+            raise
+        future.add_done_callback(lambda _: self._done())
+        return future.result(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'avg_queue_wait_ms': (self._total_wait / self._completed * 1000.0) if self._completed else 0
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _done(self):
+        # The slot is only freed once the call has finished, even if the caller timed out
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+
+
+class AdmissionRejected(Exception):
+    """Raised when a caller already has as many requests in flight as it may"""
+
+    def __init__(self, reason):
+        super().__init__(f'Request rejected: {reason}')
+        self.reason = reason
+
+
+class AdmissionController:
+    """In-flight limits per user and per session for an expensive route
+
+    A client that fires requests faster than they are answered is turned away at the door
+    (before its body is even read) instead of queueing behind itself, and one user cannot
+    take every slot from the others.
+    """
+
+    def __init__(self, max_per_user=4, max_per_session=2):
+        self.max_per_user = max(1, int(max_per_user))
+        self.max_per_session = max(1, int(max_per_session))
+        self._by_user = {}
+        self._by_session = {}
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._rejected = {'user_limit': 0, 'session_limit': 0}
+
+    @contextmanager
+    def admit(self, user_id, session_id):
+        with self._lock:
+            if self._by_session.get(session_id, 0) >= self.max_per_session:
+                reason = 'session_limit'
+            elif self._by_user.get(user_id, 0) >= self.max_per_user:
+                reason = 'user_limit'
+            else:
+                reason = None
+                self._by_session[session_id] = self._by_session.get(session_id, 0) + 1
+                self._by_user[user_id] = self._by_user.get(user_id, 0) + 1
+                self._admitted += 1
+            if reason:
+                self._rejected[reason] += 1
+        if reason:
+            raise AdmissionRejected(reason)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._release(self._by_session, session_id)
+                self._release(self._by_user, user_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_per_user': self.max_per_user,
+                'max_per_session': self.max_per_session,
+                'in_flight': sum(self._by_session.values()),
+                'admitted': self._admitted,
+                'rejected': dict(self._rejected)
+            }
+
+    @staticmethod
+    def _release(counts, key):
+        # Drop zero counts so the maps only hold callers with requests in flight
+        if counts[key] <= 1:
+            del counts[key]
+        else:
+            counts[key] -= 1
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class StartupTracker:
+    """Times startup phases and runs the model warm-up on a background thread"""
+
+    def __init__(self):
+        self.state = 'starting'
+        self.error = None
+        self.phases = OrderedDict()
+
+        self._started = time.perf_counter()
+        self._last_mark = self._started
+        self._ready_at = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        """Record the time since the previous mark (or since startup) as a phase"""
+        now = time.perf_counter()
+        with self._lock:
+            self.phases[name] = (now - self._last_mark) * 1000.0
+            self._last_mark = now
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            with self._lock:
+                self.phases[name] = (now - started) * 1000.0
+                self._last_mark = now
+
+    def start(self, warm_up):
+        """Run warm_up() in the background; the app is ready once it returns"""
+        self.state = 'warming_up'
+        thread = threading.Thread(target=self._run, args=(warm_up,), name='model-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self):
+        return self.state == 'ready'
+
+    def wait_ready(self, timeout=0):
+        """Wait up to timeout seconds for the warm-up to finish; returns True if the app is ready"""
+        if timeout and not self._done.is_set():
+            self._done.wait(timeout)
+        return self.is_ready()
+
+    def status(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'error': self.error,
+                'phases_ms': dict(self.phases),
+                'time_to_ready_ms': ((self._ready_at - self._started) * 1000.0) if self._ready_at else None
+            }
+
+    def _run(self, warm_up):
+        try:
+            warm_up()
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            print(f"Warning: model warm-up failed - {e}")
+        else:
+            self._ready_at = time.perf_counter()
+            self.state = 'ready'
+            phases = ', '.join(f"{name} {ms:.0f}ms" for name, ms in self.status()['phases_ms'].items())
+            print(f"Model warm-up complete ({phases})")
+        finally:
+            self._done.set()
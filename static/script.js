@@ -7,6 +7,17 @@
         let stream = null;
         let userData = {};
         let currentSessionId = null;
+        // Capture size and JPEG quality suggested by the server for the current session
+        let captureHint = { max_side: 1280, jpeg_quality: 0.7 };
+        // Optional automatic capture (off until toggled): the interval backs off when the server
+        // answers 429 and creeps back towards the base rate while frames are accepted
+        const BASE_CAPTURE_INTERVAL_MS = 1000;
+        const MAX_CAPTURE_INTERVAL_MS = 10000;
+        let captureIntervalMs = BASE_CAPTURE_INTERVAL_MS;
+        let captureTimer = null;
+        let autoCapture = false;
+        let captureInFlight = false;
+        let captureResumeAt = 0;
         let isAuthenticated = false;
 
         // Loading Screen
@@ -210,14 +221,17 @@
                 
                 const data = await response.json();
                 currentSessionId = data.session_id;
+                if (data.capture) {
+                    captureHint = data.capture;
+                }
                 
                 closeTrackingModal();
                 
                 // Request camera access
                 stream = await navigator.mediaDevices.getUserMedia({ 
                     video: { 
-                        width: { ideal: 1280 },
-                        height: { ideal: 720 }
+                        width: { ideal: Math.min(1280, captureHint.max_side) },
+                        height: { ideal: Math.min(720, Math.round(captureHint.max_side * 9 / 16)) }
                     } 
                 });
                 
@@ -228,6 +242,10 @@
                 updateStatus(mode);
                 document.getElementById('detectionsPanel').style.display = 'block';
                 
+                captureIntervalMs = BASE_CAPTURE_INTERVAL_MS;
+                captureResumeAt = 0;
+                setAutoCapture(false);
+                
             } catch (error) {
                 console.error('Tracking start error:', error);
                 alert('Unable to start tracking. Please ensure camera permissions are granted.');
@@ -244,29 +262,92 @@
             statusElement.textContent = messages[mode] || 'Camera active...';
         }
 
+        function scheduleCapture(delayMs) {
+            clearTimeout(captureTimer);
+            captureTimer = setTimeout(async () => {
+                await captureFrame();
+                if (stream && autoCapture) {
+                    scheduleCapture(Math.max(captureIntervalMs, captureResumeAt - Date.now()));
+                }
+            }, delayMs);
+        }
+
+        function setAutoCapture(enabled) {
+            autoCapture = enabled;
+            document.getElementById('autoCaptureButton').textContent = `Auto Capture: ${enabled ? 'On' : 'Off'}`;
+            if (enabled) {
+                scheduleCapture(Math.max(0, captureResumeAt - Date.now()));
+            } else {
+                stopCapture();
+            }
+        }
+
+        function toggleAutoCapture() {
+            setAutoCapture(!autoCapture);
+        }
+
+        function stopCapture() {
+            clearTimeout(captureTimer);
+            captureTimer = null;
+        }
+
         async function captureFrame() {
+            // One frame in flight at a time, and none while the server asked us to wait
+            if (captureInFlight) {
+                return;
+            }
+            if (Date.now() < captureResumeAt) {
+                document.getElementById('statusMessage').textContent =
+                    `⏳ Server busy, try again in ${Math.ceil((captureResumeAt - Date.now()) / 1000)}s`;
+                return;
+            }
             const video = document.getElementById('videoElement');
+            if (!video.videoWidth) {
+                return;
+            }
+            captureInFlight = true;
             const canvas = document.createElement('canvas');
-            canvas.width = video.videoWidth;
-            canvas.height = video.videoHeight;
+            // Never send more pixels than the server will keep after its own resize
+            const scale = Math.min(1, captureHint.max_side / Math.max(video.videoWidth, video.videoHeight));
+            canvas.width = Math.round(video.videoWidth * scale);
+            canvas.height = Math.round(video.videoHeight * scale);
             const ctx = canvas.getContext('2d');
-            ctx.drawImage(video, 0, 0);
+            ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
             
-            const imageData = canvas.toDataURL('image/jpeg');
+            // Send the raw JPEG bytes instead of a base64 data URL inside JSON
+            const imageBlob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', captureHint.jpeg_quality));
             
             try {
                 const response = await fetch(`${API_URL}/tracking/process-frame`, {
                     method: 'POST',
                     headers: {
-                        'Content-Type': 'application/json'
+                        'Content-Type': 'image/jpeg'
                     },
                     credentials: 'include',
-                    body: JSON.stringify({ image: imageData })
+                    body: imageBlob
                 });
                 
                 const data = await response.json();
                 
+                if (response.status === 429) {
+                    // Overloaded: wait as long as asked, and capture less often from now on
+                    const retryMs = data.retry_after_ms || (parseFloat(response.headers.get('Retry-After')) || 1) * 1000;
+                    captureResumeAt = Date.now() + retryMs;
+                    captureIntervalMs = Math.min(MAX_CAPTURE_INTERVAL_MS, Math.max(captureIntervalMs * 2, retryMs));
+                    document.getElementById('statusMessage').textContent = autoCapture
+                        ? `⏳ Server busy, capturing every ${(captureIntervalMs / 1000).toFixed(1)}s`
+                        : '⏳ Server busy, please wait a moment';
+                    return;
+                }
+                
+                if (response.status === 409 && data.dropped) {
+                    // Replaced by a newer frame of ours: not overload, so the pace stays as it is
+                    document.getElementById('statusMessage').textContent = '↻ Frame skipped for a newer one';
+                    return;
+                }
+                
                 if (data.success) {
+                    captureIntervalMs = Math.max(BASE_CAPTURE_INTERVAL_MS, captureIntervalMs - 250);
                     displayDetections(data.detections);
                     displaySuggestions(data.suggestions);
                     document.getElementById('statusMessage').textContent = '✓ Frame analyzed successfully!';
@@ -276,6 +357,8 @@
             } catch (error) {
                 console.error('Frame processing error:', error);
                 document.getElementById('statusMessage').textContent = '⚠ Analysis failed. Please try again.';
+            } finally {
+                captureInFlight = false;
             }
         }
 
@@ -307,6 +390,7 @@
         }
 
         async function stopTracking() {
+            setAutoCapture(false);
             try {
                 await fetch(`${API_URL}/tracking/stop`, {
                     method: 'POST',
@@ -315,6 +399,7 @@
                 
                 if (stream) {
                     stream.getTracks().forEach(track => track.stop());
+                    stream = null;
                 }
                 
                 document.getElementById('cameraContainer').classList.remove('active');
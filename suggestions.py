@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+
+# (tracking mode or None for any mode, detected items or None for mode-level advice, category, text)
+SUGGESTION_RULES = [
+    ('cooking', None, 'waste_reduction', 'Consider saving vegetable peels for making stock or compost'),
+    ('cooking', None, 'waste_reduction', 'Batch cooking can save time and energy'),
+    ('eating', None, 'health', 'Great portion control! This helps minimize waste'),
+    ('eating', None, 'health', 'Try to finish what\'s on your plate to reduce food waste'),
+    ('summary', None, 'planning', 'Your tracking consistency is improving!'),
+    ('summary', None, 'planning', 'Consider meal planning to further reduce waste'),
+
+    (None, ('banana', 'apple', 'orange'), 'waste_reduction',
+     'Overripe fruit works well in smoothies, jams or baking'),
+    ('cooking', ('broccoli', 'carrot'), 'waste_reduction',
+     'Broccoli stems and carrot tops can go into soups, stocks or stir-fries'),
+    ('cooking', ('pizza', 'sandwich', 'hot dog'), 'planning',
+     'Cook only what will be eaten today and freeze the rest in portions'),
+    ('eating', ('pizza', 'cake', 'donut', 'hot dog', 'sandwich'), 'health',
+     'Serve calorie-dense foods on a smaller plate to avoid leftovers'),
+    ('eating', ('bowl', 'cup', 'wine glass', 'bottle'), 'waste_reduction',
+     'Pour smaller servings first; it is easier to refill than to throw away'),
+    ('summary', ('cake', 'donut'), 'planning',
+     'Desserts are often left over; plan smaller batches for the next meal')
+]
+
+
+def compile_rules(rules):
+    """Index the rule table by mode and by (mode, item) so a frame only looks at matching rules"""
+    by_mode = {}
+    by_item = {}
+    for mode, items, category, text in rules:
+        suggestion = {'text': text, 'category': category}
+        if items is None:
+            by_mode.setdefault(mode, []).append(suggestion)
+        else:
+            for item in items:
+                by_item.setdefault((mode, item), []).append(suggestion)
+    return by_mode, by_item
+
+
+class SuggestionEngine:
+    """Rule-table suggestions with per-session throttling and deduplication
+
+    Session metadata (user and tracking mode) is held in memory; load_session(session_id)
+    is only called for sessions that were not registered, e.g. after a restart, and returns
+    (user_id, mode, texts already suggested in the session) or None.
+    """
+
+    def __init__(self, load_session, rules=SUGGESTION_RULES, min_interval=60, max_per_frame=2,
+                 max_sessions=4096):
+        self.load_session = load_session
+        self.min_interval = float(min_interval)
+        self.max_per_frame = max(1, int(max_per_frame))
+        self.max_sessions = int(max_sessions)
+        self._by_mode, self._by_item = compile_rules(rules)
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._emitted = 0
+        self._duplicates = 0
+        self._throttled = 0
+
+    def register_session(self, session_id, user_id, mode):
+        with self._lock:
+            self._store(session_id, user_id, mode)
+
+    def forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def suggest(self, session_id, detections):
+        """Return (user_id, new suggestions) for a frame; suggestions already given in the session are skipped"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+        if state is None:
+            info = self.load_session(session_id)
+            if not info:
+                return None, []
+            with self._lock:
+                state = self._sessions.get(session_id) or self._store(session_id, *info)
+
+        now = time.monotonic()
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+            if now - state['last_emitted'] < self.min_interval:
+                self._throttled += 1
+                return state['user_id'], []
+
+            mode = state['mode']
+            candidates = list(self._by_mode.get(mode, ()))
+            for item in {d['item'] for d in detections}:
+                candidates.extend(self._by_item.get((mode, item), ()))
+                candidates.extend(self._by_item.get((None, item), ()))
+
+            new = []
+            for suggestion in candidates:
+                if suggestion['text'] in state['given']:
+                    self._duplicates += 1
+                    continue
+                state['given'].add(suggestion['text'])
+                new.append(dict(suggestion))
+                if len(new) >= self.max_per_frame:
+                    break
+
+            if new:
+                state['last_emitted'] = now
+                self._emitted += len(new)
+            return state['user_id'], new
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'min_interval_seconds': self.min_interval,
+                'emitted': self._emitted,
+                'duplicates_skipped': self._duplicates,
+                'throttled_frames': self._throttled
+            }
+
+    def _store(self, session_id, user_id, mode, given=()):
+        state = {'user_id': user_id, 'mode': mode, 'given': set(given), 'last_emitted': float('-inf')}
+        self._sessions[session_id] = state
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return state
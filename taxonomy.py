@@ -0,0 +1,120 @@
+"""Food taxonomy: which model classes are food, what they are called and how sure the model must be
+
+A taxonomy maps model classes (by class name or id) to a food item name, a category and a
+confidence threshold. It is resolved once against the loaded model's class names into a
+FoodClasses lookup by class id, whose ids are passed to the model call so non-food classes
+never even reach NMS.
+
+A custom taxonomy is a JSON file:
+
+    {
+        "default_threshold": 0.5,
+        "classes": {
+            "banana": {"item": "banana", "category": "fruit", "threshold": 0.45},
+            "53": {"item": "pizza", "category": "prepared"}
+        }
+    }
+"""
+import json
+from collections import namedtuple
+
+from inference import Detection
+
+FoodClass = namedtuple('FoodClass', ['item', 'category', 'threshold'])
+
+# Food and tableware classes of the COCO-trained YOLO models; tableware is kept because
+# leftovers are often only visible as a full bowl or cup, but needs a surer detection
+DEFAULT_TAXONOMY = {
+    'default_threshold': 0.5,
+    'classes': {
+        'banana': {'category': 'fruit', 'threshold': 0.45},
+        'apple': {'category': 'fruit', 'threshold': 0.45},
+        'orange': {'category': 'fruit', 'threshold': 0.45},
+        'broccoli': {'category': 'vegetable', 'threshold': 0.45},
+        'carrot': {'category': 'vegetable', 'threshold': 0.45},
+        'sandwich': {'category': 'prepared'},
+        'hot dog': {'category': 'prepared'},
+        'pizza': {'category': 'prepared'},
+        'donut': {'category': 'dessert'},
+        'cake': {'category': 'dessert'},
+        'bowl': {'category': 'tableware', 'threshold': 0.6},
+        'cup': {'category': 'tableware', 'threshold': 0.6},
+        'wine glass': {'category': 'tableware', 'threshold': 0.6},
+        'bottle': {'category': 'tableware', 'threshold': 0.6}
+    }
+}
+
+
+class FoodTaxonomy:
+    """Taxonomy as configured, before it is matched to a model's classes"""
+
+    def __init__(self, classes, default_threshold=0.5):
+        self.classes = dict(classes)
+        self.default_threshold = float(default_threshold)
+
+    @classmethod
+    def load(cls, path=None):
+        """The taxonomy in a JSON file, or DEFAULT_TAXONOMY without one"""
+        config = DEFAULT_TAXONOMY
+        if path:
+            with open(path) as f:
+                config = json.load(f)
+        if not config.get('classes'):
+            raise ValueError('Food taxonomy has no classes')
+        return cls(config['classes'], config.get('default_threshold', 0.5))
+
+    @property
+    def min_threshold(self):
+        """Lowest threshold of any class, the most the model's own confidence floor can be"""
+        return min(float((entry or {}).get('threshold', self.default_threshold)) for entry in self.classes.values())
+
+    def to_config(self):
+        return {'default_threshold': self.default_threshold, 'classes': self.classes}
+
+    def resolve(self, names):
+        """Match the configured classes to a model's {class id: name} and return FoodClasses"""
+        names = {int(k): v for k, v in dict(names).items()}
+        ids_by_name = {name: class_id for class_id, name in names.items()}
+        by_id = {}
+        for key, entry in self.classes.items():
+            key = str(key)
+            class_id = int(key) if key.isdigit() else ids_by_name.get(key)
+            if class_id is None or class_id not in names:
+                raise ValueError(f"Food taxonomy class '{key}' is not a class of the model")
+            entry = entry or {}
+            by_id[class_id] = FoodClass(
+                entry.get('item', names[class_id]),
+                entry.get('category', 'food'),
+                float(entry.get('threshold', self.default_threshold))
+            )
+        return FoodClasses(by_id)
+
+
+class FoodClasses:
+    """A taxonomy resolved to class ids: the model's class restriction and per-class thresholds"""
+
+    def __init__(self, by_id):
+        self.by_id = dict(by_id)
+        self.class_ids = sorted(self.by_id)
+        self.min_threshold = min(food.threshold for food in self.by_id.values())
+        self.thresholds = {class_id: food.threshold for class_id, food in self.by_id.items()}
+        self.categories = {food.item: food.category for food in self.by_id.values()}
+
+    def label(self, detections):
+        """Keep the detections of food classes, renamed to their item names"""
+        by_id = self.by_id
+        return [
+            Detection(d.class_id, by_id[d.class_id].item, d.confidence, d.box)
+            for d in detections if d.class_id in by_id
+        ]
+
+    def accepts(self, detection):
+        """Whether a detection is above its class's confidence threshold"""
+        food = self.by_id.get(detection.class_id)
+        return food is not None and detection.confidence > food.threshold
+
+    def to_dict(self):
+        return {
+            str(class_id): {'item': food.item, 'category': food.category, 'threshold': food.threshold}
+            for class_id, food in sorted(self.by_id.items())
+        }
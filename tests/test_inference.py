@@ -0,0 +1,26 @@
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from inference import BatchInferenceScheduler, FrameDropped
+
+
+def test_expired_frame_in_mixed_batch_keeps_dispatcher_alive():
+    # Frames are arrays: comparing queue items with == raises, which once killed the dispatcher
+    scheduler = BatchInferenceScheduler(lambda frames: [frame.shape for frame in frames],
+                                        max_batch=2, max_wait_ms=1000, max_age_ms=50)
+    try:
+        stale = scheduler.submit(np.zeros((4, 4, 3), np.uint8), key='camera')
+        time.sleep(0.1)
+        fresh = scheduler.submit(np.ones((2, 2, 3), np.uint8))
+
+        with pytest.raises(FrameDropped) as dropped:
+            stale.result(timeout=5)
+        assert dropped.value.reason == 'expired'
+        assert fresh.result(timeout=5) == (2, 2, 3)
+        assert all(worker.is_alive() for worker in scheduler._workers)
+        assert scheduler.stats()['frames_expired'] == 1
+    finally:
+        scheduler.shutdown()
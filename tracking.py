@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes"""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """One physical item followed across frames"""
+
+    __slots__ = ('track_id', 'name', 'box', 'first_seen', 'last_seen', 'peak_confidence', 'frames', 'seen_last_update',
+                 'image_path')
+
+    def __init__(self, track_id, detection, now, image_path=None):
+        self.track_id = track_id
+        self.name = detection.name
+        self.box = detection.box
+        self.first_seen = now
+        self.last_seen = now
+        self.peak_confidence = detection.confidence
+        self.frames = 1
+        self.seen_last_update = True
+        # Stored frame in which the item was seen with its peak confidence
+        self.image_path = image_path
+
+    def update(self, detection, now, image_path=None):
+        self.box = detection.box
+        self.last_seen = now
+        if detection.confidence > self.peak_confidence or self.image_path is None:
+            self.image_path = image_path or self.image_path
+        self.peak_confidence = max(self.peak_confidence, detection.confidence)
+        self.frames += 1
+        self.seen_last_update = True
+
+
+class MultiObjectTracker:
+    """Per-session IoU tracker with ByteTrack-style two-stage association
+
+    Detections above high_conf are matched to existing tracks of the same class first
+    (greedy, highest IoU first) and start new tracks when unmatched. Detections between
+    low_conf and high_conf can only keep an existing track alive, which bridges frames
+    where an item is briefly partly hidden. A track that goes unseen for max_age_s is
+    closed; on_close(session_id, user_id, track) is called for tracks seen in at least
+    min_frames frames, so one-frame flickers are never stored. class_thresholds maps class
+    ids to their own high_conf (e.g. FoodClasses.thresholds).
+    """
+
+    def __init__(self, on_close, iou_threshold=0.3, high_conf=0.5, low_conf=0.25, max_age_s=2.0,
+                 min_frames=3, max_sessions=4096, sweep_interval_s=1.0, class_thresholds=None):
+        self.on_close = on_close
+        self.iou_threshold = float(iou_threshold)
+        self.high_conf = float(high_conf)
+        self.class_thresholds = dict(class_thresholds or {})
+        self.low_conf = float(low_conf)
+        self.max_age = float(max_age_s)
+        self.min_frames = max(1, int(min_frames))
+        self.max_sessions = int(max_sessions)
+        self.sweep_interval = float(sweep_interval_s)
+
+        # session_id -> {'user_id', 'tracks': [Track], 'next_id'}
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._tracks_started = 0
+        self._tracks_stored = 0
+        self._tracks_discarded = 0
+        self._detections_matched = 0
+
+    def update(self, session_id, user_id, detections, now=None, image_path=None):
+        """Associate a frame's detections with the session's tracks
+
+        Returns one track id per detection, in order (None for detections that were not
+        assigned to a track). image_path is the frame's path in the frame store, if stored.
+        """
+        now = time.time() if now is None else now
+        closed = []
+        with self._lock:
+            state = self._session(session_id, user_id, closed)
+            self._expire(session_id, state, now, closed)
+            track_ids = self._associate(state, detections, now, image_path)
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now, closed)
+        self._emit(closed)
+        return track_ids
+
+    def refresh(self, session_id, now=None):
+        """Count a frame for the tracks seen in the last update, e.g. when the frame was skipped as unchanged"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return
+            for track in state['tracks']:
+                if track.seen_last_update:
+                    track.last_seen = now
+                    track.frames += 1
+
+    def close_session(self, session_id):
+        """Close every track of a session, e.g. when tracking stops"""
+        closed = []
+        with self._lock:
+            state = self._sessions.pop(session_id, None)
+            if state is not None:
+                closed.extend((session_id, state['user_id'], track) for track in state['tracks'])
+        self._emit(closed)
+
+    def close_all(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, OrderedDict()
+        self._emit([
+            (session_id, state['user_id'], track)
+            for session_id, state in sessions.items() for track in state['tracks']
+        ])
+
+    def active_tracks(self, session_id):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            return len(state['tracks']) if state else 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'active_tracks': sum(len(state['tracks']) for state in self._sessions.values()),
+                'tracks_started': self._tracks_started,
+                'tracks_stored': self._tracks_stored,
+                'tracks_discarded': self._tracks_discarded,
+                'detections_matched': self._detections_matched,
+                'max_age_seconds': self.max_age,
+                'min_frames': self.min_frames
+            }
+
+    def _session(self, session_id, user_id, closed):
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = {'user_id': user_id, 'tracks': [], 'next_id': 1}
+            while len(self._sessions) > self.max_sessions:
+                old_id, old = self._sessions.popitem(last=False)
+                closed.extend((old_id, old['user_id'], track) for track in old['tracks'])
+        self._sessions.move_to_end(session_id)
+        return state
+
+    def _expire(self, session_id, state, now, closed):
+        alive = []
+        for track in state['tracks']:
+            if now - track.last_seen > self.max_age:
+                closed.append((session_id, state['user_id'], track))
+            else:
+                alive.append(track)
+        state['tracks'] = alive
+
+    def _sweep(self, now, closed):
+        """Expire tracks of sessions that stopped sending frames without stopping tracking"""
+        self._last_sweep = now
+        # Sessions themselves stay (bounded by max_sessions) so their track ids keep counting up
+        for session_id, state in self._sessions.items():
+            self._expire(session_id, state, now, closed)
+
+    def _associate(self, state, detections, now, image_path=None):
+        tracks = state['tracks']
+        for track in tracks:
+            track.seen_last_update = False
+        track_ids = [None] * len(detections)
+
+        thresholds = [self.class_thresholds.get(d.class_id, self.high_conf) for d in detections]
+        high = [i for i, d in enumerate(detections) if d.confidence > thresholds[i]]
+        low = [i for i, d in enumerate(detections) if self.low_conf < d.confidence <= thresholds[i]]
+
+        unmatched_tracks = list(range(len(tracks)))
+        for stage in (high, low):
+            pairs = []
+            for i in stage:
+                for t in unmatched_tracks:
+                    if tracks[t].name != detections[i].name:
+                        continue
+                    overlap = box_iou(tracks[t].box, detections[i].box)
+                    if overlap >= self.iou_threshold:
+                        pairs.append((overlap, i, t))
+            pairs.sort(reverse=True)
+            used_tracks = set()
+            for _, i, t in pairs:
+                if track_ids[i] is not None or t in used_tracks:
+                    continue
+                tracks[t].update(detections[i], now, image_path)
+                track_ids[i] = tracks[t].track_id
+                used_tracks.add(t)
+                self._detections_matched += 1
+            unmatched_tracks = [t for t in unmatched_tracks if t not in used_tracks]
+
+        # Confident detections that matched nothing are new items
+        for i in high:
+            if track_ids[i] is None:
+                track = Track(state['next_id'], detections[i], now, image_path)
+                state['next_id'] += 1
+                tracks.append(track)
+                track_ids[i] = track.track_id
+                self._tracks_started += 1
+        return track_ids
+
+    def _emit(self, closed):
+        for session_id, user_id, track in closed:
+            if track.frames < self.min_frames:
+                with self._lock:
+                    self._tracks_discarded += 1
+                continue
+            with self._lock:
+                self._tracks_stored += 1
+            try:
+                self.on_close(session_id, user_id, track)
+            except Exception as e:
+                print(f"Track close callback error: {e}")
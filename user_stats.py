@@ -0,0 +1,56 @@
+"""Reconciliation of the incrementally maintained user_statistics table
+
+The totals are kept current by the triggers from migration 3. reconcile_user_statistics()
+rebuilds them from the raw tables and reports any rows that had drifted.
+"""
+from migrations import RECOMPUTE_USER_STATISTICS
+
+# Stored totals next to the totals recomputed from tracking_sessions and waste_tracking
+EXPECTED_STATISTICS = '''
+    SELECT us.user_id, us.total_sessions, us.total_waste_kg,
+        (
+            SELECT COUNT(*) FROM tracking_sessions ts
+            WHERE ts.user_id = us.user_id AND ts.status = 'completed'
+        ) AS expected_sessions,
+        (
+            SELECT COALESCE(SUM(wt.quantity), 0)
+            FROM waste_tracking wt
+            JOIN tracking_sessions ts ON wt.session_id = ts.id
+            WHERE ts.user_id = us.user_id
+        ) AS expected_waste
+    FROM user_statistics us
+'''
+
+
+def reconcile_user_statistics(conn, fix=True, tolerance=1e-6):
+    """Compare stored statistics with a full recomputation; rebuild them if fix is set
+
+    Returns a list of drift entries, one per user whose stored totals were wrong or missing.
+    """
+    drift = []
+
+    # Users that never got a statistics row
+    missing = conn.execute('''
+        SELECT u.id FROM users u
+        WHERE NOT EXISTS (SELECT 1 FROM user_statistics us WHERE us.user_id = u.id)
+    ''').fetchall()
+    for row in missing:
+        drift.append({'user_id': row[0], 'missing': True})
+
+    for row in conn.execute(EXPECTED_STATISTICS).fetchall():
+        user_id, sessions, waste, expected_sessions, expected_waste = tuple(row)
+        if sessions != expected_sessions or abs((waste or 0) - expected_waste) > tolerance:
+            drift.append({
+                'user_id': user_id,
+                'total_sessions': sessions,
+                'expected_sessions': expected_sessions,
+                'total_waste_kg': waste,
+                'expected_waste_kg': expected_waste
+            })
+
+    if fix and drift:
+        conn.executemany('INSERT INTO user_statistics (user_id) VALUES (?)', [(row[0],) for row in missing])
+        conn.execute(RECOMPUTE_USER_STATISTICS)
+        conn.commit()
+
+    return drift
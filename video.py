@@ -0,0 +1,231 @@
+"""Streaming video ingestion: sample frames from a clip and run them through the detector
+
+Frames are read one at a time with cv2.VideoCapture and only the sampled ones are decoded
+into images, so memory use is bounded by the inference batch size whatever the length of
+the clip. Results come back as a stream of events (one per sampled frame, then a summary).
+
+CLI: python video.py clip.mp4 [--sample-fps 2] [--scene-threshold 4] [--batch 8] [--backend onnx]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+
+
+class VideoSampler:
+    """Iterate over (frame_index, time_s, frame) for the frames sampled from a video
+
+    sample_fps picks frames at a fixed rate (every frame if None). With scene_threshold,
+    a sampled frame is only kept when its downscaled grayscale thumbnail differs from the
+    last kept one by more than the threshold (mean absolute difference, 0-255), and at
+    least every max_gap_s seconds.
+    """
+
+    def __init__(self, path, sample_fps=2.0, scene_threshold=None, max_gap_s=10.0, max_frames=None,
+                 signature_size=32):
+        self.path = path
+        self.sample_fps = float(sample_fps) if sample_fps else None
+        self.scene_threshold = float(scene_threshold) if scene_threshold else None
+        self.max_gap_s = float(max_gap_s)
+        self.max_frames = int(max_frames) if max_frames else None
+        self.signature_size = int(signature_size)
+
+        self.frames_read = 0
+        self.frames_sampled = 0
+        self.frames_skipped_unchanged = 0
+        self.fps = None
+        self.frame_count = None
+
+    def __iter__(self):
+        capture = cv2.VideoCapture(self.path)
+        if not capture.isOpened():
+            raise ValueError(f'Cannot open video: {self.path}')
+        try:
+            self.fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+            self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+            step = max(1, round(self.fps / self.sample_fps)) if self.sample_fps else 1
+
+            last_signature = None
+            last_kept_s = None
+            index = -1
+            while True:
+                # grab() advances without converting the frame; only sampled frames are retrieved
+                if not capture.grab():
+                    break
+                index += 1
+                self.frames_read += 1
+                if index % step:
+                    continue
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                time_s = index / self.fps
+
+                if self.scene_threshold is not None:
+                    signature = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+                                           (self.signature_size, self.signature_size),
+                                           interpolation=cv2.INTER_AREA)
+                    unchanged = (
+                        last_signature is not None
+                        and cv2.absdiff(signature, last_signature).mean() <= self.scene_threshold
+                        and time_s - last_kept_s < self.max_gap_s
+                    )
+                    if unchanged:
+                        self.frames_skipped_unchanged += 1
+                        continue
+                    last_signature = signature
+                last_kept_s = time_s
+
+                self.frames_sampled += 1
+                yield index, time_s, frame
+                if self.max_frames and self.frames_sampled >= self.max_frames:
+                    break
+        finally:
+            capture.release()
+
+
+def process_video(sampler, infer_batch, batch_size=8, conf=0.5, on_frame=None, accept=None):
+    """Run sampled frames through infer_batch in batches and yield result events
+
+    infer_batch(frames) returns one list of inference.Detection per frame. Each sampled
+    frame produces a 'frame' event with its detections above conf (or those accept(detection)
+    returns true for, e.g. FoodClasses.accepts for per-class thresholds); a final 'summary'
+    event carries counts per item. on_frame(frame_index, time_s, detections) is called
+    with every frame's detections, e.g. to track and store them, and may return one
+    track id per detection to include in the event.
+    """
+    started = time.perf_counter()
+    batch_size = max(1, int(batch_size))
+    if accept is None:
+        def accept(detection):
+            return detection.confidence > conf
+    totals = {}
+    batch = []
+
+    def flush():
+        results = infer_batch([frame for _, _, frame in batch])
+        for (index, time_s, _), detections in zip(batch, results):
+            track_ids = on_frame(index, time_s, detections) if on_frame is not None else None
+            kept = []
+            for i, d in enumerate(detections):
+                if not accept(d):
+                    continue
+                totals[d.name] = totals.get(d.name, 0) + 1
+                item = {'item': d.name, 'confidence': d.confidence, 'box': [round(v, 1) for v in d.box]}
+                if track_ids is not None:
+                    item['track_id'] = track_ids[i]
+                kept.append(item)
+            yield {
+                'type': 'frame',
+                'frame_index': index,
+                'time_s': round(time_s, 3),
+                'detections': kept
+            }
+        batch.clear()
+
+    for sample in sampler:
+        batch.append(sample)
+        if len(batch) >= batch_size:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+    yield {
+        'type': 'summary',
+        'frames_read': sampler.frames_read,
+        'frames_sampled': sampler.frames_sampled,
+        'frames_skipped_unchanged': sampler.frames_skipped_unchanged,
+        'video_fps': sampler.fps,
+        'detections': totals,
+        'processing_seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def video_tracker(on_close, conf=0.5, max_age_s=2.0, min_frames=3, class_thresholds=None):
+    """on_frame callback for process_video that tracks items across the clip on video time
+
+    Each clip gets its own tracker, so the counts and track ids never mix with live
+    camera frames; on_close(None, None, track) receives every tracked item. Call the
+    returned callback's close() once the clip is done to flush the open tracks.
+    """
+    from tracking import MultiObjectTracker
+
+    tracker = MultiObjectTracker(on_close, high_conf=conf, max_age_s=max_age_s, min_frames=min_frames,
+                                 class_thresholds=class_thresholds)
+    started = time.time()
+
+    def on_frame(frame_index, time_s, detections):
+        return tracker.update(None, None, detections, now=started + time_s)
+    on_frame.close = lambda: tracker.close_session(None)
+    on_frame.started = started
+    return on_frame
+
+
+def format_ndjson(event):
+    return json.dumps(event, separators=(',', ':')) + '\n'
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a local video through the detector and print NDJSON results')
+    parser.add_argument('video')
+    parser.add_argument('--model', default=os.environ.get('AIBSFMS_MODEL_PATH', 'yolov8n.pt'))
+    parser.add_argument('--backend', default=os.environ.get('AIBSFMS_INFERENCE_BACKEND', 'torch'))
+    parser.add_argument('--sample-fps', type=float, default=2.0, help='frames per second to sample (0: every frame)')
+    parser.add_argument('--scene-threshold', type=float, default=None,
+                        help='only keep frames that differ from the last kept one by more than this')
+    parser.add_argument('--max-gap', type=float, default=10.0, help='keep a frame at least every N seconds')
+    parser.add_argument('--max-frames', type=int, default=None)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--conf', type=float, default=0.5, help='threshold for classes outside the food taxonomy')
+    parser.add_argument('--taxonomy', default=os.environ.get('AIBSFMS_FOOD_TAXONOMY'),
+                        help='food taxonomy JSON file (default: the built-in COCO food classes)')
+    parser.add_argument('--all-classes', action='store_true', help='report every model class, not only food')
+    args = parser.parse_args(argv)
+
+    from inference_backends import load_backend
+    from taxonomy import FoodTaxonomy
+    taxonomy = None if args.all_classes else FoodTaxonomy.load(args.taxonomy)
+    predict, names = load_backend(args.backend, args.model, taxonomy=taxonomy)
+    food_classes = taxonomy.resolve(names) if taxonomy is not None else None
+    if food_classes is not None:
+        model_predict = predict
+
+        def predict(frames):
+            return [food_classes.label(detections) for detections in model_predict(frames)]
+    sampler = VideoSampler(args.video, sample_fps=args.sample_fps, scene_threshold=args.scene_threshold,
+                           max_gap_s=args.max_gap, max_frames=args.max_frames)
+
+    def print_track(session_id, user_id, track):
+        emit({
+            'type': 'track',
+            'track_id': track.track_id,
+            'item': track.name,
+            'first_seen_s': round(track.first_seen - started, 3),
+            'last_seen_s': round(track.last_seen - started, 3),
+            'frames': track.frames,
+            'peak_confidence': track.peak_confidence
+        })
+
+    def emit(event):
+        sys.stdout.write(format_ndjson(event))
+        sys.stdout.flush()
+
+    on_frame = video_tracker(print_track, args.conf,
+                             class_thresholds=food_classes.thresholds if food_classes is not None else None)
+    started = on_frame.started
+    for event in process_video(sampler, predict, batch_size=args.batch, conf=args.conf, on_frame=on_frame,
+                               accept=food_classes.accepts if food_classes is not None else None):
+        emit(event)
+    on_frame.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
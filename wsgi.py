@@ -0,0 +1,2 @@
+"""WSGI entry point for production servers: gunicorn -c gunicorn.conf.py wsgi:app"""
+from backend import app